@@ -0,0 +1,802 @@
+"""Analyse-Kern für sniffer.py: vektorisierte Notenerkennung ohne GUI-Abhängigkeiten."""
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import notes_io
+from metrics import optional_stage
+from pitch_backends import BACKENDS, DEFAULT_BACKEND, dominant_track, get_backend, midi_to_hz
+
+# librosa und soundfile werden erst bei der ersten Analyse importiert (siehe warm_up),
+# damit sniffer.py sein Fenster ohne die schweren Audio-Bibliotheken öffnen kann
+
+# Unterstützte Audio-Formate
+AUDIO_EXTENSIONS = ['.wav', '.mp3', '.ogg', '.flac']
+
+# Standardwerte der Notenerkennung (siehe AudioAnalyzerApp)
+MIN_NOTE_LENGTH = 0.25  # Minimale Notendauer in Sekunden
+MIN_MAGNITUDE = 1.0  # Minimale Lautstärke für eine gültige Note
+MIN_PITCH = 36  # Minimale Tonhöhe (C2)
+MAX_PITCH = 96  # Maximale Tonhöhe (C7)
+WINDOW_SIZE = 3  # Fenster von Frames für stabilere Notenerkennung
+PITCH_TOLERANCE = 0.5  # Max. Abweichung in Halbtönen, bevor eine neue Note beginnt
+SEARCH_BLOCK = 64  # Startgröße der blockweisen Suche nach Tonwechseln
+
+# Raster für sweep_thresholds (Notenlängen in Sekunden, Lautstärke-Schwellen in Zweierpotenzen)
+SWEEP_NOTE_LENGTHS = (0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5)
+SWEEP_MAGNITUDES = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+# STFT-Parameter (Standardwerte von librosa.piptrack)
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Blockgröße des speicherschonenden Modus in Frames (~30 s bei 44,1 kHz)
+BLOCK_FRAMES = 2584
+
+# Aufteilung einer Datei auf Prozesse (track_pitch_parallel): die ersten PROBE_FRAMES (~6 s) werden
+# im eigenen Prozess berechnet und geben die Rechenzeit des Verfahrens für diese Datei vor. Geteilt
+# wird nur, wenn die geschätzte Zeit trotz PARALLEL_OVERHEAD (Start der Worker, Dekodieren an den
+# Grenzen) sinkt, und höchstens so oft, dass jedes Segment MIN_SEGMENT_SECONDS Rechenzeit bekommt
+PROBE_FRAMES = 512
+PARALLEL_OVERHEAD = 1.0
+MIN_SEGMENT_SECONDS = 0.5
+
+# Analyse-Abtastrate: das Signal wird vor der Tonhöhenerkennung um einen ganzzahligen Faktor
+# (Zweierpotenz, Teiler von HOP_LENGTH) reduziert, solange die Bandbreite bis zur zweiten
+# Harmonischen von max_pitch im Durchlassbereich des Tiefpasses bleibt (C7: bis ca. 4,2 kHz)
+ANALYSIS_HARMONICS = 2
+DECIMATION_PASSBAND = 0.8  # nutzbarer Anteil der Nyquist-Frequenz nach dem Tiefpass
+MAX_DECIMATION = 8
+DECIMATION_TAPS_PER_FACTOR = 20  # Filterlänge wie bei scipy.signal.resample_poly
+
+
+def hz_to_midi(freqs):
+    """Rechnet Frequenzen in MIDI-Notennummern um (wie librosa.hz_to_midi auf Einzelwerten)"""
+    # log2 in der Eingabegenauigkeit, der Rest in float64 - so wie es librosa für
+    # Skalare rechnet, damit die Ergebnisse unabhängig von der NumPy-Version gleich bleiben
+    return 12 * (np.log2(freqs).astype(np.float64) - np.log2(440.0)) + 69
+
+
+def warm_up():
+    """Importiert die Audio-Bibliotheken und initialisiert die Tonhöhenerkennung vorab
+
+    librosa lädt seine Untermodule erst beim ersten Zugriff, scipy.fft legt beim ersten Aufruf
+    seine FFT-Pläne an. Ein Durchlauf auf einem kurzen stillen Signal verlagert diese Kosten
+    aus der ersten echten Analyse heraus.
+    """
+    import librosa
+    import soundfile
+    from scipy import signal  # noqa: F401 (Tiefpass der Analyse-Abtastrate)
+
+    soundfile.check_format('WAV')
+    librosa.get_fftlib()
+    default_backend().track(np.zeros(N_FFT * 2, dtype=np.float32), 22050, N_FFT, HOP_LENGTH)
+
+
+def frame_times(n_frames, sr, hop_length=HOP_LENGTH):
+    """Zeitstempel der Analyse-Frames (entspricht librosa.times_like auf der Pitch-Matrix)"""
+    return np.arange(n_frames) * hop_length / sr
+
+
+def decimation_factor(sr, max_pitch=MAX_PITCH):
+    """Größter Faktor, um den das Signal für die Analyse bis max_pitch reduziert werden kann"""
+    min_rate = 2 * ANALYSIS_HARMONICS * midi_to_hz(max_pitch) / DECIMATION_PASSBAND
+    factor = 1
+    while factor < MAX_DECIMATION and HOP_LENGTH % (factor * 2) == 0 and sr / (factor * 2) >= min_rate:
+        factor *= 2
+    return factor
+
+
+class _MonoReader:
+    """Liest eine Audio-Datei blockweise als Mono-Signal"""
+
+    def __init__(self, path):
+        self._file = None
+        self._samples = None
+        self._position = 0
+        import soundfile as sf
+
+        try:
+            self._file = sf.SoundFile(path)
+            self.sr = self._file.samplerate
+            self.n_samples = self._file.frames
+        except RuntimeError:
+            # Formate, die soundfile nicht lesen kann, vollständig über librosa dekodieren
+            import librosa
+
+            self._samples, self.sr = librosa.load(path, sr=None)
+            self.n_samples = len(self._samples)
+
+    @classmethod
+    def from_samples(cls, samples, sr):
+        """Reader über ein bereits dekodiertes Mono-Signal"""
+        reader = cls.__new__(cls)
+        reader._file = None
+        reader._samples = samples
+        reader._position = 0
+        reader.sr = sr
+        reader.n_samples = len(samples)
+        return reader
+
+    def seek(self, sample):
+        if self._file is not None:
+            self._file.seek(sample)
+        self._position = sample
+
+    def read(self, n):
+        if self._file is None:
+            start = self._position
+            self._position = min(start + n, self.n_samples)
+            return self._samples[start:self._position]
+
+        data = self._file.read(n, dtype='float32', always_2d=True)
+        # Downmix wie librosa.load (Mittelwert über die Kanäle)
+        return data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class _Decimator:
+    """Reduziert ein Mono-Signal blockweise um einen ganzzahligen Faktor (Tiefpass und Unterabtastung)
+
+    Jedes Ausgabe-Sample ist ein FIR-Filter über die umliegenden Eingabe-Samples (zentriert wie
+    scipy.signal.resample_poly, außerhalb der Datei Nullen). Es hängt damit nicht von den
+    Blockgrenzen ab: Ausschnitte ab einer beliebigen Position (seek) liefern exakt dieselben
+    Werte wie das Lesen der ganzen Datei.
+    """
+
+    def __init__(self, source, factor):
+        from scipy import signal
+
+        self._source = source
+        self.factor = factor
+        self.sr = source.sr // factor if source.sr % factor == 0 else source.sr / factor
+        # Der Rest von weniger als factor Samples am Dateiende entfällt, die Frame-Anzahl
+        # bleibt dadurch dieselbe wie bei der Originalrate
+        self.n_samples = source.n_samples // factor
+        # Wie bei resample_poly folgen noch Ausgaben, in die die letzten Samples einfließen
+        self._available = -(-source.n_samples // factor)
+        self._filter = signal.firwin(DECIMATION_TAPS_PER_FACTOR * factor + 1, 1 / factor,
+                                     window=('kaiser', 5.0)).astype(np.float32)
+        self._half = DECIMATION_TAPS_PER_FACTOR * factor // 2
+        self.seek(0)
+
+    def seek(self, sample):
+        # Eingabepuffer beginnt beim ersten Sample, das in das Filter für die Ausgabe sample eingeht
+        start = sample * self.factor - self._half
+        self._source.seek(max(0, start))
+        self._input = np.zeros(max(0, -start), dtype=np.float32)
+        self._eof = False
+        self._position = sample
+
+    def read(self, n):
+        from scipy import signal
+
+        n = max(0, min(n, self._available - self._position))
+        self._position += n
+        needed = n * self.factor + 2 * self._half
+        while len(self._input) < needed and not self._eof:
+            data = self._source.read(needed - len(self._input))
+            self._eof = len(data) < needed - len(self._input)
+            self._input = np.concatenate((self._input, data))
+        if len(self._input) < needed:
+            # Hinter dem Dateiende wie resample_poly mit Nullen filtern
+            self._input = np.concatenate((self._input, np.zeros(needed - len(self._input), dtype=np.float32)))
+
+        # Nur Ausgaben, bei denen das Filter vollständig im Puffer liegt
+        skip = 2 * self._half // self.factor
+        output = signal.upfirdn(self._filter, self._input[:needed], down=self.factor)[skip:skip + n]
+        self._input = self._input[n * self.factor:]
+        return output.astype(np.float32, copy=False)
+
+    def close(self):
+        self._source.close()
+
+
+class _ReadAhead:
+    """Dekodiert im Hintergrund bereits den nächsten Block, während der aktuelle analysiert wird"""
+
+    def __init__(self, read, chunk_size, depth=2):
+        self._queue = queue.Queue(maxsize=depth)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(read, chunk_size), daemon=True)
+        self._thread.start()
+
+    def _run(self, read, chunk_size):
+        try:
+            while not self._stop.is_set():
+                data = read(chunk_size)
+                self._put(data)
+                if len(data) < chunk_size:
+                    # Leerer Block markiert das Dateiende
+                    self._put(np.zeros(0, dtype=np.float32))
+                    break
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, n):
+        parts = [self._pending]
+        available = len(self._pending)
+        while available < n and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if len(item) == 0:
+                self._eof = True
+            parts.append(item)
+            available += len(item)
+        data = np.concatenate(parts)
+        self._pending = data[n:]
+        return data[:n]
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def track_shape(n_frames, backend):
+    """Form der Tonhöhenspur: ein Wert pro Frame, mehrstimmig eine Spalte pro Stimme"""
+    return n_frames if backend.voices == 1 else (n_frames, backend.voices)
+
+
+def count_frames(n_samples, hop_length=HOP_LENGTH):
+    """Anzahl der Frames, die piptrack mit center=True für n_samples liefert"""
+    return 1 + n_samples // hop_length
+
+
+def default_backend():
+    """Das Standardverfahren mit dem Tonhöhenbereich der Notenerkennung"""
+    return get_backend(DEFAULT_BACKEND, MIN_PITCH, MAX_PITCH)
+
+
+def track_pitch_chunked(path, block_frames=BLOCK_FRAMES, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                        progress=None, read_ahead=True, start_frame=0, end_frame=None, metrics=None,
+                        backend=None, resample=True):
+    """Blockweise Tonhöhenverfolgung; der Speicherbedarf hängt nur von der Blockgröße ab
+
+    Mit start_frame/end_frame wird nur ein Ausschnitt der Frames berechnet, die Werte sind
+    identisch mit den entsprechenden Frames einer Analyse der gesamten Datei. Mit metrics
+    (metrics.PipelineMetrics) werden Dekodieren und piptrack getrennt gemessen; beim
+    Read-Ahead zählt als Dekodieren nur die Zeit, die auf den nächsten Block gewartet wird.
+    backend ist ein Verfahren aus pitch_backends (Standard: piptrack).
+
+    Mit resample wird das Signal beim Lesen auf die Analyse-Abtastrate reduziert (siehe
+    decimation_factor), sofern das Verfahren das erlaubt (backend.decimate, bisher nur piptrack);
+    n_fft und hop_length werden im gleichen Verhältnis verkleinert, Zeit- und Frequenzauflösung
+    bleiben also gleich. Frames, Abtastrate und Lautstärkeskala der Spur
+    entsprechen in jedem Fall der Originalrate.
+    """
+    with optional_stage(metrics, "decode"):
+        source = _MonoReader(path)
+    return _track_source(source, block_frames, n_fft, hop_length, progress, read_ahead,
+                         start_frame, end_frame, metrics, backend, resample)
+
+
+def audio_duration(path):
+    """Dauer einer Audio-Datei in Sekunden aus dem Dateikopf (None, wenn sie sich so nicht bestimmen lässt)"""
+    import soundfile as sf
+
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        return None
+
+
+def decode(path):
+    """Dekodiert eine Audio-Datei vollständig als Mono-Signal (float32); liefert (y, sr)"""
+    source = _MonoReader(path)
+    try:
+        return source.read(source.n_samples), source.sr
+    finally:
+        source.close()
+
+
+def track_pitch_decoded(y, sr, block_frames=BLOCK_FRAMES, n_fft=N_FFT, hop_length=HOP_LENGTH, progress=None,
+                        backend=None, resample=True):
+    """Blockweise Tonhöhenverfolgung eines bereits dekodierten Signals (gleiche Frames wie track_pitch_chunked)"""
+    return _track_source(_MonoReader.from_samples(y, sr), block_frames, n_fft, hop_length, progress,
+                         read_ahead=False, backend=backend, resample=resample)
+
+
+def _track_source(source, block_frames=BLOCK_FRAMES, n_fft=N_FFT, hop_length=HOP_LENGTH, progress=None,
+                  read_ahead=True, start_frame=0, end_frame=None, metrics=None, backend=None, resample=True):
+    backend = backend or default_backend()
+    sr = source.sr
+    factor = decimation_factor(sr, backend.max_pitch) if resample and backend.decimate else 1
+    if factor > 1:
+        # Gleiche Frames in Sekunden bei 1/factor der Samples pro Frame
+        source = _Decimator(source, factor)
+        n_fft //= factor
+        hop_length //= factor
+    read = source.read
+    reader = None
+    try:
+        # Frames wie bei piptrack mit center=True: das Signal wird links und rechts
+        # um n_fft // 2 Nullen ergänzt, Frame k beginnt bei k * hop_length
+        pad = n_fft // 2
+        n_frames = count_frames(source.n_samples, hop_length)
+        end_frame = n_frames if end_frame is None else min(end_frame, n_frames)
+        freqs = np.zeros(track_shape(end_frame - start_frame, backend), dtype=np.float32)
+        mags = np.zeros(track_shape(end_frame - start_frame, backend), dtype=np.float32)
+
+        # Position von buffer[0] im gepolsterten Signal; vor dem Dateianfang liegen Nullen
+        buffer_start = start_frame * hop_length
+        buffer = np.zeros(max(0, pad - buffer_start), dtype=np.float32)
+        source.seek(max(0, buffer_start - pad))
+
+        if read_ahead:
+            reader = _ReadAhead(read, block_frames * hop_length)
+            read = reader.read
+
+        frame = start_frame
+        while frame < end_frame:
+            block_end = min(frame + block_frames, end_frame)
+            needed = (block_end - 1) * hop_length + n_fft - buffer_start
+
+            # Nachlesen, bis der Block vollständig ist; hinter dem Dateiende wird mit Nullen aufgefüllt
+            if needed > len(buffer):
+                with optional_stage(metrics, "decode"):
+                    data = read(needed - len(buffer))
+                missing = needed - len(buffer) - len(data)
+                buffer = np.concatenate((buffer, data, np.zeros(missing, dtype=np.float32)))
+
+            # Überlappende Frames des Blocks ohne erneutes Padding analysieren
+            offset = frame * hop_length - buffer_start
+            with optional_stage(metrics, "pitch"):
+                block = slice(frame - start_frame, block_end - start_frame)
+                freqs[block], mags[block] = backend.track(buffer[offset:needed], source.sr, n_fft, hop_length)
+
+            # Bereits vollständig verarbeitete Samples verwerfen
+            consumed = block_end * hop_length - buffer_start
+            buffer = buffer[consumed:]
+            buffer_start += consumed
+            frame = block_end
+
+            if progress is not None:
+                progress((frame - start_frame) / (end_frame - start_frame))
+    finally:
+        if reader is not None:
+            reader.close()
+        source.close()
+
+    # Die Lautstärke wächst mit der Fensterlänge; auf die Skala von n_fft bei Originalrate bringen
+    mags *= factor
+    return freqs, mags, sr
+
+
+def track_pitch(path, n_fft=N_FFT, hop_length=HOP_LENGTH, metrics=None, backend=None, resample=True):
+    """Tonhöhenverfolgung der kompletten Datei am Stück (hoher Speicherbedarf bei langen Dateien)"""
+    with optional_stage(metrics, "decode"):
+        y, sr = decode(path)
+    with optional_stage(metrics, "pitch"):
+        # Ein einziger Block über alle Frames
+        return _track_source(_MonoReader.from_samples(y, sr), count_frames(len(y), hop_length), n_fft, hop_length,
+                             read_ahead=False, backend=backend, resample=resample)
+
+
+def _track_segment(path, start_frame, end_frame, backend, resample):
+    """Worker-Funktion für track_pitch_parallel"""
+    freqs, mags, _ = track_pitch_chunked(path, start_frame=start_frame, end_frame=end_frame, backend=backend,
+                                         resample=resample)
+    return freqs, mags
+
+
+def usable_cores():
+    """Anzahl der Kerne, auf denen dieser Prozess laufen darf"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parallel_segments(serial_seconds, workers):
+    """Anzahl der Segmente für eine geschätzte serielle Rechenzeit; 1, wenn sich das Aufteilen nicht lohnt"""
+    segments = min(workers, usable_cores(), int(serial_seconds // MIN_SEGMENT_SECONDS))
+    if segments < 2 or serial_seconds / segments + PARALLEL_OVERHEAD >= serial_seconds:
+        return 1
+    return segments
+
+
+def track_pitch_parallel(path, workers=None, progress=None, metrics=None, backend=None, resample=True):
+    """Verteilt die Tonhöhenverfolgung einer Datei auf mehrere Prozesse
+
+    Die Datei wird in zusammenhängende Frame-Bereiche geteilt; jeder Worker liest dazu die
+    überlappenden Samples an den Grenzen mit. Da die Frames exakt aneinander anschließen,
+    ergibt das Zusammenfügen dieselbe Spur wie die serielle Analyse, und die anschließende
+    Segmentierung über die ganze Spur verbindet Noten, die über eine Segmentgrenze reichen.
+    Die Worker dekodieren selbst, gemessen wird daher nur die Stufe pitch (inkl. Dekodieren).
+
+    Die Anzahl der Segmente folgt aus der Rechenzeit der ersten PROBE_FRAMES (siehe
+    parallel_segments); bei kurzen Dateien oder schnellen Verfahren bleibt es seriell.
+    """
+    import soundfile as sf
+
+    backend = backend or default_backend()
+    workers = workers or os.cpu_count() or 1
+    try:
+        info = sf.info(path)
+    except RuntimeError:
+        # Ohne Random Access müsste jeder Worker die ganze Datei dekodieren
+        return track_pitch_chunked(path, progress=progress, metrics=metrics, backend=backend, resample=resample)
+
+    n_frames = count_frames(info.frames)
+    probe_end = min(PROBE_FRAMES, n_frames)
+    if probe_end == n_frames or min(workers, usable_cores()) < 2:
+        return track_pitch_chunked(path, progress=progress, metrics=metrics, backend=backend, resample=resample)
+
+    freqs = np.zeros(track_shape(n_frames, backend), dtype=np.float32)
+    mags = np.zeros(track_shape(n_frames, backend), dtype=np.float32)
+    with optional_stage(metrics, "pitch"):
+        started = time.perf_counter()
+        freqs[:probe_end], mags[:probe_end], _ = track_pitch_chunked(path, end_frame=probe_end, backend=backend,
+                                                                     resample=resample, read_ahead=False)
+        rest = n_frames - probe_end
+        segments = parallel_segments((time.perf_counter() - started) * rest / probe_end, workers)
+        if progress is not None:
+            progress(probe_end / n_frames)
+
+        if segments == 1:
+            def rest_progress(fraction):
+                progress((probe_end + fraction * rest) / n_frames)
+
+            freqs[probe_end:], mags[probe_end:], _ = track_pitch_chunked(
+                path, start_frame=probe_end, backend=backend, resample=resample,
+                progress=rest_progress if progress is not None else None)
+            return freqs, mags, info.samplerate
+
+        segment_frames = -(-rest // segments)
+        bounds = [(start, min(start + segment_frames, n_frames)) for start in range(probe_end, n_frames, segment_frames)]
+        with ProcessPoolExecutor(max_workers=len(bounds)) as pool:
+            futures = {pool.submit(_track_segment, path, start, end, backend, resample): (start, end)
+                       for start, end in bounds}
+            for done, future in enumerate(as_completed(futures), 1):
+                start, end = futures[future]
+                freqs[start:end], mags[start:end] = future.result()
+                if progress is not None:
+                    progress((probe_end + done * segment_frames) / n_frames if done < len(bounds) else 1.0)
+
+    return freqs, mags, info.samplerate
+
+
+def load_track(path, chunked=True, cache=None, progress=None, workers=1, metrics=None, backend=None,
+               resample=True):
+    """Liefert die Tonhöhenspur einer Datei, bevorzugt aus dem Cache (siehe track_cache.TrackCache)"""
+    backend = backend or default_backend()
+    key = None
+    if cache is not None:
+        with optional_stage(metrics, "cache"):
+            # Die Analyse-Abtastrate hängt von max_pitch ab (ohne decimate immer die Originalrate)
+            decimated = resample and backend.decimate
+            params = dict(backend.params, resample_max_pitch=backend.max_pitch if decimated else None)
+            key = cache.key(path, method=backend.name, n_fft=N_FFT, hop_length=HOP_LENGTH, **params)
+            track = cache.get(key)
+        if track is not None:
+            if progress is not None:
+                progress(1.0)
+            return track
+
+    if workers > 1:
+        freqs, mags, sr = track_pitch_parallel(path, workers, progress=progress, metrics=metrics, backend=backend,
+                                               resample=resample)
+    elif chunked:
+        freqs, mags, sr = track_pitch_chunked(path, progress=progress, metrics=metrics, backend=backend,
+                                              resample=resample)
+    else:
+        freqs, mags, sr = track_pitch(path, metrics=metrics, backend=backend, resample=resample)
+
+    if cache is not None:
+        with optional_stage(metrics, "cache"):
+            cache.put(key, freqs, mags, sr)
+    return freqs, mags, sr
+
+
+def _find_change(midi, anchor, start, end):
+    """Sucht ab start den ersten Frame, der mehr als die Toleranz vom Anker abweicht"""
+    block = SEARCH_BLOCK
+    while start < end:
+        stop = min(start + block, end)
+        hits = np.flatnonzero(np.abs(midi[start:stop] - anchor) > PITCH_TOLERANCE)
+        if len(hits):
+            return start + hits[0]
+        start = stop
+        block *= 2  # Lange stabile Noten mit wenigen numpy-Aufrufen abdecken
+    return end
+
+
+def smooth_track(freqs, mags, window_size=WINDOW_SIZE):
+    """Gleitender Median über das Fenster (robuster gegen Ausreißer); liefert Frequenz, Lautstärke, MIDI"""
+    windows = np.lib.stride_tricks.sliding_window_view
+    avg_freq = np.median(windows(freqs, window_size), axis=-1)
+    avg_mag = np.median(windows(mags, window_size), axis=-1)
+    midi = np.zeros(len(avg_freq))
+    pitched = avg_freq > 0
+    midi[pitched] = hz_to_midi(avg_freq[pitched])
+    return avg_freq, avg_mag, midi
+
+
+def _segment_runs(midi, voiced):
+    """Teilt die stimmhaften Abschnitte bei Tonwechseln; liefert Anfangs- und End-Frames der Segmente"""
+    # Zusammenhängende stimmhafte Abschnitte bestimmen
+    edges = np.diff(np.concatenate(([False], voiced, [False])).astype(np.int8))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    if len(run_starts) == 0:
+        return run_starts, run_ends
+
+    # Abschnitte ohne Tonwechsel ergeben genau eine Note und brauchen keine Suche
+    lengths = run_ends - run_starts
+    anchors = np.repeat(midi[run_starts], lengths)
+    deviation = np.abs(midi[voiced] - anchors) > PITCH_TOLERANCE
+    has_change = np.add.reduceat(deviation, np.cumsum(lengths) - lengths) > 0
+
+    seg_starts = []
+    seg_ends = []
+    for start, end, changed in zip(run_starts, run_ends, has_change):
+        if changed:
+            # Bei Tonwechsel beginnt eine neue Note, verglichen wird mit dem Notenbeginn
+            while True:
+                change = _find_change(midi, midi[start], start + 1, end)
+                seg_starts.append(start)
+                seg_ends.append(change)
+                if change >= end:
+                    break
+                start = change
+        else:
+            seg_starts.append(start)
+            seg_ends.append(end)
+
+    return np.asarray(seg_starts), np.asarray(seg_ends)
+
+
+def _segment_times(times, window_size, seg_starts, seg_ends):
+    """Startzeiten und Dauern der Segmente"""
+    frame_time = times[window_size - 1:]
+    # Eine Note endet mit dem Frame, der sie beendet, oder mit dem letzten Frame
+    end_times = frame_time[np.minimum(seg_ends, len(frame_time) - 1)]
+    end_times = np.where(seg_ends < len(frame_time), end_times, times[-1])
+    start_times = frame_time[seg_starts]
+    return start_times, end_times - start_times
+
+
+def segment_notes(freqs, mags, times, min_note_length, min_magnitude, min_pitch, max_pitch,
+                  window_size=WINDOW_SIZE, smoothed=None):
+    """Segmentiert eine Tonhöhenspur (Frequenz/Lautstärke pro Frame) in Noten
+
+    smoothed kann das Ergebnis von smooth_track enthalten, damit wiederholte Segmentierungen
+    derselben Spur (andere Schwellwerte) den Median nicht erneut berechnen. Mehrstimmige Spuren
+    (eine Spalte pro Stimme) gehen an segment_polyphonic.
+    """
+    if np.ndim(freqs) == 2:
+        return segment_polyphonic(freqs, mags, times, min_note_length, min_magnitude, min_pitch, max_pitch,
+                                  window_size)
+    n_frames = len(freqs)
+    if n_frames < window_size:
+        return []
+
+    avg_freq, avg_mag, midi = smoothed if smoothed is not None else smooth_track(freqs, mags, window_size)
+
+    # Stille oder Geräusche mit niedriger Magnitude beenden eine Note
+    voiced = ~((avg_freq <= 0) | (avg_mag < min_magnitude))
+    seg_starts, seg_ends = _segment_runs(midi, voiced)
+    if len(seg_starts) == 0:
+        return []
+
+    start_times, durations = _segment_times(times, window_size, seg_starts, seg_ends)
+    seg_midi = midi[seg_starts]
+
+    # Nur ausreichend lange Noten im gewünschten Bereich berücksichtigen
+    keep = (durations >= min_note_length) & (min_pitch <= seg_midi) & (seg_midi <= max_pitch)
+    return [{
+        'time': start_times[i],
+        'pitch': int(round(seg_midi[i])),
+        'duration': durations[i]
+    } for i in np.flatnonzero(keep)]
+
+
+def segment_polyphonic(freqs, mags, times, min_note_length, min_magnitude, min_pitch, max_pitch,
+                       window_size=WINDOW_SIZE):
+    """Segmentiert eine mehrstimmige Spur (Frames x Stimmen) in sich überlappende Noten
+
+    Jede Spitze wird auf den nächsten Halbton gerundet und in eine Piano-Roll (Frames x Tonhöhen
+    min_pitch..max_pitch) eingetragen, sofern sie min_magnitude erreicht; jede Tonhöhe ist damit
+    ein eigener Notenstrom, unabhängig davon, in welcher Stimme die Spitze lag. Wie der Median
+    im einstimmigen Fall gilt ein Frame als klingend, wenn die Mehrheit des Fensters (window_size
+    ist ungerade) klingt. Anfang und Ende aller Noten ergeben sich in einem Schritt aus den
+    Flanken der ganzen Matrix; die Zeiten folgen denselben Regeln wie bei segment_notes.
+    """
+    n_frames = len(freqs)
+    if n_frames < window_size:
+        return []
+
+    # Piano-Roll: Tonhöhe klingt im Frame, wenn eine ausreichend laute Spitze auf sie fällt
+    pitched = freqs > 0
+    midi = np.zeros(freqs.shape, dtype=np.int64)
+    midi[pitched] = np.round(hz_to_midi(freqs[pitched]))
+    loud = pitched & (mags >= min_magnitude) & (min_pitch <= midi) & (midi <= max_pitch)
+    rows, voices = np.nonzero(loud)
+    roll = np.zeros((n_frames, max_pitch - min_pitch + 1), dtype=bool)
+    roll[rows, midi[rows, voices] - min_pitch] = True
+
+    # Mehrheit über das Fenster per kumulierter Summe, nur für Tonhöhen, die überhaupt vorkommen
+    columns = np.flatnonzero(roll.any(axis=0))
+    if len(columns) == 0:
+        return []
+    cumulative = np.zeros((n_frames + 1, len(columns)), dtype=np.int32)
+    np.cumsum(roll[:, columns], axis=0, out=cumulative[1:])
+    active = (cumulative[window_size:] - cumulative[:-window_size]) * 2 > window_size
+
+    # Flanken pro Tonhöhe; transponiert, damit Anfänge und Enden jeder Tonhöhe zeitlich geordnet aufeinander folgen
+    padding = np.zeros((len(columns), 1), dtype=np.int8)
+    edges = np.diff(np.concatenate((padding, active.T.astype(np.int8), padding), axis=1), axis=1)
+    start_columns, seg_starts = np.nonzero(edges == 1)
+    _, seg_ends = np.nonzero(edges == -1)
+    if len(seg_starts) == 0:
+        return []
+
+    start_times, durations = _segment_times(times, window_size, seg_starts, seg_ends)
+    pitches = columns[start_columns] + min_pitch
+
+    # Nur ausreichend lange Noten, nach Startzeit und Tonhöhe geordnet
+    keep = np.flatnonzero(durations >= min_note_length)
+    keep = keep[np.lexsort((pitches[keep], start_times[keep]))]
+    return [{
+        'time': start_times[i],
+        'pitch': int(pitches[i]),
+        'duration': durations[i]
+    } for i in keep]
+
+
+def sweep_thresholds(freqs, mags, times, min_pitch=MIN_PITCH, max_pitch=MAX_PITCH,
+                     note_lengths=SWEEP_NOTE_LENGTHS, magnitudes=SWEEP_MAGNITUDES, window_size=WINDOW_SIZE,
+                     smoothed=None):
+    """Bewertet alle Kombinationen aus min_note_length und min_magnitude auf einer Tonhöhenspur
+
+    Der Median wird einmal berechnet, die Segmentierung einmal pro Lautstärke-Schwelle; alle
+    Notenlängen ergeben sich daraus per Binärsuche über die sortierten Segmentdauern. Jede
+    Kombination erhält eine Bewertung aus drei Faktoren zwischen 0 und 1:
+
+    - coverage: Anteil der gesungenen Zeit (bei der niedrigsten Schwelle), der in Noten landet
+    - clean: Anteil der Segmente, die als Note erhalten bleiben (wenige verworfene Fragmente)
+    - stability: wie wenig sich die Notenanzahl bei den benachbarten Einstellungen ändert
+
+    Geliefert wird eine nach score absteigend sortierte Liste von Dicts. smoothed wie bei segment_notes.
+    """
+    note_lengths = np.asarray(note_lengths, dtype=np.float64)
+    counts = np.zeros((len(magnitudes), len(note_lengths)), dtype=np.int64)
+    kept = np.zeros(counts.shape)
+    segments = np.zeros(len(magnitudes), dtype=np.int64)
+    if len(freqs) >= window_size:
+        avg_freq, avg_mag, midi = smoothed if smoothed is not None else smooth_track(freqs, mags, window_size)
+        for row, magnitude in enumerate(magnitudes):
+            voiced = ~((avg_freq <= 0) | (avg_mag < magnitude))
+            seg_starts, seg_ends = _segment_runs(midi, voiced)
+            if len(seg_starts) == 0:
+                continue
+            _, durations = _segment_times(times, window_size, seg_starts, seg_ends)
+            seg_midi = midi[seg_starts]
+            durations = np.sort(durations[(min_pitch <= seg_midi) & (seg_midi <= max_pitch)])
+
+            # Noten mit durations >= Länge liegen ab first im sortierten Array
+            first = np.searchsorted(durations, note_lengths, side='left')
+            suffix_sums = np.concatenate((np.cumsum(durations[::-1])[::-1], [0.0]))
+            counts[row] = len(durations) - first
+            kept[row] = suffix_sums[first]
+            segments[row] = len(durations)
+
+    coverage = kept / max(kept.max(), 1e-9)
+    clean = counts / np.maximum(segments[:, None], 1)
+
+    # Relative Änderung der Notenanzahl zu den Nachbarn im Raster
+    padded = np.pad(counts.astype(np.float64), 1, mode='edge')
+    neighbours = np.stack((padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]))
+    change = np.abs(neighbours - counts).mean(axis=0) / np.maximum(counts, 1)
+    stability = np.clip(1 - change, 0, 1)
+    score = coverage * clean * stability
+
+    results = [{
+        'min_note_length': float(note_lengths[col]),
+        'min_magnitude': float(magnitudes[row]),
+        'notes': int(counts[row, col]),
+        'coverage': round(float(coverage[row, col]), 4),
+        'clean': round(float(clean[row, col]), 4),
+        'stability': round(float(stability[row, col]), 4),
+        'score': round(float(score[row, col]), 4),
+    } for row in range(len(magnitudes)) for col in range(len(note_lengths))]
+    # Bei gleicher Bewertung gewinnt die strengere Einstellung (robuster gegen Rauschen)
+    results.sort(key=lambda result: (result['score'], result['min_magnitude'], result['min_note_length']),
+                 reverse=True)
+    return results
+
+
+def format_notes(notes):
+    """Rundet Zeiten und Dauern, sortiert nach Startzeit und entfernt Duplikate"""
+    # Runde Zeiten und Dauern auf 1 Nachkommastelle
+    formatted_notes = []
+    for note in notes:
+        formatted_notes.append({
+            'time': round(note['time'], 1),
+            'pitch': note['pitch'],
+            'duration': round(note['duration'], 1)
+        })
+
+    # Sortiere nach Startzeit
+    formatted_notes.sort(key=lambda x: x['time'])
+
+    # Entferne Duplikate (Noten mit gleicher Startzeit und Tonhöhe), die erste bleibt erhalten
+    seen = set()
+    unique_notes = []
+    for note in formatted_notes:
+        key = (note['time'], note['pitch'])
+        if key not in seen:
+            seen.add(key)
+            unique_notes.append(note)
+
+    return {'notes': unique_notes}
+
+
+def notes_path(audio_path):
+    """Pfad der Notendatei, die neben der Audio-Datei gespeichert wird"""
+    return os.path.splitext(audio_path)[0] + "_notes.json"
+
+
+def save_notes(output_file, formatted_notes, binary=True):
+    """Speichert die formatierten Noten als JSON und optional zusätzlich im Binärformat"""
+    with open(output_file, 'w') as f:
+        json.dump(formatted_notes, f, indent=2)
+
+    # Die Noten sind bereits sortiert und ohne Duplikate, die Player lesen die Binärdatei ohne Parsen
+    if binary:
+        notes = notes_io.NoteArrays.from_records(formatted_notes['notes'], presorted=True)
+        notes_io.write_binary(notes_io.binary_path(output_file), notes)
+
+
+def analyze_file(path, min_note_length=MIN_NOTE_LENGTH, min_magnitude=MIN_MAGNITUDE,
+                 min_pitch=MIN_PITCH, max_pitch=MAX_PITCH, cache=None, progress=None, workers=1, metrics=None,
+                 backend=DEFAULT_BACKEND, resample=True, auto_tune=False, voices=1):
+    """Komplette Analyse einer Audio-Datei ohne GUI; liefert die formatierten Noten und die Audiodauer
+
+    backend ist der Name eines Verfahrens aus pitch_backends.BACKENDS, resample=False analysiert
+    mit der Originalrate der Datei. Mit auto_tune ersetzt die bestbewertete Einstellung aus
+    sweep_thresholds min_note_length und min_magnitude (in metrics.info vermerkt). voices > 1
+    erkennt bis zu voices gleichzeitige Töne (siehe segment_polyphonic), ohne auto_tune.
+    """
+    if auto_tune and voices > 1:
+        raise ValueError("auto_tune ist nur für die einstimmige Erkennung verfügbar")
+    freqs, mags, sr = load_track(path, cache=cache, progress=progress, workers=workers, metrics=metrics,
+                                 backend=get_backend(backend, min_pitch, max_pitch, voices), resample=resample)
+    times = frame_times(len(freqs), sr)
+    smoothed = smooth_track(freqs, mags) if voices == 1 and len(freqs) >= WINDOW_SIZE else None
+    if auto_tune:
+        with optional_stage(metrics, "sweep"):
+            best = sweep_thresholds(freqs, mags, times, min_pitch, max_pitch, smoothed=smoothed)[0]
+        min_note_length, min_magnitude = best['min_note_length'], best['min_magnitude']
+        if metrics is not None:
+            metrics.info.update(min_note_length=min_note_length, min_magnitude=min_magnitude)
+    with optional_stage(metrics, "extract_notes"):
+        notes = segment_notes(freqs, mags, times,
+                              min_note_length=min_note_length,
+                              min_magnitude=min_magnitude,
+                              min_pitch=min_pitch,
+                              max_pitch=max_pitch,
+                              smoothed=smoothed)
+    with optional_stage(metrics, "format_notes"):
+        formatted_notes = format_notes(notes)
+    duration = (len(freqs) - 1) * HOP_LENGTH / sr
+    return formatted_notes, duration
@@ -0,0 +1,425 @@
+"""Reproduzierbarer Benchmark der Notenerkennung mit synthetischen Audio-Dateien.
+
+Beispiele:
+    python benchmark.py                                  # schneller Durchlauf (10 s und 60 s)
+    python benchmark.py --suite full -o ergebnis.json    # bis 60 Minuten Audio
+    python benchmark.py --baseline alt.json              # Vergleich mit einem früheren Lauf
+    python benchmark.py --backends yin,piptrack,pyin     # Verfahren der Tonhöhenerkennung vergleichen
+    python benchmark.py --kinds chords --voices 1,3      # mehrstimmige gegen einstimmige Erkennung
+    python benchmark.py --check-rates                    # gleiche Noten bei reduzierter und Originalrate
+
+Die Testdateien entstehen aus einem festen Seed und enthalten bekannte Noten (Sinus- und
+Obertonmelodien, Vibrato, Pausen, Rauschen; auf Wunsch zweistimmige Akkorde). Jede Stufe der Analyse wird einzeln gemessen:
+Dekodieren, Tonhöhenerkennung (pitch), extract_notes, format_notes und das Schreiben der JSON-Datei. Für jede
+Stufe werden Laufzeit, CPU-Zeit und der Spitzenwert des Speichers erfasst (der Speicher in einem zweiten Durchlauf
+mit tracemalloc, damit dessen Aufwand die Zeiten nicht verfälscht), anschließend wird das Ergebnis mit den bekannten
+Noten verglichen. Die Ergebnisse werden als JSON gespeichert.
+Jede Testdatei wird mit allen gewählten Verfahren (siehe pitch_backends) analysiert.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+import analysis
+import synth
+from metrics import peak_rss_mb
+from pitch_backends import MAX_VOICES
+
+# Version der Testdaten; bei Änderungen an der Erzeugung erhöhen, damit alte Dateien neu entstehen
+CORPUS_VERSION = 2
+
+# Abtastrate der Testdaten (CD-Qualität, wie die meisten echten Aufnahmen)
+SAMPLE_RATE = 44100
+
+KINDS = ("sine", "harmonic", "vibrato", "gaps", "noise")
+# Zusätzliche Arten, nicht im Standardlauf (die Indizes der übrigen bleiben für den Seed gleich)
+ALL_KINDS = KINDS + ("chords",)
+
+# Intervalle (in Halbtönen) der zweiten Stimme bei "chords": Terzen, Quarte, Quinte, Sexten
+CHORD_INTERVALS = (3, 4, 5, 7, 8, 9)
+SUITES = {
+    "quick": (10, 60),
+    "full": (10, 60, 600, 3600),
+}
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "karaoke-sniffer-bench")
+
+# Toleranz beim Vergleich mit den bekannten Noten (Rundung auf 0,1 s plus Median-Fenster)
+ONSET_TOLERANCE = 0.15
+
+# Standard-Grenzwerte für den Vergleich mit einem früheren Lauf
+TIME_TOLERANCE = 0.25  # relative Verlangsamung einer Stufe
+MIN_STAGE_SECONDS = 0.05  # kürzere Stufen schwanken zu stark für einen Vergleich
+ACCURACY_TOLERANCE = 0.02  # Rückgang des F1-Werts
+
+# pyin ist etwa 50-mal langsamer und wird daher nur auf Wunsch gemessen
+DEFAULT_BACKENDS = ("yin", "piptrack")
+
+
+def melody(duration, rng, gaps=False):
+    """Zufällige Melodie als Liste von Noten (time, pitch, duration)"""
+    notes = []
+    time_pos = 0.0
+    pitch = int(rng.integers(52, 76))
+    while True:
+        length = float(rng.uniform(0.3, 1.2))
+        if time_pos + length > duration:
+            break
+        notes.append({'time': time_pos, 'pitch': pitch, 'duration': length})
+        time_pos += length
+        if gaps:
+            time_pos += float(rng.uniform(0.2, 0.8))
+        # Nächste Tonhöhe mit mindestens zwei Halbtönen Abstand, damit der Wechsel erkennbar ist
+        step = int(rng.integers(2, 8)) * (1 if rng.random() < 0.5 else -1)
+        pitch = int(np.clip(pitch + step, analysis.MIN_PITCH + 12, analysis.MAX_PITCH - 12))
+    return notes
+
+
+def render_tone(kind, pitch, samples, sr, rng):
+    """Erzeugt einen Ton der gewünschten Art (float32, Amplitude ca. 0,5)"""
+    t = np.arange(samples) / sr
+    freq = float(synth.midi_to_freq(pitch))
+    if kind == "vibrato":
+        # +-30 Cent bei 5,5 Hz, die Phase ergibt sich aus der integrierten Frequenz
+        inst = freq * 2 ** (30 / 1200 * np.sin(2 * np.pi * 5.5 * t))
+        tone = np.sin(2 * np.pi * np.cumsum(inst) / sr)
+    elif kind == "harmonic":
+        tone = sum(np.sin(2 * np.pi * freq * k * t) / k for k in range(1, 6)) / 2.3
+    else:
+        tone = np.sin(2 * np.pi * freq * t)
+
+    tone *= 0.5
+    # Kurze Fades gegen Knackser an den Notengrenzen
+    fade = min(int(0.01 * sr), samples // 2)
+    if fade:
+        tone[:fade] *= np.linspace(0, 1, fade)
+        tone[-fade:] *= np.linspace(1, 0, fade)
+    if kind == "noise":
+        tone += rng.normal(0, 0.05, samples)
+    return tone.astype(np.float32)
+
+
+def corpus_name(kind, duration, seed):
+    return f"{kind}_{duration}s_seed{seed}_v{CORPUS_VERSION}"
+
+
+def make_case(kind, duration, corpus_dir, seed=0, sr=SAMPLE_RATE):
+    """Erzeugt (oder verwendet) eine Testdatei; liefert die Pfade von WAV und Referenznoten"""
+    name = corpus_name(kind, duration, seed)
+    wav_path = os.path.join(corpus_dir, name + ".wav")
+    truth_path = os.path.join(corpus_dir, name + "_truth.json")
+    if os.path.exists(wav_path) and os.path.exists(truth_path):
+        return wav_path, truth_path
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = np.random.default_rng([seed, ALL_KINDS.index(kind), duration])
+    notes = melody(duration, rng, gaps=(kind == "gaps"))
+    # Zweite Stimme: gleicher Einsatz und gleiche Dauer, ein zufälliges Intervall darüber
+    upper = [dict(note, pitch=note['pitch'] + int(rng.choice(CHORD_INTERVALS))) for note in notes] \
+        if kind == "chords" else [None] * len(notes)
+
+    # Note für Note schreiben, damit auch eine Stunde Audio nicht komplett im Speicher liegt
+    total = int(duration * sr)
+    written = 0
+    with wave.open(wav_path + ".tmp", 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        for note, second in zip(notes, upper):
+            start = int(round(note['time'] * sr))
+            if start > written:
+                silence = np.zeros(start - written, dtype=np.float32)
+                if kind == "noise":
+                    silence += rng.normal(0, 0.05, len(silence)).astype(np.float32)
+                f.writeframes(synth.to_int16(silence).tobytes())
+                written = start
+            if second is not None:
+                samples = int(note['duration'] * sr)
+                tone = (render_tone("harmonic", note['pitch'], samples, sr, rng)
+                        + 0.8 * render_tone("harmonic", second['pitch'], samples, sr, rng)) / 1.8
+            else:
+                tone = render_tone(kind, note['pitch'], int(note['duration'] * sr), sr, rng)
+            f.writeframes(synth.to_int16(tone).tobytes())
+            written += len(tone)
+        if total > written:
+            f.writeframes(synth.to_int16(np.zeros(total - written, dtype=np.float32)).tobytes())
+    os.replace(wav_path + ".tmp", wav_path)
+
+    with open(truth_path, 'w') as f:
+        json.dump({'notes': sorted(notes + [note for note in upper if note], key=lambda note: (note['time'], note['pitch']))}, f)
+    return wav_path, truth_path
+
+
+def note_accuracy(detected, truth, tolerance=ONSET_TOLERANCE):
+    """Precision, Recall und F1: eine Note gilt als erkannt bei gleicher Tonhöhe und nahem Einsatz"""
+    truth_times = np.array([note['time'] for note in truth])
+    truth_pitches = np.array([note['pitch'] for note in truth])
+    matched = np.zeros(len(truth), dtype=bool)
+
+    hits = 0
+    for note in detected:
+        lo = np.searchsorted(truth_times, note['time'] - tolerance)
+        hi = np.searchsorted(truth_times, note['time'] + tolerance, side='right')
+        for index in range(lo, hi):
+            if not matched[index] and truth_pitches[index] == note['pitch']:
+                matched[index] = True
+                hits += 1
+                break
+
+    precision = hits / len(detected) if detected else 0.0
+    recall = hits / len(truth) if truth else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': round(precision, 4), 'recall': round(recall, 4), 'f1': round(f1, 4),
+            'detected': len(detected), 'expected': len(truth)}
+
+
+class StageTimer:
+    """Misst Laufzeit und CPU-Zeit einzelner Stufen, mit trace_memory stattdessen den Spitzenspeicher (tracemalloc)
+
+    tracemalloc bremst speicherintensive Stufen deutlich, Zeiten und Speicher stammen daher aus
+    getrennten Durchläufen. Bei trace_memory muss tracemalloc bereits laufen.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def run(self, name, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            result = func(*args, **kwargs)
+            self.stages[name] = {'peak_mb': round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)}
+            return result
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func(*args, **kwargs)
+        self.stages[name] = {
+            'wall': round(time.perf_counter() - wall, 4),
+            'cpu': round(time.process_time() - cpu, 4),
+        }
+        return result
+
+
+def analyze_stages(timer, wav_path, out_dir, pitch_backend, resample):
+    """Analysiert eine Testdatei Stufe für Stufe mit timer; liefert (formatierte Noten, Audiodauer)"""
+    y, sr = timer.run("decode", analysis.decode, wav_path)
+    freqs, mags, _ = timer.run("pitch", analysis.track_pitch_decoded, y, sr, backend=pitch_backend,
+                               resample=resample)
+    del y
+    notes = timer.run("extract_notes", lambda: analysis.segment_notes(
+        freqs, mags, analysis.frame_times(len(freqs), sr),
+        min_note_length=analysis.MIN_NOTE_LENGTH, min_magnitude=analysis.MIN_MAGNITUDE,
+        min_pitch=analysis.MIN_PITCH, max_pitch=analysis.MAX_PITCH))
+    formatted = timer.run("format_notes", analysis.format_notes, notes)
+    output_file = os.path.join(out_dir, os.path.basename(analysis.notes_path(wav_path)))
+    timer.run("json_write", analysis.save_notes, output_file, formatted)
+    return formatted, (len(freqs) - 1) * analysis.HOP_LENGTH / sr
+
+
+def run_case(wav_path, truth_path, out_dir, backend=analysis.DEFAULT_BACKEND, resample=True, voices=1,
+             measure_memory=True):
+    """Führt die Analyse einer Testdatei stufenweise aus und bewertet das Ergebnis
+
+    Die Zeiten stammen aus einem Durchlauf ohne tracemalloc; mit measure_memory folgt ein
+    zweiter Durchlauf, der nur den Spitzenspeicher jeder Stufe (peak_mb) misst.
+    """
+    timer = StageTimer()
+    pitch_backend = analysis.get_backend(backend, analysis.MIN_PITCH, analysis.MAX_PITCH, voices)
+    formatted, audio_seconds = analyze_stages(timer, wav_path, out_dir, pitch_backend, resample)
+    if measure_memory:
+        memory = StageTimer(trace_memory=True)
+        tracemalloc.start()
+        try:
+            analyze_stages(memory, wav_path, out_dir, pitch_backend, resample)
+        finally:
+            tracemalloc.stop()
+        for stage, values in memory.stages.items():
+            timer.stages[stage].update(values)
+
+    with open(truth_path) as f:
+        truth = json.load(f)['notes']
+
+    total = sum(stage['wall'] for stage in timer.stages.values())
+    return {
+        'backend': backend,
+        'voices': voices,
+        'audio_seconds': round(audio_seconds, 2),
+        'total_wall': round(total, 4),
+        'realtime_factor': round(audio_seconds / total, 1) if total else None,
+        'stages': timer.stages,
+        'accuracy': note_accuracy(formatted['notes'], truth),
+    }
+
+
+def rate_mismatch(wav_path, backend, voices=1):
+    """Vergleicht die Noten von analyze_file mit reduzierter und mit Originalrate; None bei Gleichheit"""
+    reduced, _ = analysis.analyze_file(wav_path, backend=backend, resample=True, voices=voices)
+    native, _ = analysis.analyze_file(wav_path, backend=backend, resample=False, voices=voices)
+    if reduced == native:
+        return None
+    differing = sum(a != b for a, b in zip(reduced['notes'], native['notes']))
+    differing += abs(len(reduced['notes']) - len(native['notes']))
+    return f"{differing} von {max(len(reduced['notes']), len(native['notes']))} Noten abweichend"
+
+
+def environment():
+    """Versionen und Hardware, damit Ergebnisse verschiedener Rechner unterscheidbar bleiben"""
+    import librosa
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'librosa': librosa.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, accuracy_tolerance=ACCURACY_TOLERANCE):
+    """Vergleicht mit einem früheren Lauf; liefert eine Liste der Regressionen als Text"""
+    regressions = []
+    for name, case in results['cases'].items():
+        old = baseline.get('cases', {}).get(name)
+        if old is None:
+            continue
+        for stage, values in case['stages'].items():
+            old_wall = old['stages'].get(stage, {}).get('wall')
+            if old_wall is None or max(old_wall, values['wall']) < MIN_STAGE_SECONDS:
+                continue
+            if values['wall'] > old_wall * (1 + time_tolerance):
+                regressions.append(f"{name}/{stage}: {values['wall']:.3f}s statt {old_wall:.3f}s")
+        old_f1 = old['accuracy']['f1']
+        if case['accuracy']['f1'] < old_f1 - accuracy_tolerance:
+            regressions.append(f"{name}: F1 {case['accuracy']['f1']:.3f} statt {old_f1:.3f}")
+    return regressions
+
+
+def backend_summary(results):
+    """Durchsatz (Audio-Sekunden pro Sekunde) und mittlerer F1-Wert pro Verfahren und Stimmenzahl"""
+    summary = {}
+    for case in results['cases'].values():
+        label = case['backend'] if case.get('voices', 1) == 1 else f"{case['backend']} ({case['voices']} Stimmen)"
+        entry = summary.setdefault(label, {'audio_seconds': 0.0, 'wall': 0.0, 'f1': []})
+        entry['audio_seconds'] += case['audio_seconds']
+        entry['wall'] += case['total_wall']
+        entry['f1'].append(case['accuracy']['f1'])
+    return {backend: {'throughput': round(entry['audio_seconds'] / entry['wall'], 1) if entry['wall'] else None,
+                      'mean_f1': round(sum(entry['f1']) / len(entry['f1']), 4)}
+            for backend, entry in summary.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark der Notenerkennung mit synthetischen Testdateien")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick",
+                        help="Vordefinierte Audiolängen: quick (10 s, 60 s) oder full (bis 60 min)")
+    parser.add_argument("--lengths", type=lambda text: [int(v) for v in text.split(",")],
+                        help="Eigene Audiolängen in Sekunden, z.B. 10,60,600")
+    parser.add_argument("--kinds", type=lambda text: text.split(","), default=list(KINDS),
+                        help=f"Arten der Testdateien (Standard: {','.join(KINDS)}, verfügbar: {','.join(ALL_KINDS)})")
+    parser.add_argument("--backends", type=lambda text: text.split(","), default=list(DEFAULT_BACKENDS),
+                        help=f"Verfahren der Tonhöhenerkennung (Standard: {','.join(DEFAULT_BACKENDS)}, "
+                             f"verfügbar: {','.join(analysis.BACKENDS)})")
+    parser.add_argument("--voices", type=lambda text: [int(v) for v in text.split(",")], default=[1],
+                        help="Stimmenzahlen der Erkennung, z.B. 1,3 (mehrstimmig nur mit piptrack; Standard: 1)")
+    parser.add_argument("--native-rate", action="store_true",
+                        help="Mit der Originalrate analysieren statt mit der reduzierten Analyse-Abtastrate")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Spitzenspeicher pro Stufe nicht messen (spart den zweiten Durchlauf mit tracemalloc)")
+    parser.add_argument("--check-rates", action="store_true",
+                        help="Für jede Testdatei und jedes Verfahren prüfen, dass reduzierte und Originalrate "
+                             "dieselben Noten liefern (Exit-Code 1 bei Abweichungen)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="Verzeichnis für die erzeugten Testdateien")
+    parser.add_argument("-o", "--output", help="Ergebnisse als JSON speichern")
+    parser.add_argument("--baseline", help="Ergebnis-JSON eines früheren Laufs zum Vergleich")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE,
+                        help="Erlaubte relative Verlangsamung einer Stufe gegenüber der Baseline")
+    parser.add_argument("--accuracy-tolerance", type=float, default=ACCURACY_TOLERANCE,
+                        help="Erlaubter Rückgang des F1-Werts gegenüber der Baseline")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.kinds) - set(ALL_KINDS)
+    if unknown:
+        parser.error(f"Unbekannte Art(en): {', '.join(sorted(unknown))}")
+    unknown = set(args.backends) - set(analysis.BACKENDS)
+    if unknown:
+        parser.error(f"Unbekannte(s) Verfahren: {', '.join(sorted(unknown))}")
+    if not all(1 <= voices <= MAX_VOICES for voices in args.voices):
+        parser.error(f"Stimmenzahl muss zwischen 1 und {MAX_VOICES} liegen")
+    if max(args.voices) > 1:
+        monophonic = [backend for backend in args.backends if not analysis.BACKENDS[backend].polyphonic]
+        if monophonic:
+            parser.error(f"Nur einstimmig: {', '.join(monophonic)} (mehrstimmig mit --backends piptrack)")
+    lengths = args.lengths or SUITES[args.suite]
+
+    analysis.warm_up()
+    results = {'environment': environment(), 'corpus_version': CORPUS_VERSION, 'seed': args.seed,
+               'resample': not args.native_rate, 'cases': {}}
+    rate_mismatches = []
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for duration in lengths:
+            for kind in args.kinds:
+                wav_path, truth_path = make_case(kind, duration, args.corpus_dir, args.seed)
+                for backend in args.backends:
+                    for voices in args.voices:
+                        # Einstimmige Fälle behalten ihren Namen, damit ältere Baselines vergleichbar bleiben
+                        name = f"{corpus_name(kind, duration, args.seed)}_{backend}"
+                        if voices > 1:
+                            name += f"_{voices}voices"
+                        case = run_case(wav_path, truth_path, out_dir, backend, not args.native_rate, voices,
+                                        measure_memory=not args.no_memory)
+                        results['cases'][name] = case
+
+                        stages = "  ".join(f"{stage} {values['wall']:.3f}s"
+                                           for stage, values in case['stages'].items())
+                        print(f"{name}: {stages}  | {case['realtime_factor']}x Echtzeit, "
+                              f"F1 {case['accuracy']['f1']:.3f}")
+                        if args.check_rates:
+                            mismatch = rate_mismatch(wav_path, backend, voices)
+                            if mismatch is not None:
+                                rate_mismatches.append(f"{name}: {mismatch}")
+
+    results['backends'] = backend_summary(results)
+    for backend, entry in results['backends'].items():
+        print(f"{backend}: {entry['throughput']} Audio-Sekunden pro Sekunde, mittlerer F1 {entry['mean_f1']:.3f}")
+    results['peak_rss_mb'] = peak_rss_mb()
+    print(f"Höchster Speicherverbrauch des Prozesses: {results['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Ergebnisse gespeichert unter: {args.output}")
+
+    if args.check_rates:
+        if rate_mismatches:
+            print("Reduzierte und Originalrate liefern verschiedene Noten:")
+            for line in rate_mismatches:
+                print(f"  {line}")
+        else:
+            print("Reduzierte und Originalrate liefern dieselben Noten.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.time_tolerance, args.accuracy_tolerance)
+        if regressions:
+            print("Regressionen gegenüber der Baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Keine Regressionen gegenüber der Baseline.")
+    return 1 if rate_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
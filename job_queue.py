@@ -0,0 +1,239 @@
+"""Auftragswarteschlange für die GUI: mehrere Dateien, begrenzter Worker-Pool, Abbruch und Restzeit pro Auftrag.
+
+Die Worker-Threads fassen Tk nicht an. Sie schreiben Zustand und Fortschritt in die Aufträge,
+die GUI liest sie in ihrem eigenen Takt (siehe sniffer.AudioAnalyzerApp.poll_jobs).
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# Gleichzeitige Analysen (Threads; numpy/scipy geben den GIL während der Tonhöhenerkennung frei).
+# Mehr als vier teilen sich nur die Kerne und verschieben das Ende jedes einzelnen Auftrags
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+STATE_LABELS = {
+    QUEUED: "Wartend",
+    RUNNING: "Läuft",
+    DONE: "Fertig",
+    FAILED: "Fehler",
+    CANCELLED: "Abgebrochen",
+}
+
+
+class JobCancelled(Exception):
+    """Wird im Worker ausgelöst, sobald ein laufender Auftrag abgebrochen wurde"""
+
+
+class AnalysisJob:
+    """Ein Auftrag: Datei, Einstellungen, Zustand, Fortschritt und Ergebnis
+
+    audio_seconds ist die Dauer der Audio-Datei (None, wenn sie sich nicht bestimmen lässt) und
+    dient der Restzeitschätzung für wartende Aufträge. version zählt jede Änderung, damit die
+    GUI nur geänderte Zeilen neu zeichnet.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, path, settings, audio_seconds=None):
+        self.id = f"job{next(self._ids)}"
+        self.path = path
+        self.settings = settings
+        self.audio_seconds = audio_seconds
+        self.state = QUEUED
+        self.progress = 0.0
+        self.remaining = None  # Restzeit laut ProgressEstimate, solange der Auftrag läuft
+        self.error = None
+        self.result = None
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self._cancel = threading.Event()
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def wall(self):
+        """Laufzeit in Sekunden (bis jetzt, falls der Auftrag noch läuft)"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Im Worker aufrufen: bricht einen abgebrochenen Auftrag mit JobCancelled ab"""
+        if self._cancel.is_set():
+            raise JobCancelled(self.path)
+
+    def report(self, progress, remaining=None):
+        """Fortschritt aus dem Worker (Signatur wie der Callback von metrics.ProgressEstimate)"""
+        self.progress = progress
+        self.remaining = remaining
+        self.version += 1
+        self.check_cancelled()
+
+    def _set_state(self, state):
+        self.state = state
+        self.version += 1
+
+
+class JobQueue:
+    """Arbeitet Aufträge der Reihe nach mit höchstens workers Threads ab
+
+    run(job) wird im Worker-Thread aufgerufen, meldet den Fortschritt über job.report und
+    liefert das Ergebnis (in job.result abgelegt). Löst run JobCancelled aus, gilt der Auftrag
+    als abgebrochen, jede andere Ausnahme landet als Fehler in job.error.
+    """
+
+    def __init__(self, run, workers=DEFAULT_WORKERS):
+        self.run = run
+        self.workers = workers
+        self.jobs = []
+        self._pending = deque()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+
+    def submit(self, path, settings, audio_seconds=None):
+        """Stellt eine Datei in die Warteschlange und liefert den Auftrag"""
+        job = AnalysisJob(path, settings, audio_seconds)
+        with self._lock:
+            self.jobs.append(job)
+            self._pending.append(job)
+            # Threads erst bei Bedarf starten, höchstens workers viele
+            if len(self._threads) < min(self.workers, len(self._pending) + self.running_count()):
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._wake.notify()
+        return job
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                job = self._pending.popleft()
+                if job.cancelled:
+                    continue
+                job.started = time.perf_counter()
+                job._set_state(RUNNING)
+
+            try:
+                job.check_cancelled()
+                job.result = self.run(job)
+                state = DONE
+            except JobCancelled:
+                state = CANCELLED
+            except Exception as e:
+                job.error = e
+                state = FAILED
+            job.finished = time.perf_counter()
+            job.remaining = None
+            if state == DONE:
+                job.progress = 1.0
+            job._set_state(state)
+
+    def cancel(self, job):
+        """Bricht einen Auftrag ab; wartende sofort, laufende beim nächsten Fortschritts-Callback"""
+        with self._lock:
+            if job.state in FINISHED_STATES:
+                return
+            job._cancel.set()
+            if job.state == QUEUED:
+                self._pending.remove(job)
+                job._set_state(CANCELLED)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def remove_finished(self):
+        """Entfernt abgeschlossene Aufträge aus der Liste; liefert sie"""
+        with self._lock:
+            finished = [job for job in self.jobs if job.state in FINISHED_STATES]
+            self.jobs = [job for job in self.jobs if job.state not in FINISHED_STATES]
+        return finished
+
+    def close(self):
+        """Bricht alle Aufträge ab und beendet die Worker, sobald sie frei sind"""
+        self.cancel_all()
+        with self._lock:
+            self._closed = True
+            self._wake.notify_all()
+
+    def running_count(self):
+        return sum(job.state == RUNNING for job in self.jobs)
+
+    def is_active(self, path):
+        """Prüft, ob eine Datei gerade wartet oder analysiert wird"""
+        path = os.path.abspath(path)
+        return any(job.state in (QUEUED, RUNNING) and os.path.abspath(job.path) == path for job in self.jobs)
+
+    @property
+    def busy(self):
+        return any(job.state in (QUEUED, RUNNING) for job in self.jobs)
+
+    def throughput(self):
+        """Audio-Sekunden pro Sekunde und Worker, gemessen an fertigen (sonst laufenden) Aufträgen"""
+        finished = [job for job in self.jobs if job.state == DONE and job.audio_seconds]
+        audio = sum(job.audio_seconds for job in finished)
+        wall = sum(job.wall for job in finished)
+        if not finished:
+            # Noch nichts fertig: Hochrechnung aus den laufenden Aufträgen
+            running = [job for job in self.jobs
+                       if job.state == RUNNING and job.audio_seconds and job.progress > 0.05]
+            audio = sum(job.audio_seconds * job.progress for job in running)
+            wall = sum(job.wall for job in running)
+        return audio / wall if wall > 0 and audio > 0 else None
+
+    def estimates(self):
+        """Geschätzte Restzeit bis zum Ende jedes laufenden und wartenden Auftrags (id -> Sekunden oder None)
+
+        Laufende Aufträge nutzen ihre eigene Schätzung. Die wartenden werden in ihrer Reihenfolge
+        jeweils dem Worker zugeteilt, der als erster frei wird; ihre Dauer folgt aus der
+        Audiodauer und dem gemessenen Durchsatz.
+        """
+        with self._lock:
+            running = [job for job in self.jobs if job.state == RUNNING]
+            pending = list(self._pending)
+        rate = self.throughput()
+        estimates = {}
+
+        free_at = []
+        for job in running:
+            remaining = job.remaining
+            if remaining is None and rate and job.audio_seconds:
+                remaining = job.audio_seconds * (1 - job.progress) / rate
+            estimates[job.id] = remaining
+            free_at.append(remaining or 0.0)
+        free_at += [0.0] * max(0, self.workers - len(free_at))
+        heapq.heapify(free_at)
+
+        for job in pending:
+            if job.cancelled:
+                continue
+            if not rate or not job.audio_seconds:
+                estimates[job.id] = None
+                continue
+            end = heapq.heappop(free_at) + job.audio_seconds / rate
+            estimates[job.id] = end
+            heapq.heappush(free_at, end)
+        return estimates
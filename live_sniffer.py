@@ -0,0 +1,309 @@
+"""Echtzeit-Tonhöhenerkennung für Live-Karaoke: Noten-Ereignisse, während gesungen wird.
+
+Das Signal kommt in kleinen Blöcken (Mikrofon oder eine in Echtzeit eingespielte WAV-Datei)
+und wird sofort in Frames zerlegt. Jeder Frame läuft durch dieselbe Tonhöhenerkennung wie bei
+der Datei-Analyse, danach gelten inkrementell die Regeln von analysis.segment_notes: gleitender
+Median über WINDOW_SIZE Frames, Stille unter min_magnitude beendet eine Note, eine Abweichung
+von mehr als PITCH_TOLERANCE Halbtönen vom Notenbeginn startet eine neue. Notenbeginn und
+-ende werden sofort als Ereignis gemeldet.
+
+Beispiele:
+    python live_sniffer.py                                # Mikrofon (benötigt sounddevice)
+    python live_sniffer.py --replay song.wav              # WAV-Datei in Echtzeit einspielen
+    python live_sniffer.py --replay song.wav --fast --compare
+"""
+import argparse
+import queue
+import statistics
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+import analysis
+
+try:
+    import sounddevice as sd
+except ImportError:
+    # Ohne sounddevice ist nur das Einspielen von Dateien möglich
+    sd = None
+
+SAMPLE_RATE = 44100  # Abtastrate des Mikrofons
+BLOCK_SIZE = analysis.HOP_LENGTH  # Samples pro Block (ein Frame pro Block, ca. 12 ms bei 44,1 kHz)
+LATENCY_TARGET = 0.05  # Sekunden vom Erklingen bis zum Ereignis
+
+
+class LiveSniffer:
+    """Inkrementelle Notenerkennung auf einem Strom von Mono-Blöcken
+
+    Die Frames liegen wie bei der Datei-Analyse (center=True, n_fft und hop_length bei der
+    Originalrate); ein Frame wird berechnet, sobald seine letzten Samples eingetroffen sind.
+    Die Verzögerung eines Ereignisses ist damit ein halbes Fenster (n_fft / 2 Samples) plus
+    die Blocklänge plus die Rechenzeit. Die Abtastrate wird hier nicht reduziert, da pro Block
+    nur ein Frame anfällt; die Ergebnisse entsprechen analysis.analyze_file(resample=False).
+
+    on_frame(zeit, frequenz, lautstärke) wird für jeden Frame aufgerufen (z.B. scoring.SingingScore.update),
+    on_event erhält für jedes Ereignis ein Dict mit type ("note_on" oder "note_off"), time,
+    pitch, bei note_off zusätzlich duration und kept, und latency in Sekunden. Ereignisse gibt es
+    nur für Noten im Bereich min_pitch..max_pitch; notes enthält am Ende alle Noten, die auch
+    die Datei-Analyse liefern würde (mindestens min_note_length lang). note_on kommt sofort,
+    bevor die Länge feststeht, daher erhält jede begonnene Note ein note_off; kept ist False
+    für zu kurze Noten, die nicht in notes landen und von Verbrauchern übergangen werden sollten.
+    """
+
+    def __init__(self, sr, on_event=None, on_frame=None, min_note_length=analysis.MIN_NOTE_LENGTH,
+                 min_magnitude=analysis.MIN_MAGNITUDE, min_pitch=analysis.MIN_PITCH, max_pitch=analysis.MAX_PITCH,
+                 backend=analysis.DEFAULT_BACKEND, n_fft=analysis.N_FFT, hop_length=analysis.HOP_LENGTH,
+                 window_size=analysis.WINDOW_SIZE):
+        self.sr = sr
+        self.on_event = on_event
+        self.on_frame = on_frame
+        self.min_note_length = min_note_length
+        self.min_magnitude = min_magnitude
+        self.min_pitch = min_pitch
+        self.max_pitch = max_pitch
+        self.backend = analysis.get_backend(backend, min_pitch, max_pitch)
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+        # Gepuffertes Signal mit n_fft // 2 Nullen davor (wie center=True)
+        self._buffer = np.zeros(n_fft // 2, dtype=np.float32)
+        self._buffer_start = 0  # Position von _buffer[0] im gepolsterten Signal
+        self.frame = 0  # nächster zu berechnender Frame
+        self.received = 0  # bisher empfangene Samples
+        self._arrival = None  # Zeitpunkt (monotonic), an dem der letzte Block eintraf
+
+        # Die letzten Frames für den gleitenden Median
+        self._freqs = deque(maxlen=window_size)
+        self._mags = deque(maxlen=window_size)
+        self._note = None  # laufende Note: (Startzeit, MIDI-Wert des Beginns)
+
+        self.notes = []
+        self.events = []
+        self.latencies = []
+        self.processing = 0.0  # Rechenzeit in Sekunden
+
+    def feed(self, samples, arrival=None):
+        """Verarbeitet einen Block Mono-Samples (float32); arrival ist der Eingangszeitpunkt"""
+        started = time.perf_counter()
+        self._arrival = time.monotonic() if arrival is None else arrival
+        samples = np.asarray(samples, dtype=np.float32)
+        self.received += len(samples)
+        self._buffer = np.concatenate((self._buffer, samples))
+        self._process(self._complete_frames())
+        self.processing += time.perf_counter() - started
+
+    def finish(self):
+        """Schließt den Strom ab: letzte Frames wie am Dateiende mit Nullen auffüllen, Note beenden"""
+        started = time.perf_counter()
+        self._buffer = np.concatenate((self._buffer, np.zeros(self.n_fft // 2, dtype=np.float32)))
+        self._process(analysis.count_frames(self.received, self.hop_length))
+        if self._note is not None:
+            self._end_note(self._frame_time(self.frame - 1))
+        self.processing += time.perf_counter() - started
+        return self.notes
+
+    def _complete_frames(self):
+        """Anzahl der Frames, deren Samples vollständig im Puffer liegen"""
+        available = self._buffer_start + len(self._buffer)
+        return max(self.frame, (available - self.n_fft) // self.hop_length + 1)
+
+    def _frame_time(self, frame):
+        return frame * self.hop_length / self.sr
+
+    def _process(self, end_frame):
+        if end_frame <= self.frame:
+            return
+        offset = self.frame * self.hop_length - self._buffer_start
+        needed = (end_frame - 1) * self.hop_length + self.n_fft - self._buffer_start
+        freqs, mags = self.backend.track(self._buffer[offset:needed], self.sr, self.n_fft, self.hop_length)
+
+        for frame, freq, mag in zip(range(self.frame, end_frame), freqs, mags):
+            if self.on_frame is not None:
+                self.on_frame(self._frame_time(frame), float(freq), float(mag))
+            self._freqs.append(freq)
+            self._mags.append(mag)
+            if len(self._freqs) == self._freqs.maxlen:
+                self._segment(self._frame_time(frame))
+
+        # Verarbeitete Samples verwerfen
+        consumed = end_frame * self.hop_length - self._buffer_start
+        self._buffer = self._buffer[consumed:]
+        self._buffer_start += consumed
+        self.frame = end_frame
+
+    def _segment(self, frame_time):
+        """Ein Schritt von analysis.segment_notes für den Median der letzten Frames"""
+        avg_freq = _median(self._freqs)
+        avg_mag = _median(self._mags)
+        voiced = not (avg_freq <= 0 or avg_mag < self.min_magnitude)
+
+        if not voiced:
+            if self._note is not None:
+                self._end_note(frame_time)
+            return
+
+        midi = float(analysis.hz_to_midi(avg_freq))
+        if self._note is not None and abs(midi - self._note[1]) > analysis.PITCH_TOLERANCE:
+            self._end_note(frame_time)
+        if self._note is None:
+            self._note = (frame_time, midi)
+            if self._in_range(midi):
+                self._emit({'type': "note_on", 'time': frame_time, 'pitch': int(round(midi))})
+
+    def _end_note(self, end_time):
+        start_time, midi = self._note
+        self._note = None
+        if not self._in_range(midi):
+            return
+        duration = end_time - start_time
+        pitch = int(round(midi))
+        kept = duration >= self.min_note_length
+        self._emit({'type': "note_off", 'time': end_time, 'pitch': pitch, 'duration': duration, 'kept': kept})
+        if kept:
+            self.notes.append({'time': start_time, 'pitch': pitch, 'duration': duration})
+
+    def _in_range(self, midi):
+        return self.min_pitch <= midi <= self.max_pitch
+
+    def _emit(self, event):
+        # Verzögerung seit dem Erklingen: wie lange der Zeitpunkt des Ereignisses vor dem Ende des
+        # letzten Blocks liegt, plus die Zeit seit dessen Eingang
+        event['latency'] = (self.received / self.sr - event['time']) + (time.monotonic() - self._arrival)
+        self.latencies.append(event['latency'])
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def report(self):
+        """Kurze Auswertung von Verzögerung und Rechenlast"""
+        audio_seconds = self.received / self.sr
+        lines = [f"{len(self.notes)} Noten, {len(self.events)} Ereignisse in {audio_seconds:.1f}s Audio"]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            lines.append(f"Verzögerung: Median {statistics.median(latencies) * 1000:.1f} ms, "
+                         f"95 % {p95 * 1000:.1f} ms, max. {latencies[-1] * 1000:.1f} ms "
+                         f"(Ziel < {LATENCY_TARGET * 1000:.0f} ms)")
+        if audio_seconds > 0:
+            lines.append(f"Rechenzeit: {self.processing / audio_seconds:.1%} der Echtzeit")
+        return "\n".join(lines)
+
+
+def _median(values):
+    """Median weniger float32-Werte, gleiches Ergebnis wie np.median, ohne dessen Aufrufkosten"""
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / np.float32(2)
+
+
+def replay_blocks(path, block_size=BLOCK_SIZE, realtime=True):
+    """Spielt eine Audio-Datei blockweise ein (Ersatz für ein Mikrofon); liefert (Block, Eingangszeit)
+
+    Mit realtime kommt jeder Block erst, wenn er bei Echtzeit-Wiedergabe vollständig
+    aufgenommen wäre, sonst so schnell wie möglich.
+    """
+    import soundfile as sf
+
+    sr = sf.info(path).samplerate
+    started = time.monotonic()
+    position = 0
+    for block in sf.blocks(path, blocksize=block_size, dtype='float32', always_2d=True):
+        # Downmix wie analysis (Mittelwert über die Kanäle)
+        samples = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+        position += len(samples)
+        if realtime:
+            delay = started + position / sr - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield samples, time.monotonic()
+
+
+def microphone_blocks(sr=SAMPLE_RATE, block_size=BLOCK_SIZE, device=None):
+    """Liefert Mono-Blöcke vom Mikrofon als (Block, Eingangszeit), bis Strg+C gedrückt wird"""
+    if sd is None:
+        raise RuntimeError("Die Aufnahme benötigt sounddevice. Installiere es mit: pip install sounddevice")
+
+    blocks = queue.Queue()
+
+    def callback(indata, frames, time_info, status):
+        blocks.put((indata[:, 0].copy(), time.monotonic()))
+
+    with sd.InputStream(samplerate=sr, blocksize=block_size, channels=1, dtype='float32', device=device,
+                        latency='low', callback=callback):
+        try:
+            while True:
+                yield blocks.get()
+        except KeyboardInterrupt:
+            return
+
+
+def print_event(event):
+    if event['type'] == "note_on":
+        print(f"{event['time']:8.2f}s  + Note {event['pitch']:3d}                  "
+              f"({event['latency'] * 1000:.0f} ms)")
+    else:
+        print(f"{event['time']:8.2f}s  - Note {event['pitch']:3d} nach {event['duration']:.2f}s "
+              f"({event['latency'] * 1000:.0f} ms){'' if event['kept'] else ' (verworfen, zu kurz)'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Erkennt Noten in Echtzeit vom Mikrofon oder aus einer WAV-Datei")
+    parser.add_argument("--replay", help="Audio-Datei in Echtzeit einspielen statt vom Mikrofon aufzunehmen")
+    parser.add_argument("--fast", action="store_true", help="Beim Einspielen nicht auf Echtzeit warten")
+    parser.add_argument("--compare", action="store_true",
+                        help="Beim Einspielen mit der Datei-Analyse vergleichen (analyze_file mit Originalrate)")
+    parser.add_argument("--device", help="Aufnahmegerät (siehe python -m sounddevice)")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, help="Abtastrate des Mikrofons")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Samples pro Block")
+    parser.add_argument("--backend", choices=list(analysis.BACKENDS), default=analysis.DEFAULT_BACKEND,
+                        help="Verfahren der Tonhöhenerkennung")
+    parser.add_argument("--min-note-length", type=float, default=analysis.MIN_NOTE_LENGTH,
+                        help="Minimale Notendauer in Sekunden (für die gespeicherten Noten)")
+    parser.add_argument("--min-magnitude", type=float, default=analysis.MIN_MAGNITUDE,
+                        help="Minimale Lautstärke für eine gültige Note")
+    parser.add_argument("-o", "--output", help="Erkannte Noten als Notendatei (JSON) speichern")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Ereignisse nicht einzeln ausgeben")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        import soundfile as sf
+
+        sr = sf.info(args.replay).samplerate
+        blocks = replay_blocks(args.replay, args.block_size, realtime=not args.fast)
+    else:
+        sr = args.sample_rate
+        blocks = microphone_blocks(sr, args.block_size, args.device)
+        print("Aufnahme läuft, beenden mit Strg+C")
+
+    sniffer = LiveSniffer(sr, on_event=None if args.quiet else print_event,
+                          min_note_length=args.min_note_length, min_magnitude=args.min_magnitude,
+                          backend=args.backend)
+    try:
+        for samples, arrival in blocks:
+            sniffer.feed(samples, arrival)
+    except RuntimeError as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 1
+    notes = sniffer.finish()
+    print(sniffer.report())
+
+    if args.output:
+        analysis.save_notes(args.output, analysis.format_notes(notes))
+        print(f"Noten gespeichert unter: {args.output}")
+
+    if args.compare and args.replay:
+        offline, _ = analysis.analyze_file(args.replay, min_note_length=args.min_note_length,
+                                           min_magnitude=args.min_magnitude, backend=args.backend, resample=False)
+        same = analysis.format_notes(notes) == offline
+        print("Vergleich mit der Datei-Analyse: " + ("identisch" if same else
+              f"abweichend ({len(notes)} statt {len(offline['notes'])} Noten)"))
+        return 0 if same else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
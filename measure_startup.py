@@ -0,0 +1,70 @@
+"""Misst die Startzeit von sniffer.py, um Regressionen durch schwere Importe zu erkennen.
+
+Beispiel:
+    python measure_startup.py --runs 5 --max-seconds 1.0
+
+Gemessen wird jeweils in einem frischen Interpreter:
+- Import: Zeit für "import sniffer" (funktioniert auch ohne Display)
+- Fenster: Gesamtzeit von "python sniffer.py --startup-time" bis das Fenster gezeichnet ist
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import sniffer; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import():
+    """Importzeit des Moduls sniffer in Sekunden"""
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=HERE,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_window():
+    """Zeit vom Prozessstart bis zum gezeichneten Fenster in Sekunden; None ohne Display"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "sniffer.py", "--startup-time"], cwd=HERE,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0 or "Fenster nach" not in result.stdout:
+        return None
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Misst die Startzeit von sniffer.py")
+    parser.add_argument("--runs", type=int, default=5, help="Anzahl der Messungen (Median wird verwendet)")
+    parser.add_argument("--max-seconds", type=float,
+                        help="Grenzwert für die Startzeit; bei Überschreitung Exit-Code 1")
+    args = parser.parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.runs)]
+    windows = [measure_window() for _ in range(args.runs)]
+
+    import_time = statistics.median(imports)
+    print(f"Import von sniffer:      {import_time:.3f}s (Median aus {args.runs})")
+
+    if None in windows:
+        print("Fenster:                 nicht messbar (kein Display oder Fehler beim Start)")
+        startup = import_time
+    else:
+        startup = statistics.median(windows)
+        print(f"Prozessstart bis Fenster: {startup:.3f}s (Median aus {args.runs})")
+
+    if args.max_seconds is not None and startup > args.max_seconds:
+        print(f"Startzeit über dem Grenzwert von {args.max_seconds:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
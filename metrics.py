@@ -0,0 +1,135 @@
+"""Laufzeit-, CPU- und Speichermessung der einzelnen Analyse-Stufen."""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Nicht verfügbar unter Windows, dort fehlen die Speicherwerte und die CPU-Zeit der Worker
+    resource = None
+
+
+def peak_rss_mb():
+    """Höchster Speicherverbrauch des Prozesses bisher in MB (None, wenn nicht messbar)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux meldet KB, macOS Bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def cpu_time():
+    """CPU-Zeit dieses Prozesses einschließlich beendeter Worker-Prozesse in Sekunden"""
+    total = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        total += children.ru_utime + children.ru_stime
+    return total
+
+
+class PipelineMetrics:
+    """Sammelt Laufzeit, CPU-Zeit und Speicher-Spitzenwert pro Stufe einer Analyse.
+
+    Stufen, die mehrfach betreten werden (z.B. Dekodieren und Tonhöhenerkennung im blockweisen Modus),
+    werden aufsummiert. Die CPU-Zeit ist prozessweit gemessen und enthält daher auch
+    Hintergrund-Threads wie das vorausschauende Dekodieren.
+
+    Laufen mehrere Analysen als Threads im selben Prozess (Warteschlange der GUI), würde die
+    prozessweite Messung die anderen Aufträge mitzählen. Mit thread_scope wird daher nur die
+    CPU-Zeit des aufrufenden Threads gemessen (ohne Read-Ahead-Thread und Worker-Prozesse), und
+    der Speicher-Spitzenwert erscheint nur einmal als process_peak_rss_mb, ausdrücklich für den
+    ganzen Prozess.
+    """
+
+    def __init__(self, thread_scope=False, **info):
+        self.info = info
+        self.thread_scope = thread_scope
+        self._cpu_time = time.thread_time if thread_scope else cpu_time
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._cpu_started = self._cpu_time()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = self._cpu_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak_rss_mb': None, 'calls': 0})
+            entry['wall'] += time.perf_counter() - wall
+            entry['cpu'] += self._cpu_time() - cpu
+            if not self.thread_scope:
+                entry['peak_rss_mb'] = peak_rss_mb()
+            entry['calls'] += 1
+
+    def to_dict(self):
+        stages = {name: {'wall': round(entry['wall'], 4), 'cpu': round(entry['cpu'], 4),
+                         'peak_rss_mb': entry['peak_rss_mb'], 'calls': entry['calls']}
+                  for name, entry in self.stages.items()}
+        if self.thread_scope:
+            for entry in stages.values():
+                del entry['peak_rss_mb']
+            memory = {'cpu_scope': "thread", 'process_peak_rss_mb': peak_rss_mb()}
+        else:
+            memory = {'peak_rss_mb': peak_rss_mb()}
+        return dict(self.info,
+                    stages=stages,
+                    total_wall=round(time.perf_counter() - self._started, 4),
+                    total_cpu=round(self._cpu_time() - self._cpu_started, 4),
+                    **memory)
+
+    def summary(self):
+        """Einzeilige Übersicht, z.B. für die Statuszeile"""
+        return ", ".join(f"{name} {entry['wall']:.2f}s" for name, entry in self.stages.items())
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+# Geschätzter Anteil der Stufen an der Gesamtdauer (gemessen mit benchmark.py: Dekodieren und
+# Tonhöhenerkennung zusammen brauchen über 90 % der Zeit)
+PROGRESS_WEIGHTS = (("track", 0.92), ("extract_notes", 0.04), ("format_notes", 0.02), ("json_write", 0.02))
+
+
+class ProgressEstimate:
+    """Rechnet den Fortschritt einzelner Stufen in einen Gesamtfortschritt mit Restzeit um
+
+    callback(fortschritt, restzeit) erhält den Gesamtfortschritt zwischen 0 und 1 und die
+    geschätzte Restzeit in Sekunden (None, solange noch keine Schätzung möglich ist).
+    """
+
+    def __init__(self, callback, weights=PROGRESS_WEIGHTS):
+        self.callback = callback
+        self.offsets = {}
+        self.weights = dict(weights)
+        offset = 0.0
+        for name, weight in weights:
+            self.offsets[name] = offset
+            offset += weight
+        self._started = time.perf_counter()
+
+    def update(self, stage, fraction=1.0):
+        done = min(1.0, self.offsets[stage] + self.weights[stage] * fraction)
+        elapsed = time.perf_counter() - self._started
+        remaining = elapsed / done * (1 - done) if done > 0.01 else None
+        self.callback(done, remaining)
+
+
+@contextmanager
+def optional_stage(metrics, name):
+    """Wie PipelineMetrics.stage, ohne Messung, wenn metrics None ist"""
+    if metrics is None:
+        yield
+    else:
+        with metrics.stage(name):
+            yield
+
+
+def metrics_path(audio_path):
+    """Pfad der Messwerte, die neben der Notendatei gespeichert werden"""
+    return os.path.splitext(audio_path)[0] + "_metrics.json"
@@ -0,0 +1,109 @@
+"""Blockweiser Mixer mit fester Stimmenanzahl für einen einzigen, durchgehenden Audio-Stream."""
+from collections import deque
+
+import numpy as np
+
+import synth
+
+MAX_VOICES = 32
+BLOCK_SIZE = 256  # Samples pro Block (~6 ms bei 44,1 kHz)
+
+
+class VoiceMixer:
+    """Mischt Noten in Blöcken fester Größe für einen Callback-Stream.
+
+    Die Stimmen liegen als Arrays vor (Tonhöhe, Länge, Startsample), ein Block wird für
+    alle aktiven Stimmen gemeinsam berechnet. Sind alle Stimmen belegt, wird die Stimme
+    mit der kürzesten Restdauer übernommen (Voice Stealing). note_on darf aus einem
+    anderen Thread aufgerufen werden als render: neue Noten werden über eine Queue
+    erst zu Beginn des nächsten Blocks übernommen.
+    """
+
+    def __init__(self, sample_rate=synth.SAMPLE_RATE, max_voices=MAX_VOICES, volume=synth.VOLUME):
+        self.sample_rate = sample_rate
+        self.max_voices = max_voices
+        self.volume = volume
+
+        self.active = np.zeros(max_voices, dtype=bool)
+        self.freqs = np.zeros(max_voices)
+        self.lengths = np.zeros(max_voices, dtype=np.int64)
+        self.starts = np.zeros(max_voices, dtype=np.int64)  # Absolutes Startsample der Stimme
+
+        self.sample_clock = 0  # Anzahl bereits gerenderter Samples
+        self.stolen = 0
+        self._pending = deque()
+
+        # Messung der Einsatzgenauigkeit: zu spät eingeplante Noten beginnen am Blockanfang
+        self.onsets = 0
+        self.late_onsets = 0
+        self.max_lateness = 0  # in Samples
+
+    def note_on(self, pitch, duration, start_sample=None):
+        """Plant eine Note; ohne start_sample beginnt sie mit dem nächsten Block"""
+        self._pending.append((pitch, duration, start_sample))
+
+    def _allocate(self, pitch, duration, start_sample, block_start):
+        free = np.flatnonzero(~self.active)
+        if len(free):
+            voice = free[0]
+        else:
+            # Stimme mit der kürzesten Restdauer übernehmen
+            remaining = self.starts + self.lengths - block_start
+            voice = int(np.argmin(remaining))
+            self.stolen += 1
+
+        self.onsets += 1
+        if start_sample is None:
+            start_sample = block_start
+        elif start_sample < block_start:
+            # Zu spät eingeplant: sofort beginnen statt mitten in der Note einzusetzen
+            self.late_onsets += 1
+            self.max_lateness = max(self.max_lateness, block_start - start_sample)
+            start_sample = block_start
+
+        self.active[voice] = True
+        self.freqs[voice] = synth.midi_to_freq(pitch)
+        self.lengths[voice] = int(duration * self.sample_rate)
+        self.starts[voice] = start_sample
+
+    def render(self, frames):
+        """Berechnet den nächsten Block mit frames Samples (float32, mono)"""
+        block_start = self.sample_clock
+        while self._pending:
+            self._allocate(*self._pending.popleft(), block_start)
+
+        out = np.zeros(frames, dtype=np.float32)
+        voices = np.flatnonzero(self.active)
+        if len(voices):
+            # Position jeder Stimme innerhalb ihrer Note für alle Samples des Blocks
+            index = (block_start - self.starts[voices])[:, None] + np.arange(frames)
+            lengths = self.lengths[voices][:, None]
+            audible = (index >= 0) & (index < lengths)
+
+            # Lineares Fade-in/out über je 10% der Notenlänge (wie synth.sine_tone)
+            fade = np.maximum((lengths * synth.FADE_FRACTION).astype(np.int64) - 1, 1)
+            envelope = np.clip(np.minimum(index, lengths - 1 - index) / fade, 0.0, 1.0)
+
+            tones = np.sin(2 * np.pi * self.freqs[voices][:, None] * index / self.sample_rate)
+            out[:] = np.sum(tones * envelope * audible, axis=0) * self.volume
+
+            # Beendete Stimmen freigeben
+            finished = block_start + frames >= self.starts[voices] + self.lengths[voices]
+            self.active[voices[finished]] = False
+
+        self.sample_clock += frames
+        np.clip(out, -1.0, 1.0, out=out)
+        return out
+
+    @property
+    def active_voices(self):
+        return int(np.count_nonzero(self.active))
+
+    @property
+    def busy(self):
+        """True, solange Stimmen klingen oder Noten auf ihren Start warten"""
+        return bool(self._pending) or bool(self.active.any())
+
+    def callback(self, outdata, frames, time_info, status):
+        """Callback für sounddevice.OutputStream"""
+        outdata[:] = self.render(frames)[:, None]
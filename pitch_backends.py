@@ -0,0 +1,333 @@
+"""Austauschbare Verfahren zur Tonhöhenerkennung für analysis.py.
+
+Jedes Verfahren liefert für ein Signalstück die Frequenz und eine Lautstärke pro Frame. Die
+Frames liegen wie bei librosa mit center=False: Frame k beginnt bei k * hop_length und ist
+n_fft Samples lang. Stimmlose Frames haben die Frequenz 0. Die Lautstärke ist so skaliert,
+dass ein reiner Sinuston etwa denselben Wert wie bei piptrack erreicht, damit min_magnitude
+für alle Verfahren gleich bleibt.
+
+Verfahren mit decimate = True vertragen die reduzierte Analyse-Abtastrate (siehe
+analysis.decimation_factor) ohne Änderung der Noten. Bisher gilt das nur für piptrack: die
+Bins liegen bei verkleinertem n_fft auf denselben Frequenzen. YIN und pYIN messen die Periode
+in Samples, bei reduzierter Rate wird sie gröber und die Noten weichen ab.
+
+Mehrstimmige Verfahren (polyphonic = True, bisher nur piptrack) liefern mit voices > 1 statt
+eines Werts pro Frame je voices Spalten, nach Lautstärke absteigend; freie Stimmen haben die
+Frequenz und Lautstärke 0.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_BACKEND = "piptrack"
+
+# Parameter von piptrack (Standardwerte von librosa.piptrack)
+PIPTRACK_FMIN = 150.0
+PIPTRACK_FMAX = 4000.0
+PIPTRACK_THRESHOLD = 0.1  # Spitzen unter diesem Anteil des Frame-Maximums werden ignoriert
+
+# Rand um den Tonhöhenbereich in Halbtönen, damit Noten an den Bereichsgrenzen erkannt werden
+BAND_MARGIN = 1
+
+# Schwellwerte der YIN-Implementierung
+YIN_THRESHOLD = 0.1  # erstes Minimum der normierten Differenzfunktion unter diesem Wert
+YIN_MAX_APERIODICITY = 0.3  # sonst: globales Minimum, falls darunter, ansonsten stimmlos
+
+# Mehrstimmige Erkennung
+MAX_VOICES = 8
+PEAK_CANDIDATES = 3  # Kandidaten pro Stimme, aus denen die Obertöne aussortiert werden
+HARMONIC_CENTS = 50  # Abweichung vom ganzzahligen Vielfachen einer tieferen Spitze, ab der kein Oberton mehr vorliegt
+HARMONIC_MIN_RATIO = 0.1  # ... und Mindestlautstärke dieser tieferen Spitze relativ zum Oberton
+
+
+def midi_to_hz(midi):
+    return 440.0 * 2 ** ((np.asarray(midi, dtype=np.float64) - 69) / 12)
+
+
+def dominant_track(pitches, magnitudes):
+    """Reduziert die piptrack-Matrizen auf die dominante Tonhöhe und Lautstärke pro Frame"""
+    index = magnitudes.argmax(axis=0)
+    frames = np.arange(magnitudes.shape[1])
+    return pitches[index, frames], magnitudes[index, frames]
+
+
+def frame_signal(y, n_fft, hop_length):
+    """Frames eines Signals ohne Kopie (center=False)"""
+    if len(y) < n_fft:
+        return np.zeros((0, n_fft), dtype=y.dtype)
+    return np.lib.stride_tricks.sliding_window_view(y, n_fft)[::hop_length]
+
+
+def frame_magnitude(frames):
+    """Lautstärke pro Frame, skaliert wie der Spitzenwert eines Sinustons bei piptrack (Hann-Fenster)"""
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return (rms * np.sqrt(2) * frames.shape[1] / 4).astype(np.float32)
+
+
+class PitchBackend:
+    """Schnittstelle der Verfahren; name und params bestimmen den Schlüssel im Tonhöhen-Cache"""
+
+    name = ""
+    description = ""
+    polyphonic = False
+    decimate = False
+    voices = 1
+
+    def __init__(self, min_pitch, max_pitch):
+        self.min_pitch = min_pitch
+        self.max_pitch = max_pitch
+
+    @property
+    def params(self):
+        return {}
+
+    def track(self, y, sr, n_fft, hop_length):
+        """Liefert (Frequenzen, Lautstärken) für alle vollständigen Frames von y"""
+        raise NotImplementedError
+
+
+@lru_cache(maxsize=8)
+def hann_window(n_fft):
+    """Periodisches Hann-Fenster wie bei librosa.stft (zwischengespeichert, auch für einzelne Frames)"""
+    from scipy import signal
+
+    window = signal.get_window('hann', n_fft).astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+def band_bins(sr, n_fft, fmin, fmax):
+    """Erster und letzter (exklusiv) FFT-Bin mit fmin <= Frequenz < fmax"""
+    first = max(1, int(np.ceil(fmin * n_fft / sr)))
+    last = min(n_fft // 2, int(np.ceil(fmax * n_fft / sr)))
+    return first, max(first, last)
+
+
+class PiptrackBackend(PitchBackend):
+    """Bisheriges Verfahren: piptrack und die lauteste Spitze pro Frame
+
+    Rechnet wie librosa.piptrack (Hann-Fenster, lokale Maxima über dem Schwellwert, parabolische
+    Interpolation), aber nur auf den Bins des Tonhöhenbereichs min_pitch..max_pitch zuzüglich
+    BAND_MARGIN und innerhalb der piptrack-Grenzen fmin/fmax. Die Pitch- und Lautstärkematrizen
+    über das ganze Spektrum entfallen, Speicher und Rechenzeit hängen nur von der Bandbreite ab.
+
+    Mit voices > 1 liefert es die voices lautesten Spitzen pro Frame (siehe strongest_peaks).
+    """
+
+    name = "piptrack"
+    description = "piptrack (bisheriges Verfahren)"
+    polyphonic = True
+    decimate = True
+
+    def __init__(self, min_pitch, max_pitch, voices=1):
+        super().__init__(min_pitch, max_pitch)
+        self.voices = voices
+
+    @property
+    def params(self):
+        params = {'fmin': self.fmin, 'fmax': self.fmax}
+        # Einstimmig ohne voices, damit bestehende Cache-Einträge gültig bleiben
+        if self.voices > 1:
+            params['voices'] = self.voices
+        return params
+
+    @property
+    def fmin(self):
+        return max(PIPTRACK_FMIN, float(midi_to_hz(self.min_pitch - BAND_MARGIN)))
+
+    @property
+    def fmax(self):
+        return min(PIPTRACK_FMAX, float(midi_to_hz(self.max_pitch + BAND_MARGIN)))
+
+    def track(self, y, sr, n_fft, hop_length):
+        from scipy import fft
+
+        frames = frame_signal(np.asarray(y, dtype=np.float32), n_fft, hop_length)
+        n_frames = len(frames)
+        first, last = band_bins(sr, n_fft, self.fmin, min(self.fmax, sr / 2))
+        if n_frames == 0 or first == last:
+            shape = n_frames if self.voices == 1 else (n_frames, self.voices)
+            return np.zeros(shape, dtype=np.float32), np.zeros(shape, dtype=np.float32)
+
+        # Betragsspektrum nur für das Band und je einen Nachbar-Bin auf beiden Seiten
+        spectrum = fft.rfft(frames * hann_window(n_fft), axis=1)[:, first - 1:last + 1]
+        S = np.abs(spectrum)
+        center, left, right = S[:, 1:-1], S[:, :-2], S[:, 2:]
+
+        # Lokale Maxima über PIPTRACK_THRESHOLD * Maximum des Frames (hier: Maximum im Band)
+        thresholded = S * (S > PIPTRACK_THRESHOLD * S.max(axis=1, keepdims=True))
+        peaks = (thresholded[:, 1:-1] > thresholded[:, :-2]) & (thresholded[:, 1:-1] >= thresholded[:, 2:])
+
+        # Parabolische Interpolation der Spitzen (wie librosa: keine Verschiebung um mehr als einen Bin)
+        curvature = right + left - 2 * center
+        slope = (right - left) / 2
+        valid = np.abs(slope) < np.abs(curvature)
+        shift = np.where(valid, -slope / np.where(valid, curvature, 1), 0)
+        mags = np.where(peaks, center + 0.5 * slope * shift, 0)
+        if self.voices > 1:
+            return self.strongest_peaks(mags, (first + np.arange(mags.shape[1]) + shift) * sr / n_fft)
+
+        # Lauteste Spitze pro Frame; ohne Spitze Frequenz und Lautstärke 0
+        rows = np.arange(n_frames)
+        index = mags.argmax(axis=1)
+        has_peak = peaks[rows, index]
+        freqs = np.where(has_peak, (first + index + shift[rows, index]) * sr / n_fft, 0)
+        return freqs.astype(np.float32), mags[rows, index].astype(np.float32)
+
+    def strongest_peaks(self, mags, peak_freqs):
+        """Die voices lautesten Spitzen pro Frame, ohne Obertöne tieferer Spitzen
+
+        mags enthält die Lautstärke jeder Spitze (0 außerhalb der Spitzen), peak_freqs die
+        interpolierte Frequenz jedes Bins. Alle Schritte laufen über alle Frames gemeinsam:
+        eine Teilauswahl der lautesten Kandidaten, ein Vergleich aller Kandidatenpaare auf
+        ganzzahlige Frequenzverhältnisse und eine zweite Auswahl unter den übrigen.
+        """
+        n_frames, n_bins = mags.shape
+        rows = np.arange(n_frames)[:, None]
+
+        # Kandidaten: die lautesten Bins jedes Frames (ungeordnet)
+        count = min(n_bins, self.voices * PEAK_CANDIDATES)
+        candidates = np.argpartition(-mags, count - 1, axis=1)[:, :count]
+        cand_mags = mags[rows, candidates]
+        cand_freqs = np.where(cand_mags > 0, peak_freqs[rows, candidates], 0)
+
+        # Oberton: Frequenz nahe dem n-fachen (n >= 2) einer tieferen Spitze, die nicht viel leiser ist.
+        # ratio[f, i, j] = Frequenz von Kandidat i / Frequenz von Kandidat j (0, falls einer fehlt)
+        ratio = cand_freqs[:, :, None] / np.where(cand_freqs > 0, cand_freqs, np.inf)[:, None, :]
+        harmonic = np.round(ratio)
+        multiple = harmonic >= 2
+        cents = 1200 * np.abs(np.log2(np.where(multiple, ratio / np.maximum(harmonic, 1), 1)))
+        overtone = multiple & (cents < HARMONIC_CENTS) & (cand_mags[:, None, :] >= HARMONIC_MIN_RATIO * cand_mags[:, :, None])
+        cand_mags = np.where(overtone.any(axis=2), 0, cand_mags)
+
+        # Die lautesten übrigen Spitzen, nach Lautstärke absteigend; fehlende Stimmen bleiben 0
+        order = np.argsort(-cand_mags, axis=1, kind='stable')[:, :self.voices]
+        freqs = np.zeros((n_frames, self.voices), dtype=np.float32)
+        voice_mags = np.zeros((n_frames, self.voices), dtype=np.float32)
+        voice_mags[:, :order.shape[1]] = cand_mags[rows, order]
+        freqs[:, :order.shape[1]] = np.where(voice_mags[:, :order.shape[1]] > 0, cand_freqs[rows, order], 0)
+        return freqs, voice_mags
+
+
+class YinBackend(PitchBackend):
+    """Schnelles YIN in NumPy, auf den Tonhöhenbereich min_pitch..max_pitch beschränkt
+
+    Die Differenzfunktion wird für alle Frames eines Blocks gemeinsam über die FFT-Autokorrelation
+    berechnet, und zwar nur für die Perioden des gewünschten Bereichs.
+    """
+
+    name = "yin"
+    description = "YIN (schnell)"
+
+    @property
+    def params(self):
+        return {'min_pitch': self.min_pitch, 'max_pitch': self.max_pitch}
+
+    def track(self, y, sr, n_fft, hop_length):
+        # scipy (Abhängigkeit von librosa) rechnet die FFT in float32 deutlich schneller als numpy
+        from scipy import fft
+
+        y = np.asarray(y, dtype=np.float32)
+        frames = frame_signal(y, n_fft, hop_length)
+        n_frames = len(frames)
+        if n_frames == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        # Perioden (in Samples) des gewünschten Bereichs, mit einem Sample Rand für die Interpolation
+        tau_min = max(2, int(sr / midi_to_hz(self.max_pitch)) - 1)
+        tau_max = min(n_fft // 2, int(np.ceil(sr / midi_to_hz(self.min_pitch))) + 1)
+        window = n_fft - tau_max
+
+        # Autokorrelation des ersten Fensters mit dem ganzen Frame: acf[tau] = sum(x[j] * x[j + tau]).
+        # Für tau <= tau_max reicht eine FFT der Framelänge, da j + tau nie über das Frameende hinausläuft
+        spectrum = fft.rfft(frames, axis=1)
+        head = fft.rfft(frames[:, :window], n_fft, axis=1)
+        acf = fft.irfft(spectrum * np.conj(head), n_fft, axis=1)[:, :tau_max + 1]
+
+        # Differenzfunktion d(tau) = Energie(Fenster) + Energie(verschobenes Fenster) - 2 acf(tau),
+        # die Energien aller Fenster kommen aus einer kumulierten Summe über das ganze Signal
+        cumulative_energy = np.concatenate(([0.0], np.cumsum(np.square(y, dtype=np.float64))))
+        starts = np.arange(n_frames) * hop_length
+        taus = np.arange(tau_max + 1)
+        positions = starts[:, None] + taus
+        shifted = cumulative_energy[positions + window] - cumulative_energy[positions]
+        first = (cumulative_energy[starts + window] - cumulative_energy[starts])[:, None]
+        diff = np.maximum(first + shifted - 2 * acf, 0.0)
+
+        # Kumulativ normierte Differenzfunktion
+        cumulative = np.cumsum(diff[:, 1:], axis=1)
+        cmnd = np.ones_like(diff)
+        cmnd[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(cumulative, 1e-12)
+
+        band = cmnd[:, tau_min:tau_max]
+        # Erstes lokales Minimum unter dem Schwellwert, sonst das globale Minimum im Bereich
+        trough = np.zeros(band.shape, dtype=bool)
+        trough[:, 1:-1] = (band[:, 1:-1] <= band[:, :-2]) & (band[:, 1:-1] <= band[:, 2:])
+        candidates = trough & (band < YIN_THRESHOLD)
+        has_candidate = candidates.any(axis=1)
+        best = np.where(has_candidate, candidates.argmax(axis=1), band.argmin(axis=1))
+        rows = np.arange(n_frames)
+        aperiodicity = band[rows, best]
+        total_energy = cumulative_energy[starts + n_fft] - cumulative_energy[starts]
+        voiced = (has_candidate | (aperiodicity < YIN_MAX_APERIODICITY)) & (total_energy > 1e-8)
+
+        # Parabolische Interpolation um das Minimum für Perioden mit Sub-Sample-Genauigkeit
+        tau = best + tau_min
+        left = cmnd[rows, tau - 1]
+        center = cmnd[rows, tau]
+        right = cmnd[rows, np.minimum(tau + 1, tau_max)]
+        curvature = left - 2 * center + right
+        safe = np.abs(curvature) > 1e-12
+        shift = np.where(safe, 0.5 * (left - right) / np.where(safe, curvature, 1.0), 0.0)
+        period = tau + np.clip(shift, -1, 1)
+
+        freqs = np.where(voiced, sr / period, 0.0).astype(np.float32)
+        # Lautstärke aus der Energie des Frames (siehe frame_magnitude)
+        mags = (np.sqrt(np.maximum(total_energy, 0) / n_fft) * np.sqrt(2) * n_fft / 4).astype(np.float32)
+        return freqs, mags
+
+
+class PyinBackend(PitchBackend):
+    """pYIN aus librosa: am genauesten, aber deutlich langsamer
+
+    Die Viterbi-Glättung läuft pro Analyseblock, an Blockgrenzen kann sie daher minimal
+    von einer Analyse der ganzen Datei abweichen.
+    """
+
+    name = "pyin"
+    description = "pYIN (genau, langsam)"
+
+    @property
+    def params(self):
+        return {'min_pitch': self.min_pitch, 'max_pitch': self.max_pitch}
+
+    def track(self, y, sr, n_fft, hop_length):
+        import librosa
+
+        frames = frame_signal(y, n_fft, hop_length)
+        if len(frames) == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        f0, voiced, _ = librosa.pyin(y, fmin=float(midi_to_hz(self.min_pitch)), fmax=float(midi_to_hz(self.max_pitch)),
+                                     sr=sr, frame_length=n_fft, hop_length=hop_length, center=False)
+        freqs = np.where(voiced, np.nan_to_num(f0), 0.0).astype(np.float32)
+        return freqs[:len(frames)], frame_magnitude(frames)
+
+
+BACKENDS = {backend.name: backend for backend in (YinBackend, PiptrackBackend, PyinBackend)}
+
+
+def get_backend(name, min_pitch, max_pitch, voices=1):
+    """Erzeugt das Verfahren mit dem angegebenen Namen (siehe BACKENDS), mehrstimmig mit voices > 1"""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unbekanntes Verfahren: {name} (verfügbar: {', '.join(BACKENDS)})") from None
+    if not 1 <= voices <= MAX_VOICES:
+        raise ValueError(f"Anzahl der Stimmen muss zwischen 1 und {MAX_VOICES} liegen: {voices}")
+    if voices == 1:
+        return backend(min_pitch, max_pitch)
+    if not backend.polyphonic:
+        polyphonic = ', '.join(name for name, other in BACKENDS.items() if other.polyphonic)
+        raise ValueError(f"Verfahren {name} erkennt nur eine Stimme (mehrstimmig: {polyphonic})")
+    return backend(min_pitch, max_pitch, voices)
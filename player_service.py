@@ -0,0 +1,138 @@
+"""Dauerhaft laufender Player-Prozess für spitter_gui: einmal starten, beliebig oft abspielen.
+
+Der Prozess importiert pygame, numpy und die Player nur einmal und initialisiert den Audio-Mixer
+vorab. Die GUI schickt Notendateien (gelesen wird im Player-Prozess, JSON im Hintergrund) oder
+bereits geladene Noten über eine Queue und beendet Wiedergaben über ein Event; Statusmeldungen
+kommen über eine zweite Queue zurück. Jeder Auftrag trägt eine Generation; Stop und jeder neue
+Auftrag erhöhen sie, so dass der Player auch noch wartende Aufträge verwirft.
+"""
+import importlib
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+import notes_io
+
+PLAYER_MODES = ("spitter", "spitter-alt")
+
+
+def _load_players():
+    """Importiert die Player-Module (spitter-alt ist ohne simpleaudio nicht verfügbar)"""
+    players = {}
+    for mode in PLAYER_MODES:
+        try:
+            players[mode] = importlib.import_module(mode)
+        except ImportError as e:
+            players[mode] = e
+    return players
+
+
+def _worker(commands, events, stop_event, generation):
+    # SDL soll SIGTERM nicht abfangen, sonst lässt sich der Prozess beim Beenden der GUI nicht stoppen
+    os.environ["SDL_NO_SIGNAL_HANDLERS"] = "1"
+    players = _load_players()
+
+    # Audio-Mixer einmal initialisieren, damit die erste Note nicht darauf warten muss
+    if not isinstance(players["spitter"], Exception):
+        import pygame
+        pygame.mixer.pre_init(44100, -16, 1, 1024)
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            # Kein Audiogerät: der Fehler wird beim Abspielen gemeldet
+            pass
+    events.put(("ready", None))
+
+    while True:
+        command = commands.get()
+        # Nur der neueste Auftrag zählt, ältere wurden inzwischen schon wieder ersetzt
+        while command is not None:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+        if command is None:
+            break
+
+        name, mode, prerender, source, sent_at, command_generation = command
+        # Erst zurücksetzen, dann prüfen: ein Stop danach setzt das Event wieder und beendet die
+        # Wiedergabe, ein Stop davor hat die Generation erhöht und der Auftrag entfällt
+        stop_event.clear()
+        if command_generation != generation.value:
+            events.put(("stopped", name))
+            continue
+        module = players.get(mode)
+        if isinstance(module, Exception) or module is None:
+            events.put(("error", f"Player {mode} nicht verfügbar: {module}"))
+            continue
+
+        try:
+            notes = notes_io.open_notes(source) if isinstance(source, str) else notes_io.NoteArrays(*source)
+            if mode == "spitter":
+                player = module.NotePlayer(notes=notes, stop_event=stop_event, keep_alive=True)
+            else:
+                player = module.SimpleNotePlayer(notes=notes, stop_event=stop_event)
+            events.put(("started", (name, time.time() - sent_at)))
+
+            if prerender:
+                player.play_prerendered()
+            else:
+                player.play()
+            events.put(("stopped" if stop_event.is_set() else "finished", name))
+        except Exception as e:
+            events.put(("error", str(e)))
+
+
+class PlayerService:
+    """Hält einen Player-Prozess warm und steuert ihn aus der GUI"""
+
+    def __init__(self):
+        # spawn statt fork: Tk und SDL sollen sich keinen Prozesszustand teilen
+        context = multiprocessing.get_context("spawn")
+        self._commands = context.Queue()
+        self._events = context.Queue()
+        self._stop_event = context.Event()
+        self._generation = context.Value('i', 0)
+        self._process = context.Process(target=_worker, daemon=True,
+                                        args=(self._commands, self._events, self._stop_event, self._generation))
+        self._process.start()
+
+    def play(self, name, notes, mode="spitter", prerender=False):
+        """Spielt eine Notendatei (Pfad) oder bereits geladene Noten ab; eine laufende Wiedergabe wird vorher beendet"""
+        self.stop()
+        # Pfade liest erst der Player-Prozess (einmal, inkrementell), geladene Noten gehen als Spalten-Arrays
+        source = notes if isinstance(notes, str) else tuple(np.asarray(column) for column in notes.columns())
+        self._commands.put((name, mode, prerender, source, time.time(), self._next_generation()))
+
+    def stop(self):
+        """Beendet die laufende Wiedergabe und verwirft noch nicht begonnene Aufträge"""
+        self._next_generation()
+        self._stop_event.set()
+
+    def _next_generation(self):
+        with self._generation.get_lock():
+            self._generation.value += 1
+            return self._generation.value
+
+    def poll_events(self):
+        """Liefert alle seit dem letzten Aufruf eingetroffenen Meldungen als (Art, Inhalt)"""
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    @property
+    def alive(self):
+        return self._process.is_alive()
+
+    def close(self):
+        self.stop()
+        self._commands.put(None)
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.kill()
@@ -0,0 +1,133 @@
+"""Vorausschauende Einplanung von Noten auf exakte Sample-Positionen eines VoiceMixer."""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+LOOKAHEAD = 0.1  # Sekunden, die Noten vor ihrem Einsatz an den Mixer übergeben werden
+INTERVAL = 0.02  # Weckintervall des Scheduler-Threads in Sekunden
+JITTER_WINDOW = 15000  # Aufwachzeiten für Median und Perzentil (bei INTERVAL die letzten 5 Minuten)
+
+
+class NoteScheduler:
+    """Übergibt Noten mit festem Vorlauf an einen VoiceMixer.
+
+    Der Scheduler-Thread wacht nach einer monotonen Uhr auf und plant alle Noten ein,
+    deren Start innerhalb des Vorlaufs liegt. Jede Note bekommt ihr exaktes Startsample
+    relativ zum Songbeginn, der Mixer setzt sie sampelgenau im passenden Block ein.
+    Die Audio-Zeitachse ist damit unabhängig davon, wie lange die Anzeige für einen Frame
+    braucht; die Anzeige fragt nur song_time() ab.
+
+    Noten, die noch geladen werden (notes_io.NoteStream), werden nachgezogen, sobald die
+    bisherigen eingeplant sind. Wurde der Stream nachträglich sortiert, geht es ab der
+    aktuellen Position weiter; bereits vergangene Noten entfallen.
+    """
+
+    def __init__(self, notes, voice_mixer, lookahead=LOOKAHEAD, interval=INTERVAL):
+        self.voice_mixer = voice_mixer
+        self.sample_rate = voice_mixer.sample_rate
+        self.lookahead_samples = int(lookahead * self.sample_rate)
+        self.interval = interval
+
+        self.notes = notes
+        self.resorted = False
+        self._load_columns()
+
+        self.start_sample = None
+        self.next_index = 0
+        # Verspätung des Aufwachens gegenüber dem Plan in Sekunden: Anzahl, Summe und Maximum über den
+        # ganzen Song, Median und Perzentil nur über die letzten JITTER_WINDOW (begrenzter Speicher)
+        self.wake_delays = deque(maxlen=JITTER_WINDOW)
+        self.wake_count = 0
+        self.wake_delay_sum = 0.0
+        self.wake_delay_max = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_columns(self):
+        times, pitches, durations = self.notes.columns()
+        self.times = np.asarray(times, dtype=np.float64)
+        self.pitches = np.asarray(pitches)
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.note_samples = np.round(self.times * self.sample_rate).astype(np.int64)
+
+    def _follow_stream(self, horizon):
+        """Übernimmt neu geladene Noten eines NoteStream"""
+        resorted = getattr(self.notes, 'resorted', False)
+        if len(self.notes) == len(self.times) and resorted == self.resorted:
+            return
+        self._load_columns()
+        if resorted and not self.resorted:
+            self.resorted = True
+            self.next_index = int(np.searchsorted(self.note_samples, horizon, side='right'))
+
+    @property
+    def loading(self):
+        """Es werden noch Noten nachgeladen"""
+        return not self.notes.complete or len(self.notes) != len(self.times)
+
+    def start(self):
+        """Startet den Song einen Vorlauf nach der aktuellen Audio-Position"""
+        self.start_sample = self.voice_mixer.sample_clock + self.lookahead_samples
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set() and (self.next_index < len(self.times) or self.loading):
+            # Alle Noten, die innerhalb des Vorlaufs beginnen, sampelgenau einplanen
+            horizon = self.voice_mixer.sample_clock + self.lookahead_samples - self.start_sample
+            if self.next_index >= len(self.times):
+                self._follow_stream(horizon)
+            last = int(np.searchsorted(self.note_samples, horizon, side='right'))
+            for index in range(self.next_index, last):
+                self.voice_mixer.note_on(self.pitches[index], self.durations[index],
+                                         self.start_sample + self.note_samples[index])
+            self.next_index = max(self.next_index, last)
+
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            wake_delay = max(0.0, time.monotonic() - next_tick)
+            self.wake_delays.append(wake_delay)
+            self.wake_count += 1
+            self.wake_delay_sum += wake_delay
+            self.wake_delay_max = max(self.wake_delay_max, wake_delay)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def song_time(self, latency=0.0):
+        """Aktuelle Position im Song nach der Audio-Uhr (abzüglich Ausgabelatenz)"""
+        if self.start_sample is None:
+            return 0.0
+        return (self.voice_mixer.sample_clock - self.start_sample) / self.sample_rate - latency
+
+    def notes_started(self, song_time):
+        """Anzahl der Noten, die bis song_time begonnen haben"""
+        return int(np.searchsorted(self.times, song_time, side='right'))
+
+    @property
+    def finished(self):
+        """True, wenn alle Noten eingeplant und ausgeklungen sind"""
+        return self.next_index >= len(self.times) and not self.loading and not self.voice_mixer.busy
+
+    def report(self):
+        """Messwerte zur Einsatzgenauigkeit"""
+        voice_mixer = self.voice_mixer
+        lines = [f"Noteneinsätze: {voice_mixer.onsets}, davon verspätet: {voice_mixer.late_onsets} "
+                 f"(max. {voice_mixer.max_lateness / self.sample_rate * 1000:.2f} ms)"]
+        if self.wake_count:
+            delays = np.asarray(self.wake_delays) * 1000
+            window = f", Median/99% der letzten {len(delays)}" if len(delays) < self.wake_count else ""
+            lines.append(f"Scheduler-Jitter: Median {np.median(delays):.2f} ms, "
+                         f"99% {np.percentile(delays, 99):.2f} ms, "
+                         f"Mittel {self.wake_delay_sum / self.wake_count * 1000:.2f} ms, "
+                         f"max. {self.wake_delay_max * 1000:.2f} ms "
+                         f"({self.wake_count} Aufwachvorgänge{window}; "
+                         f"Vorlauf {self.lookahead_samples / self.sample_rate * 1000:.0f} ms)")
+        return "\n".join(lines)
@@ -0,0 +1,278 @@
+"""Bewertet Gesang gegen eine Notendatei: Tonhöhen- und Timing-Genauigkeit pro Frame.
+
+Beispiele:
+    python scoring.py song_notes.json --vocal aufnahme.wav     # Aufnahme schneller als Echtzeit bewerten
+    python scoring.py song_notes.json --replay aufnahme.wav    # wie live, Aufnahme in Echtzeit eingespielt
+    python scoring.py song_notes.json                          # live vom Mikrofon (benötigt sounddevice)
+
+Jeder Frame des Gesangs (Zeit, Frequenz, Lautstärke) wird mit den Noten verglichen, die zu
+diesem Zeitpunkt erklingen sollen. Ein stimmhafter Frame trifft, wenn er höchstens
+HIT_TOLERANCE Halbtöne von einer aktiven Note abweicht; Oktavfehler zählen mit
+octave_tolerance nicht als Abweichung. Eine Note gilt als getroffen, wenn mindestens
+NOTE_HIT_RATIO ihrer Frames getroffen wurden.
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+import analysis
+import notes_io
+
+HIT_TOLERANCE = 1.0  # Halbtöne Abweichung, die noch als getroffen gilt
+TIMING_TOLERANCE = 0.1  # Sekunden, die der Gesang vor oder nach einer Note liegen darf
+NOTE_HIT_RATIO = 0.5  # Anteil getroffener Frames, ab dem eine Note als getroffen gilt
+SCORING_BACKEND = "yin"  # Tonhöhenerkennung für Aufnahmen (genauer bei Gesang als piptrack)
+
+
+def pitch_error(midi, target, octave_tolerance=True):
+    """Abweichung in Halbtönen; mit octave_tolerance auf die nächste Oktave der Zielnote gefaltet"""
+    error = midi - target
+    if octave_tolerance:
+        error = error - 12 * np.round(error / 12)
+    return np.abs(error)
+
+
+class NoteIndex:
+    """Intervall-Index: welche Noten sind zu einem Zeitpunkt aktiv?
+
+    Alle Notenanfänge und -enden (um timing_tolerance erweitert) teilen die Zeitachse in
+    Abschnitte, in denen sich die Menge der aktiven Noten nicht ändert. Pro Abschnitt sind die
+    aktiven Noten zusammenhängend abgelegt (members[offsets[i]:offsets[i + 1]]). Ein Zeitpunkt
+    wird per Binärsuche gefunden (O(log n)); find() merkt sich den letzten Abschnitt, bei
+    fortlaufender Zeit wie im Live-Betrieb kostet die Suche daher amortisiert O(1).
+    """
+
+    def __init__(self, notes, timing_tolerance=TIMING_TOLERANCE):
+        self.pitches = np.asarray(notes.pitches, dtype=np.float64)
+        starts = np.asarray(notes.times, dtype=np.float64) - timing_tolerance
+        ends = np.asarray(notes.times, dtype=np.float64) + np.asarray(notes.durations) + timing_tolerance
+        self.boundaries = np.unique(np.concatenate((starts, ends)))
+
+        # Jede Note ist in den Abschnitten first..last-1 aktiv
+        first = np.searchsorted(self.boundaries, starts)
+        last = np.searchsorted(self.boundaries, ends)
+        counts = last - first
+        segments = _expand_ranges(first, counts)
+        members = np.repeat(np.arange(len(starts)), counts)
+        order = np.argsort(segments, kind='stable')
+        self.members = members[order]
+        self.offsets = np.searchsorted(segments[order], np.arange(len(self.boundaries) + 1))
+        self._segment = 0
+
+    def __len__(self):
+        return len(self.pitches)
+
+    def segments(self, times):
+        """Abschnitt pro Zeitpunkt (-1 bzw. len(boundaries) - 1 außerhalb aller Noten)"""
+        return np.searchsorted(self.boundaries, times, side='right') - 1
+
+    def find(self, t):
+        """Indizes der Noten, die zum Zeitpunkt t aktiv sind"""
+        boundaries = self.boundaries
+        segment = self._segment
+        if len(boundaries) < 2:
+            return self.members[:0]
+        # Meist liegt t im selben oder im nächsten Abschnitt wie beim letzten Aufruf
+        if boundaries[segment] <= t < boundaries[segment + 1]:
+            pass
+        elif segment + 2 < len(boundaries) and boundaries[segment + 1] <= t < boundaries[segment + 2]:
+            segment += 1
+        else:
+            segment = int(np.searchsorted(boundaries, t, side='right')) - 1
+            if segment < 0 or segment >= len(boundaries) - 1:
+                return self.members[:0]
+        self._segment = segment
+        return self.members[self.offsets[segment]:self.offsets[segment + 1]]
+
+
+def _expand_ranges(starts, counts):
+    """Verkettet die Bereiche starts[i]..starts[i] + counts[i] - 1 ohne Python-Schleife"""
+    total = int(counts.sum())
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + within
+
+
+class SingingScore:
+    """Laufende Bewertung eines Gesangs gegen die Noten eines Songs
+
+    update() verarbeitet einzelne Frames im Live-Betrieb, score_frames() ganze Spuren auf
+    einmal (vektorisiert). Beide führen dieselben Zähler; summary() liefert den aktuellen Stand.
+    """
+
+    def __init__(self, notes, hit_tolerance=HIT_TOLERANCE, timing_tolerance=TIMING_TOLERANCE,
+                 octave_tolerance=True, min_magnitude=analysis.MIN_MAGNITUDE):
+        self.index = NoteIndex(notes, timing_tolerance)
+        self.hit_tolerance = hit_tolerance
+        self.octave_tolerance = octave_tolerance
+        self.min_magnitude = min_magnitude
+
+        self.frames = 0
+        self.voiced_frames = 0  # stimmhafte Frames insgesamt
+        self.voiced_in_note = 0  # davon während einer Note
+        self.hit_frames = 0  # davon mit getroffener Tonhöhe
+        self.error_sum = 0.0  # Summe der Abweichungen in Halbtönen (stimmhaft, während einer Note)
+        self.note_frames = np.zeros(len(self.index), dtype=np.int64)  # Frames, in denen die Note aktiv war
+        self.note_hits = np.zeros(len(self.index), dtype=np.int64)
+
+    def update(self, t, freq, mag):
+        """Bewertet einen Frame; liefert True/False (getroffen) oder None ohne Note bzw. ohne Gesang"""
+        self.frames += 1
+        active = self.index.find(t)
+        for note in active:
+            self.note_frames[note] += 1
+        if freq <= 0 or mag < self.min_magnitude:
+            return None
+
+        self.voiced_frames += 1
+        if len(active) == 0:
+            return None
+        midi = 12 * math.log2(freq / 440.0) + 69
+        errors = pitch_error(midi, self.index.pitches[active], self.octave_tolerance)
+        best = int(errors.argmin())
+        self.voiced_in_note += 1
+        self.error_sum += float(errors[best])
+        if errors[best] <= self.hit_tolerance:
+            self.hit_frames += 1
+            self.note_hits[active[best]] += 1
+            return True
+        return False
+
+    def score_frames(self, times, freqs, mags):
+        """Bewertet eine ganze Spur auf einmal (gleiche Regeln wie update)"""
+        times = np.asarray(times, dtype=np.float64)
+        freqs = np.asarray(freqs, dtype=np.float64)
+        index = self.index
+        self.frames += len(times)
+        voiced = (freqs > 0) & (np.asarray(mags) >= self.min_magnitude)
+        self.voiced_frames += int(voiced.sum())
+        if len(index.boundaries) < 2:
+            # Keine Noten (z.B. stille Spur): nur Gesang zählen, wie in update
+            return
+
+        # Aktive Noten pro Frame als (Frame, Note)-Paare
+        segments = index.segments(times)
+        inside = (segments >= 0) & (segments < len(index.boundaries) - 1)
+        segments = np.where(inside, segments, 0)
+        counts = np.where(inside, index.offsets[segments + 1] - index.offsets[segments], 0)
+        pair_frames = np.repeat(np.arange(len(times)), counts)
+        pair_notes = index.members[_expand_ranges(index.offsets[segments], counts)]
+        self.note_frames += np.bincount(pair_notes, minlength=len(index))
+
+        # Stimmhafte Frames: die am besten passende aktive Note je Frame
+        pair_voiced = voiced[pair_frames]
+        pair_frames, pair_notes = pair_frames[pair_voiced], pair_notes[pair_voiced]
+        if len(pair_frames) == 0:
+            return
+        midi = 12 * np.log2(freqs[pair_frames] / 440.0) + 69
+        errors = pitch_error(midi, index.pitches[pair_notes], self.octave_tolerance)
+        order = np.lexsort((errors, pair_frames))
+        best = order[np.flatnonzero(np.diff(pair_frames[order], prepend=-1))]
+        best_errors = errors[best]
+        hits = best_errors <= self.hit_tolerance
+
+        self.voiced_in_note += len(best)
+        self.error_sum += float(best_errors.sum())
+        self.hit_frames += int(hits.sum())
+        self.note_hits += np.bincount(pair_notes[best[hits]], minlength=len(index))
+
+    def summary(self):
+        """Aktueller Stand: Genauigkeiten zwischen 0 und 1 und eine Punktzahl von 0 bis 100"""
+        sung = self.note_frames > 0
+        notes_hit = int(np.sum(sung & (self.note_hits >= NOTE_HIT_RATIO * self.note_frames)))
+        return {
+            'frames': self.frames,
+            # Anteil der gesungenen Frames während einer Note mit richtiger Tonhöhe
+            'pitch_accuracy': self.hit_frames / self.voiced_in_note if self.voiced_in_note else 0.0,
+            # Anteil des Gesangs, der in die Noten fällt (statt in Pausen)
+            'timing_accuracy': self.voiced_in_note / self.voiced_frames if self.voiced_frames else 0.0,
+            'mean_error': round(self.error_sum / self.voiced_in_note, 4) if self.voiced_in_note else None,
+            'notes_hit': notes_hit,
+            'notes_total': int(np.sum(sung)),
+            'score': round(100 * notes_hit / max(1, int(np.sum(sung))), 1),
+        }
+
+    def report(self):
+        summary = self.summary()
+        lines = [f"Punktzahl: {summary['score']:.1f} ({summary['notes_hit']} von {summary['notes_total']} Noten getroffen)",
+                 f"Tonhöhe: {summary['pitch_accuracy']:.1%} der gesungenen Frames getroffen"
+                 + (f", mittlere Abweichung {summary['mean_error']:.2f} Halbtöne"
+                    if summary['mean_error'] is not None else ""),
+                 f"Timing: {summary['timing_accuracy']:.1%} des Gesangs während der Noten"]
+        return "\n".join(lines)
+
+
+def score_recording(notes, vocal_path, backend=SCORING_BACKEND, **options):
+    """Bewertet eine Gesangsaufnahme gegen die Noten (offline, schneller als Echtzeit)"""
+    freqs, mags, sr = analysis.load_track(vocal_path, backend=analysis.get_backend(
+        backend, analysis.MIN_PITCH, analysis.MAX_PITCH))
+    score = SingingScore(notes, **options)
+    score.score_frames(analysis.frame_times(len(freqs), sr), freqs, mags)
+    return score, (len(freqs) - 1) * analysis.HOP_LENGTH / sr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bewertet Gesang gegen eine Notendatei")
+    parser.add_argument("notes", help="Notendatei (JSON oder .bin)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--vocal", help="Gesangsaufnahme offline bewerten (schneller als Echtzeit)")
+    source.add_argument("--replay", help="Gesangsaufnahme wie live in Echtzeit einspielen")
+    parser.add_argument("--backend", choices=list(analysis.BACKENDS), default=SCORING_BACKEND,
+                        help="Verfahren der Tonhöhenerkennung")
+    parser.add_argument("--hit-tolerance", type=float, default=HIT_TOLERANCE,
+                        help="Abweichung in Halbtönen, die noch als getroffen gilt")
+    parser.add_argument("--timing-tolerance", type=float, default=TIMING_TOLERANCE,
+                        help="Sekunden, die der Gesang vor oder nach einer Note liegen darf")
+    parser.add_argument("--strict-octave", action="store_true", help="Oktavfehler als Abweichung werten")
+    args = parser.parse_args(argv)
+
+    notes = notes_io.load_notes(args.notes)
+    options = {'hit_tolerance': args.hit_tolerance, 'timing_tolerance': args.timing_tolerance,
+               'octave_tolerance': not args.strict_octave}
+
+    if args.vocal:
+        start = time.perf_counter()
+        score, duration = score_recording(notes, args.vocal, args.backend, **options)
+        elapsed = time.perf_counter() - start
+        print(score.report())
+        print(f"{duration:.1f}s Aufnahme in {elapsed:.2f}s bewertet ({duration / elapsed:.0f}x Echtzeit)")
+        return 0
+
+    # Live: Frames aus live_sniffer direkt bewerten, Zwischenstand bei jedem Ende einer
+    # behaltenen Note (zu kurze Noten fehlen auch in der Datei-Analyse)
+    import live_sniffer
+
+    score = SingingScore(notes, **options)
+
+    def on_event(event):
+        if event['type'] == "note_off" and event['kept']:
+            summary = score.summary()
+            print(f"{event['time']:8.2f}s  Punktzahl {summary['score']:5.1f}  "
+                  f"Tonhöhe {summary['pitch_accuracy']:.0%}  Timing {summary['timing_accuracy']:.0%}")
+
+    if args.replay:
+        import soundfile as sf
+
+        sr = sf.info(args.replay).samplerate
+        blocks = live_sniffer.replay_blocks(args.replay)
+    else:
+        sr = live_sniffer.SAMPLE_RATE
+        blocks = live_sniffer.microphone_blocks(sr)
+        print("Aufnahme läuft, beenden mit Strg+C")
+
+    sniffer = live_sniffer.LiveSniffer(sr, on_event=on_event, on_frame=score.update, backend=args.backend)
+    try:
+        for samples, arrival in blocks:
+            sniffer.feed(samples, arrival)
+    except RuntimeError as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 1
+    sniffer.finish()
+    print(score.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
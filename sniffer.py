@@ -1,23 +1,35 @@
-import json
+import time
+
+_START = time.perf_counter()  # Für --startup-time
+
+import argparse
 import os
+import sqlite3
 import sys
 import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox
-from tkinter.ttk import Progressbar
+from tkinter import filedialog, messagebox, ttk
 import subprocess
 
-import librosa
-import librosa.display
-import numpy as np
-import soundfile as sf
+# librosa und soundfile lädt analysis erst bei Bedarf bzw. im Hintergrund (siehe warm_up_audio)
+import analysis
+import job_queue
+from metrics import PipelineMetrics, ProgressEstimate, metrics_path
+from pitch_backends import MAX_VOICES
+from song_library import SongLibrary
+from track_cache import TrackCache
+
+
+RESEGMENT_DELAY_MS = 300  # Wartezeit nach der letzten Eingabe, bevor neu segmentiert wird
+SWEEP_SHOWN = 5  # Anzahl der angezeigten Einstellungen nach dem Optimieren
+JOB_POLL_MS = 200  # Takt, in dem die Auftragsliste aktualisiert wird
 
 
 class AudioAnalyzerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Audio zu Noten Konverter")
-        self.root.geometry("600x400")
+        self.root.geometry("700x590")
         self.root.configure(bg="#2C2E3B")
 
         # Styling
@@ -27,10 +39,10 @@ class AudioAnalyzerApp:
         self.secondary_bg = "#3D3F4F"
 
         # Parameter für die Notenerkennung
-        self.min_note_length = 0.25  # Minimale Notendauer in Sekunden
-        self.min_magnitude = 1.0  # Minimale Lautstärke für eine gültige Note
-        self.min_pitch = 36  # Minimale Tonhöhe (C2)
-        self.max_pitch = 96  # Maximale Tonhöhe (C7)
+        self.min_note_length = analysis.MIN_NOTE_LENGTH  # Minimale Notendauer in Sekunden
+        self.min_magnitude = analysis.MIN_MAGNITUDE  # Minimale Lautstärke für eine gültige Note
+        self.min_pitch = analysis.MIN_PITCH  # Minimale Tonhöhe (C2)
+        self.max_pitch = analysis.MAX_PITCH  # Maximale Tonhöhe (C7)
 
         # StringVar-Variablen für die Eingabefelder
         self.note_length_var = tk.StringVar(root)
@@ -39,6 +51,39 @@ class AudioAnalyzerApp:
         self.magnitude_var = tk.StringVar(root)
         self.magnitude_var.set(str(self.min_magnitude))
 
+        # Speicherschonende, blockweise Analyse (gleiches Ergebnis, begrenzter Speicherbedarf)
+        self.chunked_analysis = True
+        self.chunked_var = tk.BooleanVar(root, value=self.chunked_analysis)
+
+        # Eine Datei auf alle Kerne verteilen (bei mehreren gleichzeitigen Aufträgen anteilig)
+        self.workers = 1
+        self.parallel_var = tk.BooleanVar(root, value=False)
+
+        # Warteschlange: mehrere Dateien, höchstens job_queue.DEFAULT_WORKERS gleichzeitig
+        self.job_queue = job_queue.JobQueue(self.run_job)
+        self.job_versions = {}  # Zuletzt angezeigter Stand jeder Zeile
+        self.reported_jobs = set()  # Aufträge, deren Ende bereits gemeldet wurde
+
+        # Verfahren der Tonhöhenerkennung (siehe pitch_backends)
+        self.backend = analysis.DEFAULT_BACKEND
+        self.backend_var = tk.StringVar(root, value=analysis.BACKENDS[self.backend].description)
+
+        # Gleichzeitige Töne pro Frame (1 = einstimmig wie bisher, mehr nur mit piptrack)
+        self.voices = 1
+        self.voices_var = tk.StringVar(root, value=str(self.voices))
+
+        # Zwischengespeicherte Tonhöhenspuren (erneute Analyse mit anderen Schwellwerten ohne STFT)
+        self.track_cache = TrackCache()
+
+        # Jede geschriebene Notendatei landet in der Song-Bibliothek (siehe song_library, spitter_gui)
+        self.library = SongLibrary()
+
+        # Spur der zuletzt analysierten Datei im Speicher: Schwellwerte ändern zeigt sofort eine Vorschau
+        self.track = None
+        self.resegment_job = None
+        self.note_length_var.trace_add("write", self.schedule_resegment)
+        self.magnitude_var.trace_add("write", self.schedule_resegment)
+
         # Erstelle UI
         self.setup_ui()
 
@@ -46,10 +91,22 @@ class AudioAnalyzerApp:
         self.root.drop_target_register("DND_Files")
         self.root.dnd_bind('<<Drop>>', self.drop)
 
-        # Analysevariablen
-        self.current_file = None
-        self.analysis_thread = None
-        self.is_analyzing = False
+        # Audio-Bibliotheken laden, während der Benutzer eine Datei auswählt
+        self.root.after(100, self.warm_up_audio)
+
+        # Auftragsliste im Tk-Takt aktualisieren; die Worker fassen Tk nicht an
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def warm_up_audio(self):
+        def warm_up():
+            try:
+                analysis.warm_up()
+            except Exception as e:
+                # Fehler treten sonst spätestens bei der ersten Analyse auf und werden dort gemeldet
+                print(f"Hinweis: Audio-Bibliotheken konnten nicht vorab geladen werden: {e}")
+
+        threading.Thread(target=warm_up, daemon=True).start()
 
     def setup_ui(self):
         # Header
@@ -84,35 +141,107 @@ class AudioAnalyzerApp:
         magnitude_entry = tk.Entry(settings_frame, textvariable=self.magnitude_var, width=5)
         magnitude_entry.grid(row=1, column=1, sticky="w", padx=5, pady=2)
 
+        # Blockweise Analyse für lange Aufnahmen
+        chunked_check = tk.Checkbutton(settings_frame, text="Speicherschonend (blockweise)",
+                                       variable=self.chunked_var, fg=self.text_color, bg=self.bg_color,
+                                       selectcolor=self.secondary_bg, activebackground=self.bg_color)
+        chunked_check.grid(row=2, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+
+        # Parallele Analyse einer Datei
+        parallel_check = tk.Checkbutton(settings_frame, text=f"Alle Kerne nutzen ({os.cpu_count() or 1})",
+                                        variable=self.parallel_var, fg=self.text_color, bg=self.bg_color,
+                                        selectcolor=self.secondary_bg, activebackground=self.bg_color)
+        parallel_check.grid(row=3, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+
+        # Mehrstimmige Erkennung
+        voices_label = tk.Label(settings_frame, text="Stimmen (Akkorde):",
+                                fg=self.text_color, bg=self.bg_color)
+        voices_label.grid(row=4, column=0, sticky="w", padx=5, pady=2)
+
+        voices_spin = tk.Spinbox(settings_frame, from_=1, to=MAX_VOICES, textvariable=self.voices_var, width=4)
+        voices_spin.grid(row=4, column=1, sticky="w", padx=5, pady=2)
+
+        # Verfahren der Tonhöhenerkennung
+        backend_label = tk.Label(settings_frame, text="Tonhöhen-Erkennung:",
+                                 fg=self.text_color, bg=self.bg_color)
+        backend_label.grid(row=0, column=2, sticky="w", padx=(20, 5), pady=2)
+
+        backend_menu = tk.OptionMenu(settings_frame, self.backend_var,
+                                     *(backend.description for backend in analysis.BACKENDS.values()))
+        backend_menu.config(fg=self.text_color, bg=self.secondary_bg, activebackground=self.accent_color,
+                            highlightthickness=0, border=0)
+        backend_menu.grid(row=0, column=3, sticky="w", padx=5, pady=2)
+
+        # Schwellwerte auf der gespeicherten Spur durchprobieren (erst nach der ersten Analyse)
+        self.sweep_btn = tk.Button(settings_frame, text="Schwellwerte optimieren", state=tk.DISABLED,
+                                   bg=self.secondary_bg, fg=self.text_color, activebackground=self.accent_color,
+                                   border=0, padx=10, command=self.sweep_thresholds)
+        self.sweep_btn.grid(row=1, column=2, columnspan=2, sticky="w", padx=(20, 5), pady=2)
+
+        self.track_label = tk.Label(settings_frame, text="", fg=self.text_color, bg=self.bg_color,
+                                    justify=tk.LEFT, wraplength=260)
+        self.track_label.grid(row=2, column=2, columnspan=2, rowspan=2, sticky="nw", padx=(20, 5), pady=2)
+
+        # Die Vorschau mit neuen Schwellwerten wird erst auf ausdrücklichen Wunsch gespeichert
+        self.apply_btn = tk.Button(settings_frame, text="Neu segmentiert speichern", state=tk.DISABLED,
+                                   bg=self.secondary_bg, fg=self.text_color, activebackground=self.accent_color,
+                                   border=0, padx=10, command=self.apply_resegment)
+        self.apply_btn.grid(row=4, column=2, columnspan=2, sticky="w", padx=(20, 5), pady=2)
+
         # Drag & Drop-Bereich
-        self.drop_frame = tk.Frame(main_frame, bg=self.secondary_bg, padx=20, pady=30)
-        self.drop_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.drop_frame = tk.Frame(main_frame, bg=self.secondary_bg, padx=20, pady=10)
+        self.drop_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
 
         self.drop_label = tk.Label(self.drop_frame,
-                                   text="Ziehe eine Audio-Datei hierher oder klicke zum Auswählen",
+                                   text="Ziehe Audio-Dateien hierher oder klicke zum Auswählen",
                                    font=("Segoe UI", 12), fg=self.text_color, bg=self.secondary_bg,
-                                   wraplength=500)
-        self.drop_label.pack(pady=20)
+                                   wraplength=600)
+        self.drop_label.pack(pady=(5, 0))
 
-        self.browse_btn = tk.Button(self.drop_frame, text="Datei auswählen",
+        self.browse_btn = tk.Button(self.drop_frame, text="Dateien auswählen",
                                     font=("Segoe UI", 10), bg=self.accent_color, fg=self.text_color,
                                     border=0, padx=15, pady=8, command=self.browse_file)
         self.browse_btn.pack(pady=10)
 
-        # Fortschrittsbereich (zunächst versteckt)
-        self.progress_frame = tk.Frame(main_frame, bg=self.bg_color, padx=20, pady=20)
-
-        self.file_label = tk.Label(self.progress_frame, text="",
-                                   font=("Segoe UI", 10), fg=self.text_color, bg=self.bg_color)
-        self.file_label.pack(anchor=tk.W, pady=(0, 10))
-
-        self.progress_bar = Progressbar(self.progress_frame, orient=tk.HORIZONTAL,
-                                        length=500, mode='indeterminate')
-        self.progress_bar.pack(fill=tk.X, pady=10)
-
-        self.status_label = tk.Label(self.progress_frame, text="",
-                                     font=("Segoe UI", 10), fg=self.text_color, bg=self.bg_color)
-        self.status_label.pack(anchor=tk.W, pady=5)
+        # Auftragsliste: eine Zeile pro Datei mit Zustand, Fortschritt und Restzeit
+        jobs_frame = tk.Frame(main_frame, bg=self.bg_color)
+        jobs_frame.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        style = ttk.Style(self.root)
+        style.configure("Jobs.Treeview", background=self.secondary_bg, fieldbackground=self.secondary_bg,
+                        foreground=self.text_color, borderwidth=0)
+        style.map("Jobs.Treeview", background=[("selected", self.accent_color)])
+
+        self.job_list = ttk.Treeview(jobs_frame, columns=("state", "progress", "eta"), height=6,
+                                     style="Jobs.Treeview")
+        self.job_list.heading("#0", text="Datei", anchor=tk.W)
+        self.job_list.heading("state", text="Status", anchor=tk.W)
+        self.job_list.heading("progress", text="Fortschritt", anchor=tk.E)
+        self.job_list.heading("eta", text="Restzeit", anchor=tk.E)
+        self.job_list.column("#0", width=300)
+        self.job_list.column("state", width=140)
+        self.job_list.column("progress", width=90, anchor=tk.E)
+        self.job_list.column("eta", width=90, anchor=tk.E)
+        self.job_list.bind("<Double-1>", self.open_job)
+        self.job_list.bind("<Delete>", lambda event: self.cancel_selected())
+
+        scrollbar = ttk.Scrollbar(jobs_frame, orient=tk.VERTICAL, command=self.job_list.yview)
+        self.job_list.configure(yscrollcommand=scrollbar.set)
+        self.job_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        buttons_frame = tk.Frame(main_frame, bg=self.bg_color)
+        buttons_frame.pack(fill=tk.X, padx=10, pady=(5, 0))
+        for text, command in (("Auswahl abbrechen", self.cancel_selected),
+                              ("Alle abbrechen", self.job_queue.cancel_all),
+                              ("Erledigte entfernen", self.remove_finished)):
+            tk.Button(buttons_frame, text=text, bg=self.secondary_bg, fg=self.text_color,
+                      activebackground=self.accent_color, border=0, padx=10,
+                      command=command).pack(side=tk.LEFT, padx=(0, 5))
+
+        self.status_label = tk.Label(main_frame, text="", font=("Segoe UI", 10), fg=self.text_color,
+                                     bg=self.bg_color, anchor=tk.W, justify=tk.LEFT, wraplength=640)
+        self.status_label.pack(fill=tk.X, padx=10, pady=5)
 
         # Footer-Bereich
         footer_frame = tk.Frame(self.root, bg=self.secondary_bg, pady=10)
@@ -123,17 +252,8 @@ class AudioAnalyzerApp:
         footer_text.pack()
 
     def drop(self, event):
-        file_path = event.data
-        # Bereinige den Dateipfad (je nach Betriebssystem kann dies variieren)
-        if file_path.startswith("{"):
-            file_path = file_path[1:]
-        if file_path.endswith("}"):
-            file_path = file_path[:-1]
-
-        # Entferne Anführungszeichen, falls vorhanden
-        file_path = file_path.strip('"')
-
-        self.process_file(file_path)
+        # Tk liefert mehrere Pfade als Liste; Pfade mit Leerzeichen stehen in geschweiften Klammern
+        self.add_files(self.root.tk.splitlist(event.data))
 
     def browse_file(self):
         file_types = [
@@ -141,206 +261,304 @@ class AudioAnalyzerApp:
             ('Alle Dateien', '*.*')
         ]
 
-        file_path = filedialog.askopenfilename(filetypes=file_types)
-        if file_path:
-            self.process_file(file_path)
+        file_paths = filedialog.askopenfilenames(filetypes=file_types)
+        if file_paths:
+            self.add_files(file_paths)
 
     def process_file(self, file_path):
-        if not os.path.exists(file_path):
-            messagebox.showerror("Fehler", f"Datei nicht gefunden: {file_path}")
-            return
-
-        # Prüfe, ob es sich um eine Audio-Datei handelt
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext not in ['.wav', '.mp3', '.ogg', '.flac']:
-            messagebox.showerror("Fehler", "Bitte wähle eine unterstützte Audio-Datei aus (.wav, .mp3, .ogg, .flac)")
-            return
+        self.add_files([file_path])
 
-        # Aktualisiere Parameter aus der GUI
+    def read_settings(self):
+        """Liest die Einstellungen aus der GUI; jeder Auftrag behält den Stand beim Einreihen"""
         try:
             self.min_note_length = float(self.note_length_var.get())
             self.min_magnitude = float(self.magnitude_var.get())
+            voices = int(self.voices_var.get())
         except ValueError:
             messagebox.showerror("Fehler", "Ungültige Eingabe bei den Parametern. Bitte gib gültige Zahlen ein.")
-            return
-
-        self.current_file = file_path
-
-        # UI-Update für den Analyseprozess
-        self.drop_frame.pack_forget()
-        self.progress_frame.pack(fill=tk.BOTH, expand=True)
-
-        self.file_label.config(text=f"Datei: {os.path.basename(file_path)}")
-        self.status_label.config(text="Analysiere Audio-Datei...")
-        self.progress_bar.start(10)
-
-        # Starte Analyse in separatem Thread
-        self.is_analyzing = True
-        self.analysis_thread = threading.Thread(target=self.analyze_audio)
-        self.analysis_thread.daemon = True
-        self.analysis_thread.start()
-
-    def analyze_audio(self):
+            return None
+        self.chunked_analysis = self.chunked_var.get()
+        # Alle Kerne werden auf die gleichzeitig laufenden Aufträge aufgeteilt
+        cores = os.cpu_count() or 1
+        self.workers = max(1, cores // self.job_queue.workers) if self.parallel_var.get() else 1
+        self.backend = next(name for name, backend in analysis.BACKENDS.items()
+                            if backend.description == self.backend_var.get())
         try:
-            # Audio-Datei laden
-            self.update_status("Lade Audio-Datei...")
-            y, sr = librosa.load(self.current_file, sr=None)
-
-            # Tonhöhe extrahieren
-            self.update_status("Extrahiere Tonhöhen...")
-            pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-
-            # Dominante Tonhöhen finden
-            self.update_status("Identifiziere dominante Noten...")
-            notes = self.extract_notes(pitches, magnitudes, sr)
+            analysis.get_backend(self.backend, self.min_pitch, self.max_pitch, voices)
+        except ValueError as e:
+            messagebox.showerror("Fehler", str(e))
+            return None
+        self.voices = voices
+        return {
+            'min_note_length': self.min_note_length,
+            'min_magnitude': self.min_magnitude,
+            'chunked': self.chunked_analysis,
+            'workers': self.workers,
+            'backend': self.backend,
+            'voices': self.voices,
+        }
+
+    def add_files(self, file_paths):
+        """Prüft die Dateien und stellt sie in die Warteschlange"""
+        settings = self.read_settings()
+        if settings is None:
+            return
 
-            # Formatiere Ergebnis gemäß Zielformat
-            self.update_status("Formatiere Ergebnis...")
+        missing = []
+        unsupported = []
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                missing.append(file_path)
+            elif os.path.splitext(file_path)[1].lower() not in analysis.AUDIO_EXTENSIONS:
+                unsupported.append(file_path)
+            elif not self.job_queue.is_active(file_path):
+                # Die Audiodauer steht im Dateikopf und dient der Restzeitschätzung
+                job = self.job_queue.submit(file_path, settings, analysis.audio_duration(file_path))
+                self.job_list.insert("", tk.END, iid=job.id, text=job.name,
+                                     values=(job_queue.STATE_LABELS[job.state], "", ""))
+
+        if missing:
+            messagebox.showerror("Fehler", "Datei nicht gefunden:\n" + "\n".join(missing))
+        if unsupported:
+            messagebox.showerror("Fehler", "Bitte wähle unterstützte Audio-Dateien aus (.wav, .mp3, .ogg, .flac):\n"
+                                 + "\n".join(os.path.basename(path) for path in unsupported))
+        self.poll_jobs(reschedule=False)
+
+    def run_job(self, job):
+        """Analysiert eine Datei im Worker-Thread; liefert Notendatei, Notenanzahl, Spur und Messwerte"""
+        settings = job.settings
+        # Mehrere Aufträge laufen als Threads in diesem Prozess: CPU-Zeit nur dieses Threads messen
+        metrics = PipelineMetrics(thread_scope=True, file=os.path.abspath(job.path),
+                                  concurrent_jobs=self.job_queue.running_count(), **settings)
+        progress = ProgressEstimate(job.report)
+
+        # Tonhöhenspur bestimmen (aus dem Cache, blockweise oder am Stück)
+        progress.update("track", 0.0)
+        freqs, mags, sr = analysis.load_track(
+            job.path, chunked=settings['chunked'], cache=self.track_cache, workers=settings['workers'],
+            progress=lambda done: progress.update("track", done), metrics=metrics,
+            backend=analysis.get_backend(settings['backend'], self.min_pitch, self.max_pitch, settings['voices']))
+
+        # Dominante Tonhöhen finden
+        progress.update("extract_notes", 0.0)
+        with metrics.stage("extract_notes"):
+            # Der Median wird nur für einstimmige Spuren gebraucht (und für Neu-Segmentierungen behalten)
+            smoothed = analysis.smooth_track(freqs, mags) \
+                if settings['voices'] == 1 and len(freqs) >= analysis.WINDOW_SIZE else None
+            notes = analysis.segment_notes(freqs, mags, analysis.frame_times(len(freqs), sr),
+                                           min_note_length=settings['min_note_length'],
+                                           min_magnitude=settings['min_magnitude'],
+                                           min_pitch=self.min_pitch,
+                                           max_pitch=self.max_pitch,
+                                           smoothed=smoothed)
+
+        # Formatiere Ergebnis gemäß Zielformat
+        progress.update("format_notes", 0.0)
+        with metrics.stage("format_notes"):
             formatted_notes = self.format_notes(notes)
 
-            # Speichere Ergebnis
-            output_file = os.path.splitext(self.current_file)[0] + "_notes.json"
-            with open(output_file, 'w') as f:
-                json.dump(formatted_notes, f, indent=2)
-
-            self.update_status(f"Fertig! Ergebnis gespeichert unter: {output_file}")
-
-            # Frage, ob der Player gestartet werden soll
-            def ask_to_start_player():
+        # Speichere Ergebnis (letzte Abbruchmöglichkeit, die Notendatei wird danach vollständig geschrieben)
+        progress.update("json_write", 0.0)
+        output_file = analysis.notes_path(job.path)
+        with metrics.stage("json_write"):
+            analysis.save_notes(output_file, formatted_notes)
+        self.index_song(output_file, formatted_notes, job.path, settings)
+
+        # Messwerte neben der Notendatei ablegen
+        metrics.info.update(notes=len(formatted_notes['notes']),
+                            audio_seconds=round((len(freqs) - 1) * analysis.HOP_LENGTH / sr, 2))
+        metrics.save(metrics_path(job.path))
+
+        # Spur für sofortiges Neu-Segmentieren behalten
+        track = {'file': job.path, 'freqs': freqs, 'mags': mags, 'sr': sr, 'smoothed': smoothed,
+                 'output_file': output_file, 'settings': settings,
+                 'params': (settings['min_note_length'], settings['min_magnitude'])}
+        return {'output_file': output_file, 'notes': len(formatted_notes['notes']), 'track': track,
+                'summary': metrics.summary()}
+
+    def index_song(self, output_file, formatted_notes, audio_path, settings):
+        """Trägt die geschriebene Notendatei in die Song-Bibliothek ein; Fehler dort stoppen die Analyse nicht"""
+        try:
+            self.library.record(output_file, formatted_notes, audio_path, settings)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Hinweis: {output_file} nicht in die Bibliothek eingetragen: {e}")
+
+    def poll_jobs(self, reschedule=True):
+        """Überträgt Zustand, Fortschritt und Restzeit der Aufträge in die Liste"""
+        estimates = self.job_queue.estimates()
+        for job in self.job_queue.jobs:
+            if not self.job_list.exists(job.id):
+                continue
+            eta = estimates.get(job.id)
+            eta_text = "" if job.state in job_queue.FINISHED_STATES else (
+                f"ca. {eta:.0f}s" if eta is not None else "?")
+            shown = (job.version, eta_text)
+            if self.job_versions.get(job.id) == shown:
+                continue
+            self.job_versions[job.id] = shown
+
+            state = job_queue.STATE_LABELS[job.state]
+            if job.state == job_queue.DONE:
+                state += f" ({job.result['notes']} Noten)"
+            progress = f"{job.progress:.0%}" if job.state in (job_queue.RUNNING, job_queue.DONE) else ""
+            self.job_list.item(job.id, values=(state, progress, eta_text))
+
+            if job.state in job_queue.FINISHED_STATES and job.id not in self.reported_jobs:
+                self.reported_jobs.add(job.id)
+                self.job_finished(job)
+
+        if reschedule:
+            self.root.after(JOB_POLL_MS, self.poll_jobs)
+
+    def job_finished(self, job):
+        """Meldet das Ende eines Auftrags (im Tk-Thread)"""
+        if job.state == job_queue.DONE:
+            self.keep_track(job.result['track'])
+            self.status_label.config(text=f"Fertig: {job.name} -> {job.result['output_file']}\n"
+                                          f"{job.result['summary']}")
+        elif job.state == job_queue.FAILED:
+            self.status_label.config(text=f"Fehler bei {job.name}: {job.error}")
+
+        # War es der einzige Auftrag, wie bisher direkt den Player anbieten
+        if not self.job_queue.busy and len(self.job_queue.jobs) == 1:
+            if job.state == job_queue.DONE:
+                output_file = job.result['output_file']
                 if messagebox.askyesno("Erfolg",
                                        f"Noten wurden extrahiert und in {output_file} gespeichert. Möchtest du den Noten-Player starten?"):
                     self.start_player(output_file)
-                else:
-                    messagebox.showinfo("Erfolg", f"Noten wurden erfolgreich in {output_file} gespeichert.")
-
-            self.root.after(0, ask_to_start_player)
-
-            # Zurück zum Anfangsbildschirm
-            self.root.after(1000, self.reset_ui)
-
-        except Exception as e:
-            self.update_status(f"Fehler: {str(e)}")
-            messagebox.showerror("Fehler bei der Analyse", str(e))
-            self.root.after(1000, self.reset_ui)
-
-        self.is_analyzing = False
+            elif job.state == job_queue.FAILED:
+                messagebox.showerror("Fehler bei der Analyse", str(job.error))
+        elif not self.job_queue.busy:
+            counts = {}
+            for finished in self.job_queue.jobs:
+                counts[finished.state] = counts.get(finished.state, 0) + 1
+            self.status_label.config(text="Alle Aufträge abgeschlossen: " + ", ".join(
+                f"{count} {job_queue.STATE_LABELS[state].lower()}" for state, count in counts.items())
+                + ". Doppelklick auf eine fertige Datei startet den Player.")
+
+    def selected_jobs(self):
+        ids = set(self.job_list.selection())
+        return [job for job in self.job_queue.jobs if job.id in ids]
+
+    def cancel_selected(self):
+        for job in self.selected_jobs():
+            self.job_queue.cancel(job)
+
+    def remove_finished(self):
+        for job in self.job_queue.remove_finished():
+            self.job_list.delete(job.id)
+            self.job_versions.pop(job.id, None)
+            self.reported_jobs.discard(job.id)
+
+    def open_job(self, event):
+        """Doppelklick auf eine fertige Datei startet den Player"""
+        job = next((job for job in self.job_queue.jobs if job.id == self.job_list.focus()), None)
+        if job is not None and job.state == job_queue.DONE:
+            self.start_player(job.result['output_file'])
+
+    def on_close(self):
+        # Wartende Aufträge verwerfen, laufende beim nächsten Fortschritt beenden
+        self.job_queue.close()
+        self.root.destroy()
 
     def extract_notes(self, pitches, magnitudes, sr):
         # Hier werden die Noten aus den extrahierten Tonhöhen und Lautstärken ermittelt
-        notes = []
-        current_note = None
-        current_start = 0
-
-        # Wandle die Pitches-Matrix in dominante Tonhöhen pro Frame um
-        times = librosa.times_like(pitches)
-
-        # Verwende ein Fenster für Notenerkennung, um Rauschen zu reduzieren
-        window_size = 3  # Fenster von Frames für stabilere Notenerkennung
-
-        # Initialisiere das Fenster
-        pitch_window = []
-        mag_window = []
-
-        for t, time in enumerate(times):
-            # Finde die dominante Frequenz in diesem Frame
-            index = magnitudes[:, t].argmax()
-            freq = pitches[index, t]
-            mag = magnitudes[index, t]
-
-            # Aktualisiere das Fenster
-            pitch_window.append(freq)
-            mag_window.append(mag)
-
-            # Behalte nur die letzten window_size Frames
-            if len(pitch_window) > window_size:
-                pitch_window.pop(0)
-                mag_window.pop(0)
-
-            # Warte, bis das Fenster gefüllt ist
-            if len(pitch_window) < window_size:
-                continue
+        # Dominante Tonhöhe pro Frame, anschließend Segmentierung über die gesamte Spur
+        freqs, mags = analysis.dominant_track(pitches, magnitudes)
+        return self.extract_notes_from_track(freqs, mags, sr)
+
+    def extract_notes_from_track(self, freqs, mags, sr, smoothed=None):
+        """Segmentiert eine Tonhöhenspur (ein Wert pro Frame, mehrstimmig eine Spalte pro Stimme) in Noten"""
+        times = analysis.frame_times(len(freqs), sr)
+        return analysis.segment_notes(freqs, mags, times,
+                                      min_note_length=self.min_note_length,
+                                      min_magnitude=self.min_magnitude,
+                                      min_pitch=self.min_pitch,
+                                      max_pitch=self.max_pitch,
+                                      smoothed=smoothed)
+
+    def keep_track(self, track):
+        """Merkt sich die Spur der analysierten Datei für Neu-Segmentierung und Optimierung"""
+        self.track = track
+        # Das Schwellwert-Raster bewertet nur einstimmige Spuren
+        self.sweep_btn.config(state=tk.NORMAL if track['freqs'].ndim == 1 else tk.DISABLED)
+        self.apply_btn.config(state=tk.DISABLED)
+        self.track_label.config(text=f"{os.path.basename(track['file'])}: Schwellwerte ändern zeigt "
+                                     f"sofort eine Vorschau")
+
+    def schedule_resegment(self, *_):
+        """Neu segmentieren, sobald die Eingabe kurz ruht"""
+        if self.resegment_job is not None:
+            self.root.after_cancel(self.resegment_job)
+        self.resegment_job = self.root.after(RESEGMENT_DELAY_MS, self.resegment)
+
+    def resegment(self):
+        """Segmentiert die gespeicherte Spur mit den aktuellen Schwellwerten als Vorschau (ohne zu speichern)"""
+        self.resegment_job = None
+        if self.track is None or self.job_queue.is_active(self.track['file']):
+            return
+        try:
+            params = (float(self.note_length_var.get()), float(self.magnitude_var.get()))
+        except ValueError:
+            return  # Eingabe noch unvollständig
+        track = self.track
+        name = os.path.basename(track['file'])
+        if params == track['params']:
+            # Zurück auf den gespeicherten Stand: nichts zu übernehmen
+            track.pop('preview', None)
+            self.apply_btn.config(state=tk.DISABLED)
+            self.track_label.config(text=f"{name}: gespeicherter Stand")
+            return
 
-            # Berechne die mittlere Frequenz und Magnitude im Fenster
-            avg_freq = np.median(pitch_window)  # Median ist robuster gegen Ausreißer
-            avg_mag = np.median(mag_window)
-
-            # Ignoriere Stille oder Geräusche mit niedriger Magnitude
-            if avg_freq <= 0 or avg_mag < self.min_magnitude:
-                if current_note is not None:
-                    # Wenn wir bereits eine Note verfolgen, füge sie hinzu
-                    if time - current_start >= self.min_note_length:
-                        midi_note = librosa.hz_to_midi(current_note)
-                        # Nur Noten im gewünschten Bereich berücksichtigen
-                        if self.min_pitch <= midi_note <= self.max_pitch:
-                            notes.append({
-                                'time': current_start,
-                                'pitch': int(round(midi_note)),
-                                'duration': time - current_start
-                            })
-                    current_note = None
-            else:
-                # Konvertiere Frequenz in MIDI-Notennummern
-                midi_note = librosa.hz_to_midi(avg_freq)
-
-                if current_note is None:
-                    # Starte eine neue Note
-                    current_note = avg_freq
-                    current_start = time
-                elif abs(librosa.hz_to_midi(current_note) - midi_note) > 0.5:  # Verringerte Toleranz für Tonwechsel
-                    # Wenn sich die Note signifikant geändert hat, beende die vorherige
-                    if time - current_start >= self.min_note_length:
-                        midi_note_prev = librosa.hz_to_midi(current_note)
-                        # Nur Noten im gewünschten Bereich berücksichtigen
-                        if self.min_pitch <= midi_note_prev <= self.max_pitch:
-                            notes.append({
-                                'time': current_start,
-                                'pitch': int(round(midi_note_prev)),
-                                'duration': time - current_start
-                            })
-                    current_note = avg_freq
-                    current_start = time
-
-        # Füge die letzte Note hinzu, falls vorhanden
-        if current_note is not None and times[-1] - current_start >= self.min_note_length:
-            midi_note = librosa.hz_to_midi(current_note)
-            # Nur Noten im gewünschten Bereich berücksichtigen
-            if self.min_pitch <= midi_note <= self.max_pitch:
-                notes.append({
-                    'time': current_start,
-                    'pitch': int(round(midi_note)),
-                    'duration': times[-1] - current_start
-                })
-
-        return notes
+        start = time.perf_counter()
+        self.min_note_length, self.min_magnitude = params
+        notes = self.extract_notes_from_track(track['freqs'], track['mags'], track['sr'], track['smoothed'])
+        track['preview'] = (params, self.format_notes(notes))
+        elapsed = time.perf_counter() - start
+        self.apply_btn.config(state=tk.NORMAL)
+        self.track_label.config(text=f"{name}: Vorschau {len(track['preview'][1]['notes'])} Noten "
+                                     f"({elapsed * 1000:.0f} ms), noch nicht gespeichert")
+
+    def apply_resegment(self):
+        """Überschreibt die Notendatei der Spur mit der Vorschau und aktualisiert die Bibliothek"""
+        track = self.track
+        if track is None or 'preview' not in track or self.job_queue.is_active(track['file']):
+            return
+        params, formatted_notes = track.pop('preview')
+        analysis.save_notes(track['output_file'], formatted_notes)
+        track['params'] = params
+        self.index_song(track['output_file'], formatted_notes, track['file'],
+                        dict(track['settings'], min_note_length=params[0], min_magnitude=params[1]))
+        self.apply_btn.config(state=tk.DISABLED)
+        self.track_label.config(text=f"{os.path.basename(track['file'])}: {len(formatted_notes['notes'])} Noten "
+                                     f"gespeichert")
+
+    def sweep_thresholds(self):
+        """Probiert das Schwellwert-Raster auf der gespeicherten Spur aus und trägt die beste Einstellung ein"""
+        if self.track is None or self.track['freqs'].ndim != 1 or self.job_queue.is_active(self.track['file']):
+            return
+        track = self.track
+        start = time.perf_counter()
+        results = analysis.sweep_thresholds(track['freqs'], track['mags'],
+                                            analysis.frame_times(len(track['freqs']), track['sr']),
+                                            self.min_pitch, self.max_pitch, smoothed=track['smoothed'])
+        elapsed = time.perf_counter() - start
+
+        # Eintragen löst über die Variablen-Traces die Vorschau aus; gespeichert wird erst auf Wunsch
+        best = results[0]
+        self.note_length_var.set(str(best['min_note_length']))
+        self.magnitude_var.set(str(best['min_magnitude']))
+
+        ranking = "\n".join(f"{rank}. Notenlänge {result['min_note_length']:g} s, Lautstärke "
+                             f"{result['min_magnitude']:g}: {result['notes']} Noten, Bewertung {result['score']:.2f}"
+                             for rank, result in enumerate(results[:SWEEP_SHOWN], 1))
+        messagebox.showinfo("Schwellwerte optimiert",
+                            f"{len(results)} Kombinationen in {elapsed * 1000:.0f} ms bewertet:\n\n{ranking}\n\n"
+                            f"Die beste Einstellung wurde eingetragen. \"Neu segmentiert speichern\" "
+                            f"überschreibt die Notendatei.")
 
     def format_notes(self, notes):
-        # Runde Zeiten und Dauern auf 1 Nachkommastelle
-        formatted_notes = []
-        for note in notes:
-            formatted_notes.append({
-                'time': round(note['time'], 1),
-                'pitch': note['pitch'],
-                'duration': round(note['duration'], 1)
-            })
-
-        # Sortiere nach Startzeit
-        formatted_notes.sort(key=lambda x: x['time'])
-
-        # Entferne Duplikate (Noten mit gleicher Startzeit und Tonhöhe)
-        unique_notes = []
-        for note in formatted_notes:
-            if not any(n['time'] == note['time'] and n['pitch'] == note['pitch'] for n in unique_notes):
-                unique_notes.append(note)
-
-        return {'notes': unique_notes}
-
-    def update_status(self, text):
-        self.root.after(0, lambda: self.status_label.config(text=text))
-
-    def reset_ui(self):
-        self.progress_bar.stop()
-        self.progress_frame.pack_forget()
-        self.drop_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        return analysis.format_notes(notes)
 
     def start_player(self, notes_file):
         """Startet den Noten-Player mit der erstellten JSON-Datei"""
@@ -371,7 +589,12 @@ def enable_dnd(root):
         root.tk.call('tkdnd::drop_target', 'register', root._w, 'DND_Files')
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audio zu Noten Konverter")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="Zeit bis zum sichtbaren Fenster ausgeben und sofort beenden")
+    args = parser.parse_args(argv)
+
     try:
         from tkinterdnd2 import TkinterDnD
         root = TkinterDnD.Tk()
@@ -386,6 +609,13 @@ def main():
             print("Drag & Drop nicht verfügbar. Nutze bitte den Dateiauswahldialog.")
 
     app = AudioAnalyzerApp(root)
+
+    if args.startup_time:
+        root.update()
+        print(f"Fenster nach {time.perf_counter() - _START:.3f}s")
+        root.destroy()
+        return
+
     root.mainloop()
 
 
@@ -0,0 +1,237 @@
+"""Stapelverarbeitung für sniffer.py ohne GUI.
+
+Beispiel:
+    python sniffer_cli.py songs/ "live/*.flac" -j 4
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import analysis
+from metrics import PipelineMetrics, metrics_path
+from pitch_backends import MAX_VOICES
+from song_library import DEFAULT_LIBRARY_PATH, SongLibrary, analysis_params
+from track_cache import DEFAULT_CACHE_DIR, TrackCache
+
+
+def collect_files(inputs):
+    """Sammelt Audio-Dateien aus Dateien, Verzeichnissen (rekursiv) und Glob-Mustern"""
+    files = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for folder, _, names in os.walk(entry):
+                files.extend(os.path.join(folder, name) for name in sorted(names))
+        elif os.path.exists(entry):
+            files.append(entry)
+        else:
+            files.extend(sorted(glob.glob(entry, recursive=True)))
+
+    # Nur unterstützte Formate, jede Datei nur einmal
+    seen = set()
+    audio_files = []
+    for path in files:
+        key = os.path.abspath(path)
+        if os.path.splitext(path)[1].lower() in analysis.AUDIO_EXTENSIONS and key not in seen:
+            seen.add(key)
+            audio_files.append(path)
+    return audio_files
+
+
+def stored_params(audio_path, library=None):
+    """Parameter, mit denen die vorhandene Notendatei erzeugt wurde, oder None wenn unbekannt
+
+    Ein aktueller Bibliothekseintrag hat Vorrang (er enthält auch in der GUI gespeicherte
+    Neu-Segmentierungen), sonst zählen die Messwerte in der _metrics.json.
+    """
+    output_file = analysis.notes_path(audio_path)
+    if library is not None:
+        try:
+            entry = library.get(output_file)
+            if entry is not None and library.is_current(output_file, entry):
+                return json.loads(entry['params'])
+        except (sqlite3.Error, OSError, ValueError):
+            pass
+    try:
+        with open(metrics_path(audio_path)) as f:
+            return analysis_params(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def is_up_to_date(audio_path, params=None, library=None):
+    """Prüft, ob die Notendatei neuer als die Audio-Datei ist und mit denselben Parametern erzeugt wurde
+
+    Parameter, die für die vorhandene Notendatei nicht bekannt sind (ältere Dateien ohne
+    Messwerte), gelten als gleich. Mit auto_tune werden die Schwellwerte pro Datei gewählt
+    und daher nicht verglichen.
+    """
+    output_file = analysis.notes_path(audio_path)
+    if not os.path.exists(output_file) or os.path.getmtime(output_file) < os.path.getmtime(audio_path):
+        return False
+    stored = stored_params(audio_path, library) if params is not None else None
+    if stored is None:
+        return True
+    wanted = analysis_params(params)
+    if wanted.get('auto_tune'):
+        wanted.pop('min_note_length', None)
+        wanted.pop('min_magnitude', None)
+    return all(name not in stored or stored[name] == value for name, value in wanted.items())
+
+
+def index_notes(library, output_file, notes=None, audio_path=None, params=None):
+    """Trägt eine Notendatei in die Bibliothek ein (ohne notes wird sie gelesen); Fehler dort stoppen nichts"""
+    try:
+        if notes is None:
+            library.add_file(output_file)
+        else:
+            library.record(output_file, notes, audio_path, params)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Hinweis: {output_file} nicht in die Bibliothek eingetragen: {e}", file=sys.stderr)
+
+
+def convert_file(audio_path, params, cache_dir, library_path=None, workers=1):
+    """Analysiert eine Datei im Worker-Prozess, speichert Noten und Messwerte daneben und trägt sie in die Bibliothek ein"""
+    start = time.perf_counter()
+    metrics = PipelineMetrics(file=os.path.abspath(audio_path), chunked=True, workers=workers, **params)
+    cache = TrackCache(cache_dir) if cache_dir else None
+    formatted_notes, duration = analysis.analyze_file(audio_path, cache=cache, workers=workers, metrics=metrics,
+                                                      **params)
+    output_file = analysis.notes_path(audio_path)
+    with metrics.stage("json_write"):
+        analysis.save_notes(output_file, formatted_notes)
+
+    metrics.info.update(notes=len(formatted_notes['notes']), audio_seconds=round(duration, 2))
+    metrics.save(metrics_path(audio_path))
+    if library_path:
+        # metrics.info enthält auch die mit --auto-tune gewählten Schwellwerte
+        index_notes(SongLibrary(library_path), output_file, formatted_notes, audio_path, metrics.info)
+    return output_file, len(formatted_notes['notes']), duration, time.perf_counter() - start, metrics.to_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Konvertiert Audio-Dateien ohne GUI in Notendateien (_notes.json)")
+    parser.add_argument("inputs", nargs="+", help="Audio-Dateien, Verzeichnisse oder Glob-Muster")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Anzahl paralleler Worker-Prozesse (Standard: Anzahl der Kerne)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Auch Dateien mit aktueller Notendatei neu analysieren (ohne -f werden nur Dateien "
+                             "übersprungen, deren Notendatei neuer ist und mit denselben Parametern entstand)")
+    parser.add_argument("--min-note-length", type=float, default=analysis.MIN_NOTE_LENGTH,
+                        help="Minimale Notendauer in Sekunden")
+    parser.add_argument("--min-magnitude", type=float, default=analysis.MIN_MAGNITUDE,
+                        help="Minimale Lautstärke für eine gültige Note")
+    parser.add_argument("--auto-tune", action="store_true",
+                        help="Schwellwerte pro Datei automatisch wählen (ersetzt --min-note-length/--min-magnitude)")
+    parser.add_argument("--backend", choices=list(analysis.BACKENDS), default=analysis.DEFAULT_BACKEND,
+                        help="Verfahren der Tonhöhenerkennung: yin (schnell), piptrack (bisher), pyin (genau, langsam)")
+    parser.add_argument("--voices", type=int, default=1,
+                        help=f"Bis zu so viele gleichzeitige Töne erkennen (1-{MAX_VOICES}, mehrstimmig nur mit piptrack)")
+    parser.add_argument("--native-rate", action="store_true",
+                        help="Mit der Originalrate der Datei analysieren statt mit der reduzierten Analyse-Abtastrate")
+    parser.add_argument("--split", action="store_true",
+                        help="Dateien nacheinander analysieren und jede auf alle Worker aufteilen "
+                             "(sinnvoll für wenige lange Aufnahmen)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Verzeichnis des Tonhöhen-Caches")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Tonhöhenspuren weder aus dem Cache lesen noch speichern")
+    parser.add_argument("--library", default=DEFAULT_LIBRARY_PATH,
+                        help="Song-Bibliothek, in die jede Notendatei eingetragen wird (siehe song_library.py)")
+    parser.add_argument("--no-library", action="store_true",
+                        help="Notendateien nicht in die Song-Bibliothek eintragen")
+    args = parser.parse_args(argv)
+    if args.voices != 1:
+        try:
+            analysis.get_backend(args.backend, analysis.MIN_PITCH, analysis.MAX_PITCH, args.voices)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.auto_tune:
+            parser.error("--auto-tune ist nur für die einstimmige Erkennung verfügbar")
+
+    files = collect_files(args.inputs)
+    if not files:
+        print("Keine Audio-Dateien gefunden.")
+        return 1
+
+    params = {
+        'min_note_length': args.min_note_length,
+        'min_magnitude': args.min_magnitude,
+        'backend': args.backend,
+        'resample': not args.native_rate,
+        'auto_tune': args.auto_tune,
+        'voices': args.voices,
+    }
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    library_path = None if args.no_library else args.library
+    library = SongLibrary(library_path) if library_path else None
+    pending = [path for path in files if args.force or not is_up_to_date(path, params, library)]
+    skipped = len(files) - len(pending)
+
+    print(f"{len(pending)} Datei(en) zu analysieren, {skipped} bereits aktuell, {args.jobs} Worker")
+    start = time.perf_counter()
+    audio_seconds = 0.0
+    failed = 0
+    stage_totals = {}
+
+    if library is not None:
+        # Bereits aktuelle Notendateien nachtragen, falls sie in der Bibliothek fehlen oder veraltet sind
+        pending_set = set(pending)
+        for path in files:
+            output_file = analysis.notes_path(path)
+            if path not in pending_set and not library.is_current(output_file):
+                index_notes(library, output_file)
+
+    def report(done, path, result):
+        output_file, note_count, duration, elapsed, file_metrics = result
+        print(f"[{done}/{len(pending)}] {path} -> {output_file} "
+              f"({note_count} Noten, {duration:.1f}s Audio in {elapsed:.1f}s)")
+        for stage, values in file_metrics['stages'].items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + values['wall']
+        return duration
+
+    def report_error(done, path, error):
+        print(f"[{done}/{len(pending)}] Fehler bei {path}: {error}", file=sys.stderr)
+
+    if args.split:
+        # Eine Datei nach der anderen, jeweils auf alle Worker verteilt
+        for done, path in enumerate(pending, 1):
+            try:
+                result = convert_file(path, params, cache_dir, library_path, workers=args.jobs)
+            except Exception as e:
+                failed += 1
+                report_error(done, path, e)
+                continue
+            audio_seconds += report(done, path, result)
+    else:
+        # Jeder Worker dekodiert blockweise mit Read-Ahead, die Dateien werden einzeln verteilt
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(pending)))) as pool:
+            futures = {pool.submit(convert_file, path, params, cache_dir, library_path): path for path in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    report_error(done, path, e)
+                    continue
+                audio_seconds += report(done, path, result)
+
+    wall = time.perf_counter() - start
+    converted = len(pending) - failed
+    print(f"Fertig: {converted} konvertiert, {skipped} übersprungen, {failed} fehlgeschlagen in {wall:.1f}s")
+    if wall > 0 and converted:
+        print(f"Durchsatz: {converted / wall:.2f} Dateien/s, {audio_seconds / wall:.1f} Audio-Sekunden pro Sekunde")
+    if stage_totals:
+        # Summe über alle Dateien (bei parallelen Workern größer als die Gesamtdauer)
+        print("Zeit pro Stufe: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stage_totals.items()))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
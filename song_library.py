@@ -0,0 +1,306 @@
+"""Bibliothek aller analysierten Songs: ein SQLite-Index über die Notendateien.
+
+Pro Notendatei speichert der Index Titel, Pfade von Noten und Audio, den Hash der Audio-Datei,
+die Analyse-Parameter, Notenanzahl, Dauer und Tonumfang. sniffer.py und sniffer_cli.py tragen
+jede geschriebene Notendatei sofort ein; spitter_gui.py listet und durchsucht die Bibliothek,
+ohne eine Notendatei zu öffnen. Bereits vorhandene Notendateien nimmt scan auf:
+
+    python song_library.py scan songs/
+    python song_library.py list "queen"
+
+Jeder Zugriff öffnet eine eigene Verbindung, daher dürfen Threads und Prozesse (Worker von
+sniffer_cli) gleichzeitig schreiben. Der Index lässt sich jederzeit aus den Notendateien neu
+aufbauen; bei einer neuen Formatversion wird er verworfen.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing, contextmanager
+
+import notes_io
+from analysis import AUDIO_EXTENSIONS
+from metrics import metrics_path
+from track_cache import file_digest
+
+# Version des Tabellenformats; bei Änderungen erhöhen, ältere Indizes werden dann neu angelegt
+LIBRARY_VERSION = 1
+
+DEFAULT_LIBRARY_PATH = os.environ.get(
+    "KARAOKE_SNIFFER_LIBRARY",
+    os.path.join(os.path.expanduser("~"), ".cache", "karaoke-sniffer", "library.sqlite3"))
+
+LOCK_TIMEOUT = 10.0  # Sekunden, die ein Schreiber auf einen anderen wartet
+SEARCH_LIMIT = 500  # Höchstens so viele Treffer pro Suche
+
+NOTES_SUFFIX = "_notes.json"
+
+# Parameter, die das Ergebnis der Analyse bestimmen (Ausführungsdetails wie workers gehören nicht dazu)
+ANALYSIS_PARAMS = ('min_note_length', 'min_magnitude', 'backend', 'voices', 'resample', 'auto_tune')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    notes_path TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    audio_path TEXT,
+    audio_hash TEXT,
+    params TEXT NOT NULL,
+    note_count INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    min_pitch INTEGER,
+    max_pitch INTEGER,
+    notes_mtime REAL NOT NULL,
+    notes_size INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_title ON songs (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS songs_audio_hash ON songs (audio_hash);
+"""
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+
+
+def note_name(pitch):
+    """MIDI-Tonhöhe als Notenname mit Oktave (60 = C4)"""
+    return f"{NOTE_NAMES[pitch % 12]}{pitch // 12 - 1}"
+
+
+def find_audio(notes_path):
+    """Sucht die Audio-Datei, aus der eine Notendatei entstanden ist (siehe analysis.notes_path)"""
+    if not notes_path.endswith(NOTES_SUFFIX):
+        return None
+    stem = notes_path[:-len(NOTES_SUFFIX)]
+    for extension in AUDIO_EXTENSIONS:
+        for candidate in (stem + extension, stem + extension.upper()):
+            if os.path.exists(candidate):
+                return candidate
+    return None
+
+
+def song_title(notes_path, audio_path=None):
+    """Anzeigename: Name der Audio-Datei, sonst der Notendatei ohne Endung"""
+    if audio_path:
+        return os.path.splitext(os.path.basename(audio_path))[0]
+    name = os.path.basename(notes_path)
+    return name[:-len(NOTES_SUFFIX)] if name.endswith(NOTES_SUFFIX) else os.path.splitext(name)[0]
+
+
+def analysis_params(settings):
+    """Die ergebnisrelevanten Einträge aus Einstellungen oder Messwerten (siehe ANALYSIS_PARAMS)"""
+    return {name: settings[name] for name in ANALYSIS_PARAMS if name in settings}
+
+
+def _like_pattern(word):
+    escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class SongLibrary:
+    """Zugriff auf den Index in der SQLite-Datei path; Einträge sind Dictionaries mit den Tabellenspalten"""
+
+    def __init__(self, path=DEFAULT_LIBRARY_PATH):
+        self.path = path
+        self._ready = False
+
+    @contextmanager
+    def _connect(self):
+        """Eigene Verbindung pro Zugriff; Änderungen werden am Ende gemeinsam gespeichert"""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)) as db:
+            db.row_factory = sqlite3.Row
+            if not self._ready:
+                self._prepare(db)
+            with db:
+                yield db
+
+    def _prepare(self, db):
+        # WAL: Leser (die GUI) blockieren die schreibenden Worker nicht
+        db.execute("PRAGMA journal_mode=WAL")
+        # Version unter Schreibsperre prüfen, sonst könnte ein zweiter Prozess die eben angelegte Tabelle verwerfen
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] != LIBRARY_VERSION:
+                db.execute("DROP TABLE IF EXISTS songs")
+                db.execute(f"PRAGMA user_version={LIBRARY_VERSION}")
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    db.execute(statement)
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        self._ready = True
+
+    def record(self, notes_path, notes, audio_path=None, params=None, audio_hash=None):
+        """Trägt eine Notendatei ein oder aktualisiert sie
+
+        notes sind die gerade gespeicherten Noten (NoteArrays oder das formatierte {'notes': [...]}),
+        die Datei wird dafür nicht erneut gelesen. Der Hash der Audio-Datei wird bei Bedarf
+        berechnet (innerhalb eines Prozesses nur einmal pro Dateistand, siehe track_cache.file_digest).
+        """
+        if not isinstance(notes, notes_io.NoteArrays):
+            notes = notes_io.NoteArrays.from_records(notes['notes'], presorted=True)
+        notes_path = os.path.abspath(notes_path)
+        if audio_path is not None:
+            audio_path = os.path.abspath(audio_path)
+            if audio_hash is None and os.path.exists(audio_path):
+                audio_hash = file_digest(audio_path)
+        stat = os.stat(notes_path)
+        has_notes = len(notes) > 0
+        entry = {
+            'notes_path': notes_path,
+            'title': song_title(notes_path, audio_path),
+            'audio_path': audio_path,
+            'audio_hash': audio_hash,
+            'params': json.dumps(analysis_params(params or {}), sort_keys=True),
+            'note_count': len(notes),
+            'duration': notes.total_time,
+            'min_pitch': int(notes.pitches.min()) if has_notes else None,
+            'max_pitch': int(notes.pitches.max()) if has_notes else None,
+            'notes_mtime': stat.st_mtime,
+            'notes_size': stat.st_size,
+            'indexed_at': time.time(),
+        }
+        with self._connect() as db:
+            db.execute(f"INSERT OR REPLACE INTO songs ({', '.join(entry)}) "
+                       f"VALUES ({', '.join(':' + name for name in entry)})", entry)
+        return entry
+
+    def add_file(self, notes_path):
+        """Liest eine vorhandene Notendatei (Binärdatei bevorzugt) und trägt sie ein
+
+        Audio-Datei und Parameter werden neben der Notendatei gesucht (Audio mit gleichem Namen,
+        Parameter aus der _metrics.json).
+        """
+        notes = notes_io.load_notes(notes_path)
+        audio_path = find_audio(notes_path)
+        params = {}
+        if audio_path is not None:
+            try:
+                with open(metrics_path(audio_path)) as f:
+                    params = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self.record(notes_path, notes, audio_path, params)
+
+    def is_current(self, notes_path, entry=None):
+        """Prüft, ob der Eintrag zum aktuellen Stand der Notendatei passt"""
+        entry = entry or self.get(notes_path)
+        try:
+            stat = os.stat(notes_path)
+        except OSError:
+            return False
+        return entry is not None and entry['notes_mtime'] == stat.st_mtime and entry['notes_size'] == stat.st_size
+
+    def scan(self, folder, progress=None):
+        """Nimmt alle neuen oder geänderten Notendateien unter folder auf (rekursiv)
+
+        Liefert (aufgenommen, unverändert, fehlerhaft); progress(fertig, gesamt) nach jeder Datei.
+        """
+        paths = []
+        for root, _, names in os.walk(folder):
+            paths.extend(os.path.abspath(os.path.join(root, name)) for name in sorted(names)
+                         if name.endswith(NOTES_SUFFIX))
+
+        known = {}
+        with self._connect() as db:
+            for row in db.execute("SELECT notes_path, notes_mtime, notes_size FROM songs"):
+                known[row['notes_path']] = row
+
+        added = unchanged = failed = 0
+        for done, path in enumerate(paths, 1):
+            if path in known and self.is_current(path, known[path]):
+                unchanged += 1
+            else:
+                try:
+                    self.add_file(path)
+                    added += 1
+                except (OSError, ValueError, KeyError, TypeError):
+                    failed += 1
+            if progress is not None:
+                progress(done, len(paths))
+        return added, unchanged, failed
+
+    def prune(self):
+        """Entfernt Einträge, deren Notendatei nicht mehr existiert; liefert ihre Anzahl"""
+        with self._connect() as db:
+            missing = [row['notes_path'] for row in db.execute("SELECT notes_path FROM songs")
+                       if not os.path.exists(row['notes_path'])]
+            db.executemany("DELETE FROM songs WHERE notes_path = ?", [(path,) for path in missing])
+        return len(missing)
+
+    def remove(self, notes_path):
+        with self._connect() as db:
+            db.execute("DELETE FROM songs WHERE notes_path = ?", (os.path.abspath(notes_path),))
+
+    def get(self, notes_path):
+        """Eintrag einer Notendatei oder None"""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM songs WHERE notes_path = ?", (os.path.abspath(notes_path),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _where(self, text):
+        """Jedes Suchwort muss im Titel oder im Pfad der Audio-Datei vorkommen (ohne Groß-/Kleinschreibung)"""
+        words = text.split()
+        clause = " AND ".join("(title LIKE ? ESCAPE '\\' OR IFNULL(audio_path, notes_path) LIKE ? ESCAPE '\\')"
+                              for _ in words)
+        values = [pattern for word in words for pattern in (_like_pattern(word),) * 2]
+        return (f"WHERE {clause}" if words else ""), values
+
+    def search(self, text="", limit=SEARCH_LIMIT):
+        """Einträge, deren Titel oder Pfad alle Suchwörter enthält, nach Titel sortiert"""
+        where, values = self._where(text)
+        with self._connect() as db:
+            rows = db.execute(f"SELECT * FROM songs {where} ORDER BY title COLLATE NOCASE, notes_path LIMIT ?",
+                              values + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, text=""):
+        """Anzahl der Treffer einer Suche (ohne Begrenzung)"""
+        where, values = self._where(text)
+        with self._connect() as db:
+            return db.execute(f"SELECT COUNT(*) FROM songs {where}", values).fetchone()[0]
+
+
+def format_entry(entry):
+    """Dauer, Notenanzahl und Tonumfang eines Eintrags als Text"""
+    minutes, seconds = divmod(int(round(entry['duration'])), 60)
+    pitch_range = (f"{note_name(entry['min_pitch'])}-{note_name(entry['max_pitch'])}"
+                   if entry['min_pitch'] is not None else "-")
+    return f"{minutes}:{seconds:02d}", str(entry['note_count']), pitch_range
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bibliothek der analysierten Songs (SQLite-Index der Notendateien)")
+    parser.add_argument("--library", default=DEFAULT_LIBRARY_PATH, help="Pfad der Bibliotheksdatei")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scan_parser = commands.add_parser("scan", help="Vorhandene Notendateien aufnehmen (rekursiv)")
+    scan_parser.add_argument("folders", nargs="+")
+    list_parser = commands.add_parser("list", help="Songs auflisten oder durchsuchen")
+    list_parser.add_argument("query", nargs="*", help="Suchwörter (Titel oder Pfad)")
+    list_parser.add_argument("-n", "--limit", type=int, default=SEARCH_LIMIT)
+    commands.add_parser("prune", help="Einträge ohne Notendatei entfernen")
+    args = parser.parse_args(argv)
+
+    library = SongLibrary(args.library)
+    if args.command == "scan":
+        for folder in args.folders:
+            added, unchanged, failed = library.scan(folder)
+            print(f"{folder}: {added} aufgenommen, {unchanged} unverändert, {failed} fehlerhaft")
+    elif args.command == "list":
+        query = " ".join(args.query)
+        entries = library.search(query, args.limit)
+        for entry in entries:
+            duration, note_count, pitch_range = format_entry(entry)
+            print(f"{entry['title']}  {duration}  {note_count} Noten  {pitch_range}  {entry['notes_path']}")
+        print(f"{len(entries)} von {library.count(query)} Songs")
+    elif args.command == "prune":
+        print(f"{library.prune()} Einträge entfernt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
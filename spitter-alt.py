@@ -1,24 +1,41 @@
-import json
+import argparse
 import numpy as np
 import simpleaudio as sa
 import time
-import sys
+
+import mixer
+import notes_io
+import scheduler as note_scheduler
+import synth
+
+try:
+    import sounddevice as sd
+except ImportError:
+    # Ohne sounddevice nur Wiedergabe mit einem Stream pro Note
+    sd = None
 
 
 class SimpleNotePlayer:
-    def __init__(self, json_file):
+    def __init__(self, json_file=None, notes=None, stop_event=None):
         # MIDI zu Frequenz Umrechnung
         self.midi_to_freq = lambda midi_note: 440 * 2 ** ((midi_note - 69) / 12)
 
         # Sample-Rate
         self.sample_rate = 44100
 
-        # JSON Datei laden
-        with open(json_file, 'r') as f:
-            self.data = json.load(f)
+        # Cache für bereits erzeugte Töne (wiederholte Noten ohne erneute Synthese)
+        self.tone_cache = synth.ToneCache()
+
+        # Notendatei öffnen (JSON oder Binärformat), die Noten sind nach Startzeit sortiert; JSON wird im
+        # Hintergrund weitergelesen, die Wiedergabe beginnt nach dem ersten Block. Bereits geladene Noten
+        # (z.B. aus dem Player-Dienst der GUI) werden direkt übernommen
+        self.notes = notes if notes is not None else notes_io.open_notes(json_file)
 
-        # Noten sortieren nach Startzeit
-        self.notes = sorted(self.data['notes'], key=lambda x: x['time'])
+        # Von außen gesetztes Event beendet die Wiedergabe
+        self.stop_event = stop_event
+
+    def stop_requested(self):
+        return self.stop_event is not None and self.stop_event.is_set()
 
     def generate_sine_wave(self, frequency, duration, volume=0.5):
         """Generiert einen Sinuston mit gegebener Frequenz und Dauer"""
@@ -42,7 +59,76 @@ class SimpleNotePlayer:
         audio = audio * volume * 32767
         return audio.astype(np.int16)
 
-    def play(self):
+    def play_prerendered(self):
+        """Rendert den ganzen Song vorab und spielt ihn als einen einzigen Puffer ab"""
+        self.notes = self.notes.wait()
+        print("Rendere Song...")
+        audio_data = synth.to_int16(synth.render_notes(self.notes, self.sample_rate))
+
+        print("Starte Wiedergabe...")
+        play_obj = sa.play_buffer(audio_data, 1, 2, self.sample_rate)
+        start_time = time.time()
+
+        try:
+            # Noten nur noch zur Information ausgeben, der Ton läuft bereits
+            for note in self.notes:
+                if self.stop_requested():
+                    break
+                delay = note['time'] - (time.time() - start_time)
+                if delay > 0:
+                    time.sleep(delay)
+                freq = self.midi_to_freq(note['pitch'])
+                print(f"Zeit: {note['time']:.2f}s - Note: MIDI {note['pitch']}, Frequenz {freq:.2f}Hz, "
+                      f"Dauer {note['duration']}s")
+
+            while play_obj.is_playing() and not self.stop_requested():
+                time.sleep(0.05)
+            play_obj.stop()
+            print("Wiedergabe beendet.")
+
+        except KeyboardInterrupt:
+            play_obj.stop()
+            print("\nWiedergabe abgebrochen.")
+
+    def play_mixed(self, max_voices=mixer.MAX_VOICES, lookahead=note_scheduler.LOOKAHEAD):
+        """Spielt alle Noten über einen einzigen Ausgabe-Stream mit Mixer und Stimmen-Pool"""
+        if sd is None:
+            raise RuntimeError("Der Mixer-Modus benötigt sounddevice. Installiere es mit: pip install sounddevice")
+
+        voice_mixer = mixer.VoiceMixer(self.sample_rate, max_voices)
+        stream = sd.OutputStream(samplerate=self.sample_rate, channels=1, dtype='float32',
+                                 blocksize=mixer.BLOCK_SIZE, callback=voice_mixer.callback)
+
+        scheduler = note_scheduler.NoteScheduler(self.notes, voice_mixer, lookahead)
+
+        print("Starte Wiedergabe...")
+        with stream:
+            # Noten werden nach der Audio-Uhr sampelgenau eingeplant, hier wird nur gewartet
+            scheduler.start()
+            try:
+                while not scheduler.finished and not self.stop_requested():
+                    time.sleep(0.05)
+
+                print("Wiedergabe beendet.")
+                print(scheduler.report())
+                if voice_mixer.stolen:
+                    print(f"{voice_mixer.stolen} Stimmen übernommen (mehr als {max_voices} gleichzeitige Noten)")
+
+            except KeyboardInterrupt:
+                print("\nWiedergabe abgebrochen.")
+            finally:
+                scheduler.stop()
+
+    def play(self, max_voices=mixer.MAX_VOICES, lookahead=note_scheduler.LOOKAHEAD):
+        """Sampelgenaue Wiedergabe über den Mixer, ohne sounddevice ein Stream pro Note"""
+        if sd is not None:
+            self.play_mixed(max_voices, lookahead)
+        else:
+            self.play_polling()
+
+    def play_polling(self):
+        self.notes = self.notes.wait()
+
         # Startzeit merken
         print("Starte Wiedergabe...")
         start_time = time.time()
@@ -51,7 +137,7 @@ class SimpleNotePlayer:
 
         # Hauptloop
         try:
-            while current_note_index < len(self.notes):
+            while current_note_index < len(self.notes) and not self.stop_requested():
                 # Aktuelle Zeit im Stück berechnen
                 elapsed = time.time() - start_time
 
@@ -63,8 +149,9 @@ class SimpleNotePlayer:
                     # Frequenz aus MIDI-Note berechnen
                     freq = self.midi_to_freq(note['pitch'])
 
-                    # Ton erzeugen und abspielen
-                    audio_data = self.generate_sine_wave(freq, note['duration'])
+                    # Ton aus dem Cache holen (oder erzeugen) und abspielen
+                    audio_data = self.tone_cache.get(note['pitch'], note['duration'], 0.5, self.sample_rate,
+                                                     self.generate_sine_wave)
                     play_obj = sa.play_buffer(audio_data, 1, 2, self.sample_rate)
                     active_playbacks.append(play_obj)
 
@@ -83,24 +170,44 @@ class SimpleNotePlayer:
 
             # Warten, bis alle Noten fertig sind
             print("Alle Noten gestartet. Warte auf Ende der Wiedergabe...")
-            while any(p.is_playing() for p in active_playbacks):
+            while any(p.is_playing() for p in active_playbacks) and not self.stop_requested():
                 active_playbacks = [p for p in active_playbacks if p.is_playing()]
                 time.sleep(0.1)
 
+            for p in active_playbacks:
+                p.stop()
             print("Wiedergabe beendet.")
+            print(self.tone_cache.stats())
 
         except KeyboardInterrupt:
             print("\nWiedergabe abgebrochen.")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        json_file = sys.argv[1]
-    else:
-        json_file = "paste.txt"  # Standard-Dateiname
+    parser = argparse.ArgumentParser(description="Spielt eine Notendatei ohne Anzeige ab")
+    parser.add_argument("json_file", nargs="?", default="paste.txt", help="Notendatei (JSON oder .bin)")
+    parser.add_argument("--prerender", action="store_true",
+                        help="Den ganzen Song vorab rendern und als einen Puffer abspielen")
+    parser.add_argument("--polling", action="store_true",
+                        help="Alter Modus: ein Stream pro Note, gestartet nach der Systemuhr "
+                             "(Standard ist der Mixer mit einem durchgehenden Stream, falls sounddevice installiert ist)")
+    parser.add_argument("--voices", type=int, default=mixer.MAX_VOICES,
+                        help="Maximale Anzahl gleichzeitiger Stimmen im Mixer-Modus")
+    parser.add_argument("--lookahead", type=float, default=note_scheduler.LOOKAHEAD,
+                        help="Vorlauf in Sekunden, mit dem Noten an den Mixer übergeben werden")
+    parser.add_argument("--export", metavar="WAV", help="Nur als WAV-Datei exportieren, nicht abspielen")
+    args = parser.parse_args()
 
     try:
-        player = SimpleNotePlayer(json_file)
-        player.play()
+        if args.export:
+            synth.export_wav(args.json_file, args.export)
+        else:
+            player = SimpleNotePlayer(args.json_file)
+            if args.prerender:
+                player.play_prerendered()
+            elif args.polling:
+                player.play_polling()
+            else:
+                player.play(args.voices, args.lookahead)
     except Exception as e:
         print(f"Fehler: {e}")
\ No newline at end of file
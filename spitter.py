@@ -1,14 +1,26 @@
-import json
-import sys
+import argparse
+import colorsys
 import time
+from collections import OrderedDict
 
 import numpy as np
 import pygame
 from pygame.mixer import Sound, get_init, pre_init
 
+import mixer
+import notes_io
+import scheduler as note_scheduler
+import synth
+
+try:
+    import sounddevice as sd
+except ImportError:
+    # Ohne sounddevice werden die Noten wie bisher einzeln über pygame gestartet
+    sd = None
+
 
 class NotePlayer:
-    def __init__(self, json_file):
+    def __init__(self, json_file=None, notes=None, stop_event=None, keep_alive=False):
         # MIDI zu Frequenz Umrechnung
         self.midi_to_freq = lambda midi_note: 440 * 2 ** ((midi_note - 69) / 12)
 
@@ -22,12 +34,14 @@ class NotePlayer:
         self.text_color = (255, 255, 255)
         self.accent_color = (75, 140, 205)
 
-        # JSON Datei laden
-        with open(json_file, 'r') as f:
-            self.data = json.load(f)
+        # Notendatei öffnen (JSON oder Binärformat), die Noten sind nach Startzeit sortiert; JSON wird im
+        # Hintergrund weitergelesen, die Wiedergabe beginnt nach dem ersten Block. Bereits geladene Noten
+        # (z.B. aus dem Player-Dienst der GUI) werden direkt übernommen
+        self.notes = notes if notes is not None else notes_io.open_notes(json_file)
 
-        # Noten sortieren nach Startzeit
-        self.notes = sorted(self.data['notes'], key=lambda x: x['time'])
+        # Von außen gesetztes Event beendet die Wiedergabe; keep_alive lässt pygame danach initialisiert
+        self.stop_event = stop_event
+        self.keep_alive = keep_alive
 
         # Display einrichten
         self.width, self.height = 800, 400
@@ -36,8 +50,17 @@ class NotePlayer:
         self.font = pygame.font.SysFont('Arial', 20)
         self.small_font = pygame.font.SysFont('Arial', 16)
 
+        # Cache für bereits erzeugte Töne (wiederholte Noten ohne erneute Synthese)
+        sample_rate, _, channels = get_init()
+        self.tone_cache = synth.ToneCache(
+            sizeof=lambda sound: int(sound.get_length() * sample_rate) * 2 * channels)
+
         # Berechnung der max. Zeit für die Fortschrittsanzeige
-        self.total_time = max(note['time'] + note['duration'] for note in self.notes)
+        self.total_time = self.notes.total_time
+
+        # Renderer für Fortschritt und Piano-Roll
+        self.renderer = PianoRollRenderer(self.screen, self.notes, self.total_time, self.font, self.small_font,
+                                          self.background_color, self.text_color, self.accent_color)
 
     def generate_sine_wave(self, frequency, duration, volume=0.5):
         """Generiert einen Sinuston mit gegebener Frequenz und Dauer"""
@@ -64,7 +87,84 @@ class NotePlayer:
 
         return Sound(buf)
 
-    def play(self):
+    def wait_for_notes(self):
+        """Wartet auf alle Noten (für die Modi, die den ganzen Song kennen müssen)"""
+        self.notes = self.notes.wait()
+        self.total_time = self.notes.total_time
+        self.renderer.set_notes(self.notes)
+
+    def play_prerendered(self):
+        """Rendert den ganzen Song vorab und spielt ihn als einen einzigen Puffer ab"""
+        self.wait_for_notes()
+        sample_rate, _, channels = get_init()
+        samples = synth.to_int16(synth.render_notes(self.notes, sample_rate))
+        if channels > 1:
+            samples = np.repeat(samples[:, None], channels, axis=1)
+        sound = pygame.sndarray.make_sound(samples)
+
+        start_time = time.time()
+        sound.play()
+        current_note_index = 0
+        running = True
+
+        # Während der Wiedergabe nur noch die Anzeige aktualisieren
+        while running and time.time() - start_time < self.total_time:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    running = False
+            if self.stop_requested():
+                running = False
+
+            elapsed = time.time() - start_time
+            while (current_note_index < len(self.notes) and
+                   self.notes[current_note_index]['time'] <= elapsed):
+                current_note_index += 1
+
+            self.draw_ui(elapsed, current_note_index)
+            time.sleep(0.01)
+
+        sound.stop()
+        self.close()
+
+    def play(self, lookahead=note_scheduler.LOOKAHEAD):
+        """Sampelgenaue Wiedergabe über den Mixer, ohne sounddevice wie bisher per pygame"""
+        if sd is not None:
+            self.play_scheduled(lookahead)
+        else:
+            self.play_polling()
+
+    def play_scheduled(self, lookahead=note_scheduler.LOOKAHEAD):
+        """Audio-Zeitachse über Scheduler und Mixer, die Anzeige folgt nur der Audio-Uhr"""
+        sample_rate = get_init()[0]
+        voice_mixer = mixer.VoiceMixer(sample_rate, mixer.MAX_VOICES)
+        scheduler = note_scheduler.NoteScheduler(self.notes, voice_mixer, lookahead)
+        stream = sd.OutputStream(samplerate=sample_rate, channels=1, dtype='float32',
+                                 blocksize=mixer.BLOCK_SIZE, callback=voice_mixer.callback)
+        running = True
+
+        with stream:
+            scheduler.start()
+            try:
+                # Ein langsamer Frame verschiebt hier nur die Anzeige, nicht die Noteneinsätze
+                while running and not scheduler.finished:
+                    for event in pygame.event.get():
+                        if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                            running = False
+                    if self.stop_requested():
+                        running = False
+
+                    elapsed = max(0.0, scheduler.song_time(stream.latency))
+                    self.draw_ui(elapsed, scheduler.notes_started(elapsed))
+                    time.sleep(0.01)
+            finally:
+                scheduler.stop()
+
+        print(scheduler.report())
+        self.close()
+
+    def play_polling(self):
+        self.wait_for_notes()
+
         # Startzeit merken
         start_time = time.time()
         current_note_index = 0
@@ -76,6 +176,8 @@ class NotePlayer:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                     running = False
+            if self.stop_requested():
+                running = False
 
             # Aktuelle Zeit im Stück berechnen
             elapsed = time.time() - start_time
@@ -88,8 +190,9 @@ class NotePlayer:
                 # Frequenz aus MIDI-Note berechnen
                 freq = self.midi_to_freq(note['pitch'])
 
-                # Ton erzeugen und abspielen
-                sound = self.generate_sine_wave(freq, note['duration'])
+                # Ton aus dem Cache holen (oder erzeugen) und abspielen
+                sound = self.tone_cache.get(note['pitch'], note['duration'], 0.5, get_init()[0],
+                                            self.generate_sine_wave)
                 sound.play()
 
                 # Info ausgeben
@@ -111,93 +214,213 @@ class NotePlayer:
             if remaining_time > 0:
                 time.sleep(remaining_time)
 
-        pygame.quit()
-
-    def draw_ui(self, current_time, current_note_index):
-        # Hintergrund
-        self.screen.fill(self.background_color)
-
-        # Fortschrittsbalken
-        progress_width = int((current_time / self.total_time) * self.width)
-        pygame.draw.rect(self.screen, self.accent_color, (0, 30, progress_width, 10))
-
-        # Aktuelle Zeit / Gesamtzeit
-        time_text = self.font.render(f"Zeit: {current_time:.1f}s / {self.total_time:.1f}s", True, self.text_color)
-        self.screen.blit(time_text, (20, 50))
-
-        # Aktuelle Note / Gesamtzahl der Noten
-        note_count_text = self.font.render(f"Note: {current_note_index}/{len(self.notes)}", True, self.text_color)
-        self.screen.blit(note_count_text, (20, 80))
+        print(self.tone_cache.stats())
+        self.close()
 
-        # Anzeige der letzten 5 gespielten Noten
-        if current_note_index > 0:
-            start_idx = max(0, current_note_index - 5)
-            recent_notes = self.notes[start_idx:current_note_index]
-
-            self.screen.blit(self.font.render("Zuletzt gespielte Noten:", True, self.text_color), (20, 120))
+    def stop_requested(self):
+        return self.stop_event is not None and self.stop_event.is_set()
 
-            for i, note in enumerate(reversed(recent_notes)):
-                freq = self.midi_to_freq(note['pitch'])
-                note_text = self.small_font.render(
-                    f"MIDI: {note['pitch']}, Freq: {freq:.2f}Hz, Dauer: {note['duration']}s",
-                    True, self.text_color
-                )
-                self.screen.blit(note_text, (40, 150 + i * 25))
+    def close(self):
+        """Beendet die Wiedergabe; mit keep_alive bleiben pygame und der Mixer für die nächste initialisiert"""
+        pygame.mixer.stop()
+        if self.keep_alive:
+            pygame.display.quit()
+        else:
+            pygame.quit()
 
-        # Piano Roll Visualisierung im unteren Bereich
-        piano_roll_height = 150
-        piano_roll_top = self.height - piano_roll_height
-
-        # Horizontale Linien für einige MIDI-Noten
+    def draw_ui(self, current_time, current_note_index):
+        # Zeichnen übernimmt der Renderer (gecachte Flächen, nur geänderte Bereiche)
+        self.renderer.draw(current_time, current_note_index)
+
+
+class PianoRollRenderer:
+    """Zeichnet Fortschritt, zuletzt gespielte Noten und die Piano-Roll.
+
+    Statische Teile (Hintergrund, Raster, Beschriftungen) werden einmal vorgerendert,
+    Farben pro Tonhöhe und Textflächen gecacht. Die sichtbaren Noten werden per
+    binärer Suche über die sortierten Startzeiten gefunden, so dass die Kosten pro
+    Frame nicht von der Länge des Songs abhängen. Aktualisiert werden nur die
+    Bereiche, die sich geändert haben, höchstens max_fps-mal pro Sekunde. Noten, die noch
+    geladen werden (notes_io.NoteStream), kommen beim nächsten Frame hinzu.
+    """
+
+    visible_duration = 5.0  # 5 Sekunden sichtbar
+    piano_roll_height = 150
+    header_height = 110
+    recent_count = 5
+    max_text_cache = 512
+
+    def __init__(self, screen, notes, total_time, font, small_font,
+                 background_color, text_color, accent_color, max_fps=60):
+        self.screen = screen
+        self.total_time = total_time
+        self.font = font
+        self.small_font = small_font
+        self.background_color = background_color
+        self.text_color = text_color
+        self.accent_color = accent_color
+        self.min_frame_interval = 1.0 / max_fps
+
+        self.width, self.height = screen.get_size()
+        self.piano_roll_top = self.height - self.piano_roll_height
+        self.header_rect = pygame.Rect(0, 0, self.width, self.header_height)
+        self.recent_rect = pygame.Rect(0, self.header_height, self.width, self.piano_roll_top - self.header_height)
+        self.roll_rect = pygame.Rect(0, self.piano_roll_top, self.width, self.piano_roll_height)
+
+        self.set_notes(notes)
+
+        # Farbe pro Tonklasse (HSV zu RGB für interessantere Farben)
+        self.pitch_colors = []
+        for pitch_class in range(12):
+            r, g, b = colorsys.hsv_to_rgb(pitch_class / 12, 0.8, 0.9)
+            self.pitch_colors.append((int(r * 255), int(g * 255), int(b * 255)))
+
+        self.text_cache = OrderedDict()
+        self.background = self._render_background()
+        self.grid = self._render_grid()
+        self.recent_layer = None
+        self.last_note_index = None
+        self.last_frame = None
+
+    def set_notes(self, notes):
+        """Übernimmt die Noten und baut den Suchindex auf"""
+        self.notes = notes
+        self.resorted = getattr(notes, 'resorted', False)
+        self.times, self.pitches, self.durations = (np.asarray(column) for column in notes.columns())
+        self.total_time = max(self.total_time, notes.total_time)
+
+        # Index für die Suche sichtbarer Noten: Startzeiten und laufendes Maximum der Notenenden
+        self.ends = self.times + self.durations
+        self.max_end = np.maximum.accumulate(self.ends) if len(self.times) else self.ends
+
+    def _render_background(self):
+        background = pygame.Surface((self.width, self.height))
+        background.fill(self.background_color)
+        return background
+
+    def _render_grid(self):
+        """Horizontale Linien für einige MIDI-Noten mit Beschriftung (transparent)"""
+        grid = pygame.Surface((self.width, self.piano_roll_height), pygame.SRCALPHA)
+        line_color = (100, 100, 120)
         for midi_note in range(50, 105, 5):
-            y_pos = piano_roll_top + piano_roll_height - int((midi_note - 50) / 55 * piano_roll_height)
-            line_color = (100, 100, 120)
-            pygame.draw.line(self.screen, line_color, (0, y_pos), (self.width, y_pos), 1)
-            note_label = self.small_font.render(str(midi_note), True, (180, 180, 200))
-            self.screen.blit(note_label, (5, y_pos - 8))
-
-        # Noten zeichnen
-        visible_duration = 5.0  # 5 Sekunden sichtbar
-        start_time = max(0, current_time - visible_duration / 2)
-        end_time = start_time + visible_duration
-
-        for note in self.notes:
-            # Nur Noten im sichtbaren Bereich zeichnen
-            if note['time'] + note['duration'] < start_time or note['time'] > end_time:
+            y_pos = self.piano_roll_height - int((midi_note - 50) / 55 * self.piano_roll_height)
+            pygame.draw.line(grid, line_color, (0, y_pos), (self.width, y_pos), 1)
+            grid.blit(self.small_font.render(str(midi_note), True, (180, 180, 200)), (5, y_pos - 8))
+        return grid
+
+    def _text(self, font, text, color=None):
+        """Gecachte Textfläche"""
+        key = (id(font), text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            surface = font.render(text, True, color or self.text_color)
+            self.text_cache[key] = surface
+            if len(self.text_cache) > self.max_text_cache:
+                self.text_cache.popitem(last=False)
+        else:
+            self.text_cache.move_to_end(key)
+        return surface
+
+    def _render_recent(self, current_note_index):
+        """Liste der zuletzt gespielten Noten (ragt wie bisher in die Piano-Roll hinein)"""
+        layer = pygame.Surface((self.width, self.height - self.header_height), pygame.SRCALPHA)
+        if current_note_index > 0:
+            layer.blit(self._text(self.font, "Zuletzt gespielte Noten:"), (20, 120 - self.header_height))
+            start_idx = max(0, current_note_index - self.recent_count)
+            for i, index in enumerate(range(current_note_index - 1, start_idx - 1, -1)):
+                pitch, duration = int(self.pitches[index]), float(self.durations[index])
+                freq = 440 * 2 ** ((pitch - 69) / 12)
+                text = f"MIDI: {pitch}, Freq: {freq:.2f}Hz, Dauer: {duration}s"
+                layer.blit(self._text(self.small_font, text), (40, 150 - self.header_height + i * 25))
+        return layer
+
+    def visible_range(self, start_time, end_time):
+        """Indexbereich der Noten, die im Zeitfenster liegen könnten"""
+        first = int(np.searchsorted(self.max_end, start_time, side='left'))
+        last = int(np.searchsorted(self.times, end_time, side='right'))
+        return first, last
+
+    def draw(self, current_time, current_note_index, force=False):
+        now = time.perf_counter()
+        if not force and self.last_frame is not None and now - self.last_frame < self.min_frame_interval:
+            return
+        full_redraw = self.last_frame is None
+        self.last_frame = now
+
+        # Nachgeladene Noten übernehmen
+        if len(self.notes) != len(self.times) or getattr(self.notes, 'resorted', False) != self.resorted:
+            self.set_notes(self.notes)
+        dirty = []
+
+        # Fortschrittsbalken, Zeit und Notenzähler
+        self.screen.blit(self.background, self.header_rect, self.header_rect)
+        progress_width = int((current_time / self.total_time) * self.width) if self.total_time > 0 else 0
+        pygame.draw.rect(self.screen, self.accent_color, (0, 30, progress_width, 10))
+        self.screen.blit(self._text(self.font, f"Zeit: {current_time:.1f}s / {self.total_time:.1f}s"), (20, 50))
+        self.screen.blit(self._text(self.font, f"Note: {current_note_index}/{len(self.times)}"), (20, 80))
+        dirty.append(self.header_rect)
+
+        # Liste der zuletzt gespielten Noten nur bei neuen Noten neu aufbauen
+        if current_note_index != self.last_note_index:
+            self.recent_layer = self._render_recent(current_note_index)
+            self.last_note_index = current_note_index
+            self.screen.blit(self.background, self.recent_rect, self.recent_rect)
+            self.screen.blit(self.recent_layer, self.recent_rect, pygame.Rect(0, 0, self.width, self.recent_rect.height))
+            dirty.append(self.recent_rect)
+
+        # Piano-Roll: Hintergrund, überstehende Notenliste, Raster, sichtbare Noten
+        self.screen.blit(self.background, self.roll_rect, self.roll_rect)
+        self.screen.blit(self.recent_layer, self.roll_rect,
+                         pygame.Rect(0, self.recent_rect.height, self.width, self.piano_roll_height))
+        self.screen.blit(self.grid, self.roll_rect)
+
+        start_time = max(0, current_time - self.visible_duration / 2)
+        end_time = start_time + self.visible_duration
+        first, last = self.visible_range(start_time, end_time)
+        for index in range(first, last):
+            if self.ends[index] < start_time:
                 continue
-
-            # Position berechnen
-            x_start = int((note['time'] - start_time) / visible_duration * self.width)
-            x_width = int(note['duration'] / visible_duration * self.width)
-            y_pos = piano_roll_top + piano_roll_height - int((note['pitch'] - 50) / 55 * piano_roll_height)
-
-            # Farbe basierend auf der Tonhöhe
-            hue = (note['pitch'] % 12) / 12
-            # HSV zu RGB konvertieren für interessantere Farben
-            import colorsys
-            r, g, b = colorsys.hsv_to_rgb(hue, 0.8, 0.9)
-            note_color = (int(r * 255), int(g * 255), int(b * 255))
-
-            # Note zeichnen
-            pygame.draw.rect(self.screen, note_color, (x_start, y_pos - 5, max(x_width, 3), 10))
+            pitch = int(self.pitches[index])
+            x_start = int((self.times[index] - start_time) / self.visible_duration * self.width)
+            x_width = int(float(self.durations[index]) / self.visible_duration * self.width)
+            y_pos = self.height - int((pitch - 50) / 55 * self.piano_roll_height)
+            pygame.draw.rect(self.screen, self.pitch_colors[pitch % 12], (x_start, y_pos - 5, max(x_width, 3), 10))
 
         # Aktuelle Zeitposition anzeigen
-        time_marker_x = int(visible_duration / 2 / visible_duration * self.width)
-        pygame.draw.line(self.screen, (255, 0, 0), (time_marker_x, piano_roll_top),
+        time_marker_x = self.width // 2
+        pygame.draw.line(self.screen, (255, 0, 0), (time_marker_x, self.piano_roll_top),
                          (time_marker_x, self.height), 2)
+        dirty.append(self.roll_rect)
 
-        pygame.display.flip()
+        if full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        json_file = sys.argv[1]
-    else:
-        json_file = "paste.txt"  # Standard-Dateiname
+    parser = argparse.ArgumentParser(description="Spielt eine Notendatei mit Piano-Roll-Anzeige ab")
+    parser.add_argument("json_file", nargs="?", default="paste.txt", help="Notendatei (JSON oder .bin)")
+    parser.add_argument("--polling", action="store_true",
+                        help="Alter Modus: Noten einzeln nach der Systemuhr starten")
+    parser.add_argument("--lookahead", type=float, default=note_scheduler.LOOKAHEAD,
+                        help="Vorlauf in Sekunden, mit dem Noten an den Mixer übergeben werden")
+    parser.add_argument("--prerender", action="store_true",
+                        help="Den ganzen Song vorab rendern und als einen Puffer abspielen")
+    parser.add_argument("--export", metavar="WAV", help="Nur als WAV-Datei exportieren, nicht abspielen")
+    args = parser.parse_args()
 
     try:
-        player = NotePlayer(json_file)
-        player.play()
+        if args.export:
+            synth.export_wav(args.json_file, args.export)
+        else:
+            player = NotePlayer(args.json_file)
+            if args.prerender:
+                player.play_prerendered()
+            elif args.polling:
+                player.play_polling()
+            else:
+                player.play(args.lookahead)
     except Exception as e:
         print(f"Fehler: {e}")
         pygame.quit()
@@ -1,17 +1,24 @@
 import json
 import os
+import sqlite3
 import sys
-import tkinter as tk
-from tkinter import filedialog, messagebox
 import threading
-import subprocess
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+import notes_io
+import song_library
+from player_service import PlayerService
+
+LIBRARY_ROWS = song_library.SEARCH_LIMIT  # Höchstens so viele Treffer in der Liste
+SCAN_POLL_MS = 200  # Takt der Fortschrittsanzeige beim Einlesen eines Ordners
 
 
 class NotePlayerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Noten-Player")
-        self.root.geometry("600x400")
+        self.root.geometry("700x650")
         self.root.configure(bg="#2C2E3B")
 
         # Styling
@@ -20,8 +27,19 @@ class NotePlayerGUI:
         self.accent_color = "#FF5D8F"
         self.secondary_bg = "#3D3F4F"
 
+        # Song-Bibliothek: Liste und Suche kommen aus dem Index, nicht aus den Notendateien
+        self.library = song_library.SongLibrary()
+        self.search_var = tk.StringVar(root)
+        self.scan_thread = None
+        self.scan_progress = (0, 0)
+        self.scan_result = None
+
         # Erstelle UI
         self.setup_ui()
+        self.search_var.trace_add("write", self.refresh_library)
+        self.refresh_library()
+        # Neu analysierte Songs (sniffer läuft getrennt) erscheinen, sobald das Fenster wieder aktiv wird
+        self.root.bind("<FocusIn>", lambda event: self.refresh_library() if event.widget is self.root else None)
 
         # Drag & Drop-Unterstützung
         self.root.drop_target_register("DND_Files")
@@ -29,10 +47,14 @@ class NotePlayerGUI:
 
         # Player-Variablen
         self.current_file = None
-        self.player_thread = None
         self.is_playing = False
         self.player_mode = "spitter"  # Default: visueller Player
 
+        # Player-Prozess sofort starten, damit er beim ersten Abspielen schon bereit ist
+        self.player_service = PlayerService()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(50, self.poll_player)
+
     def setup_ui(self):
         # Header
         header_frame = tk.Frame(self.root, bg=self.secondary_bg, pady=15)
@@ -68,24 +90,89 @@ class NotePlayerGUI:
                                    selectcolor=self.secondary_bg, command=self.update_mode)
         simple_rb.pack(side=tk.LEFT, padx=5)
 
+        # Ganzen Song vorab rendern statt jede Note einzeln zu erzeugen
+        self.prerender_var = tk.BooleanVar(value=False)
+        prerender_check = tk.Checkbutton(main_frame, text="Vorab rendern (ein Puffer für den ganzen Song)",
+                                         variable=self.prerender_var, font=("Segoe UI", 10),
+                                         fg=self.text_color, bg=self.bg_color, selectcolor=self.secondary_bg,
+                                         activebackground=self.bg_color)
+        prerender_check.pack(pady=(0, 10))
+
+        # Song-Bibliothek mit Suche
+        library_frame = tk.Frame(main_frame, bg=self.bg_color)
+        library_frame.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        search_frame = tk.Frame(library_frame, bg=self.bg_color)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+
+        search_label = tk.Label(search_frame, text="Bibliothek durchsuchen:",
+                                font=("Segoe UI", 10), fg=self.text_color, bg=self.bg_color)
+        search_label.pack(side=tk.LEFT)
+
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var, width=30)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind("<Return>", lambda event: self.open_song())
+        search_entry.bind("<Down>", lambda event: self.focus_song_list())
+
+        self.scan_btn = tk.Button(search_frame, text="Ordner einlesen",
+                                  font=("Segoe UI", 10), bg=self.secondary_bg, fg=self.text_color,
+                                  activebackground=self.accent_color, border=0, padx=10,
+                                  command=self.scan_folder)
+        self.scan_btn.pack(side=tk.RIGHT)
+
+        self.library_label = tk.Label(search_frame, text="", font=("Segoe UI", 9),
+                                      fg=self.text_color, bg=self.bg_color)
+        self.library_label.pack(side=tk.RIGHT, padx=10)
+
+        list_frame = tk.Frame(library_frame, bg=self.bg_color)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        style = ttk.Style(self.root)
+        style.configure("Songs.Treeview", background=self.secondary_bg, fieldbackground=self.secondary_bg,
+                        foreground=self.text_color, borderwidth=0)
+        style.map("Songs.Treeview", background=[("selected", self.accent_color)])
+
+        self.song_list = ttk.Treeview(list_frame, columns=("duration", "notes", "range"), height=10,
+                                      style="Songs.Treeview")
+        self.song_list.heading("#0", text="Titel", anchor=tk.W)
+        self.song_list.heading("duration", text="Dauer", anchor=tk.E)
+        self.song_list.heading("notes", text="Noten", anchor=tk.E)
+        self.song_list.heading("range", text="Tonumfang", anchor=tk.W)
+        self.song_list.column("#0", width=330)
+        self.song_list.column("duration", width=70, anchor=tk.E)
+        self.song_list.column("notes", width=70, anchor=tk.E)
+        self.song_list.column("range", width=110)
+        self.song_list.bind("<Double-1>", lambda event: self.open_song())
+        self.song_list.bind("<Return>", lambda event: self.open_song())
+
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.song_list.yview)
+        self.song_list.configure(yscrollcommand=scrollbar.set)
+        self.song_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
         # Drag & Drop-Bereich
-        self.drop_frame = tk.Frame(main_frame, bg=self.secondary_bg, padx=20, pady=30)
-        self.drop_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.drop_frame = tk.Frame(main_frame, bg=self.secondary_bg, padx=20, pady=10)
+        self.drop_frame.pack(fill=tk.X, padx=10, pady=10)
 
         self.drop_label = tk.Label(self.drop_frame,
                                    text="Ziehe eine JSON-Notendatei hierher oder klicke zum Auswählen",
                                    font=("Segoe UI", 12), fg=self.text_color, bg=self.secondary_bg,
                                    wraplength=500)
-        self.drop_label.pack(pady=20)
+        self.drop_label.pack(pady=(5, 0))
 
         button_frame = tk.Frame(self.drop_frame, bg=self.secondary_bg)
-        button_frame.pack(pady=10)
+        button_frame.pack(pady=5)
 
         self.browse_btn = tk.Button(button_frame, text="Datei auswählen",
                                     font=("Segoe UI", 10), bg=self.accent_color, fg=self.text_color,
                                     border=0, padx=15, pady=8, command=self.browse_file)
         self.browse_btn.pack(side=tk.LEFT, padx=5)
 
+        self.stop_btn = tk.Button(button_frame, text="Stopp",
+                                  font=("Segoe UI", 10), bg=self.bg_color, fg=self.text_color,
+                                  border=0, padx=15, pady=8, command=self.stop_notes)
+        self.stop_btn.pack(side=tk.LEFT, padx=5)
+
         # Status-Bereich
         self.status_frame = tk.Frame(main_frame, bg=self.bg_color, pady=10)
         self.status_frame.pack(fill=tk.X, side=tk.BOTTOM)
@@ -98,10 +185,87 @@ class NotePlayerGUI:
         footer_frame = tk.Frame(self.root, bg=self.secondary_bg, pady=10)
         footer_frame.pack(fill=tk.X, side=tk.BOTTOM)
 
-        footer_text = tk.Label(footer_frame, text="Unterstütztes Format: JSON mit Noteneinträgen",
+        footer_text = tk.Label(footer_frame, text="Unterstützte Formate: JSON mit Noteneinträgen, binäre Notendatei (.bin)",
                                font=("Segoe UI", 8), fg=self.text_color, bg=self.secondary_bg)
         footer_text.pack()
 
+    def refresh_library(self, *_):
+        """Zeigt die Treffer der Suche; gelesen wird nur der Index, keine Notendatei"""
+        query = self.search_var.get()
+        try:
+            entries = self.library.search(query, LIBRARY_ROWS)
+            total = self.library.count(query) if len(entries) == LIBRARY_ROWS else len(entries)
+        except sqlite3.Error as e:
+            self.library_label.config(text=f"Bibliothek nicht verfügbar: {e}")
+            return
+
+        self.song_list.delete(*self.song_list.get_children())
+        for entry in entries:
+            self.song_list.insert("", tk.END, iid=entry['notes_path'], text=entry['title'],
+                                  values=song_library.format_entry(entry))
+        shown = f"{len(entries)} von {total}" if total > len(entries) else str(total)
+        self.library_label.config(text=f"{shown} Songs")
+
+    def focus_song_list(self):
+        """Pfeil nach unten im Suchfeld springt zum ersten Treffer"""
+        children = self.song_list.get_children()
+        if children:
+            self.song_list.focus_set()
+            self.song_list.focus(children[0])
+            self.song_list.selection_set(children[0])
+
+    def open_song(self):
+        """Spielt den ausgewählten Song (sonst den ersten Treffer) direkt über seinen Pfad im Index ab"""
+        notes_path = self.song_list.focus() or next(iter(self.song_list.get_children()), None)
+        if not notes_path:
+            return
+        if not os.path.exists(notes_path):
+            messagebox.showerror("Fehler", f"Notendatei nicht mehr vorhanden, der Eintrag wird entfernt:\n{notes_path}")
+            self.library.remove(notes_path)
+            self.refresh_library()
+            return
+        self.process_file(notes_path)
+
+    def scan_folder(self):
+        """Nimmt vorhandene Notendateien eines Ordners im Hintergrund in die Bibliothek auf"""
+        folder = filedialog.askdirectory()
+        if not folder or self.scan_thread is not None:
+            return
+
+        def report(done, total):
+            self.scan_progress = (done, total)
+
+        def scan():
+            try:
+                # Einträge gelöschter Notendateien werden dabei gleich mit entfernt
+                self.scan_result = self.library.scan(folder, progress=report) + (self.library.prune(),)
+            except (sqlite3.Error, OSError) as e:
+                self.scan_result = e
+
+        self.scan_progress = (0, 0)
+        self.scan_result = None
+        self.scan_btn.config(state=tk.DISABLED)
+        self.scan_thread = threading.Thread(target=scan, daemon=True)
+        self.scan_thread.start()
+        self.root.after(SCAN_POLL_MS, self.poll_scan)
+
+    def poll_scan(self):
+        if self.scan_thread.is_alive():
+            done, total = self.scan_progress
+            self.status_label.config(text=f"Lese Notendateien ein: {done}/{total}")
+            self.root.after(SCAN_POLL_MS, self.poll_scan)
+            return
+
+        self.scan_thread = None
+        self.scan_btn.config(state=tk.NORMAL)
+        if isinstance(self.scan_result, Exception):
+            messagebox.showerror("Fehler", f"Fehler beim Einlesen: {self.scan_result}")
+        else:
+            added, unchanged, failed, removed = self.scan_result
+            self.status_label.config(text=f"{added} Songs aufgenommen, {unchanged} unverändert, "
+                                          f"{failed} fehlerhaft, {removed} entfernt")
+        self.refresh_library()
+
     def update_mode(self):
         self.player_mode = self.mode_var.get()
         self.status_label.config(text=f"Modus gewechselt zu: {self.player_mode}")
@@ -121,7 +285,7 @@ class NotePlayerGUI:
 
     def browse_file(self):
         file_types = [
-            ('JSON-Dateien', '*.json;*.txt'),
+            ('Notendateien', '*.json;*.txt;*.bin'),
             ('Alle Dateien', '*.*')
         ]
 
@@ -134,15 +298,17 @@ class NotePlayerGUI:
             messagebox.showerror("Fehler", f"Datei nicht gefunden: {file_path}")
             return
 
-        # Prüfe, ob es sich um eine JSON-Datei handelt
+        # Die ganze Notendatei prüfen (inkrementell, ohne Objektbaum), damit auch Fehler am Dateiende hier
+        # gemeldet werden; die Noten selbst liest der Player-Prozess, der nach dem ersten Block beginnt
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                if 'notes' not in data:
-                    messagebox.showerror("Fehler", "Die Datei enthält kein gültiges Notenformat (kein 'notes'-Feld)")
-                    return
-        except json.JSONDecodeError:
-            messagebox.showerror("Fehler", "Die Datei enthält kein gültiges JSON-Format")
+            if not notes_io.is_binary(file_path):
+                notes_io.validate_json(file_path)
+        except json.JSONDecodeError as e:
+            messagebox.showerror("Fehler", f"Die Datei enthält kein gültiges JSON-Format ({e})")
+            return
+        except (KeyError, TypeError, ValueError):
+            messagebox.showerror("Fehler", "Die Datei enthält kein gültiges Notenformat "
+                                           "('notes' mit time, pitch und duration erwartet)")
             return
         except Exception as e:
             messagebox.showerror("Fehler", f"Fehler beim Lesen der Datei: {str(e)}")
@@ -151,42 +317,45 @@ class NotePlayerGUI:
         self.current_file = file_path
         self.status_label.config(text=f"Datei geladen: {os.path.basename(file_path)}")
 
-        # Starte Player in separatem Thread
-        if self.is_playing:
-            messagebox.showinfo("Info", "Es läuft bereits eine Wiedergabe. Bitte warten.")
-            return
+        # Eine laufende Wiedergabe wird durch die neue Datei ersetzt
+        self.play_notes(file_path)
 
+    def play_notes(self, notes):
         self.is_playing = True
-        self.player_thread = threading.Thread(target=self.play_notes)
-        self.player_thread.daemon = True
-        self.player_thread.start()
-
-    def play_notes(self):
-        try:
-            self.status_label.config(text=f"Spiele {os.path.basename(self.current_file)} mit {self.player_mode}...")
+        self.status_label.config(text=f"Starte {os.path.basename(self.current_file)} mit {self.player_mode}...")
+        self.player_service.play(os.path.basename(self.current_file), notes, self.player_mode,
+                                 self.prerender_var.get())
 
-            # Wähle das richtige Skript basierend auf dem Modus
-            script_name = f"{self.player_mode}.py"
-
-            # Starte den Player als Subprocess
-            process = subprocess.Popen([sys.executable, script_name, self.current_file],
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # Warte auf Beendigung
-            stdout, stderr = process.communicate()
-
-            if process.returncode != 0:
-                error_msg = stderr.decode('utf-8')
-                self.root.after(0, lambda: messagebox.showerror("Fehler", f"Fehler bei der Wiedergabe: {error_msg}"))
-                self.root.after(0, lambda: self.status_label.config(text="Fehler bei der Wiedergabe"))
-            else:
-                self.root.after(0, lambda: self.status_label.config(text="Wiedergabe abgeschlossen"))
-
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Fehler", f"Fehler: {str(e)}"))
-            self.root.after(0, lambda: self.status_label.config(text=f"Fehler: {str(e)}"))
+    def stop_notes(self):
+        if self.is_playing:
+            self.player_service.stop()
+
+    def poll_player(self):
+        """Übernimmt die Meldungen des Player-Prozesses in die Statuszeile"""
+        for kind, content in self.player_service.poll_events():
+            if kind == "started":
+                name, delay = content
+                self.status_label.config(
+                    text=f"Spiele {name} mit {self.player_mode}... (gestartet nach {delay * 1000:.0f} ms)")
+            elif kind == "finished":
+                self.is_playing = False
+                self.status_label.config(text="Wiedergabe abgeschlossen")
+            elif kind == "stopped":
+                self.is_playing = False
+                self.status_label.config(text="Wiedergabe gestoppt")
+            elif kind == "error":
+                self.is_playing = False
+                messagebox.showerror("Fehler", f"Fehler bei der Wiedergabe: {content}")
+                self.status_label.config(text="Fehler bei der Wiedergabe")
+
+        if not self.player_service.alive:
+            self.status_label.config(text="Player-Prozess beendet, bitte die Anwendung neu starten")
+            return
+        self.root.after(50, self.poll_player)
 
-        self.is_playing = False
+    def on_close(self):
+        self.player_service.close()
+        self.root.destroy()
 
 
 def enable_dnd(root):
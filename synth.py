@@ -0,0 +1,173 @@
+"""Klangerzeugung für die Player: Sinustöne, Vorab-Rendering ganzer Songs und WAV-Export.
+
+Beispiel (Export ohne Wiedergabe):
+    python synth.py song_notes.json song_preview.wav
+"""
+import argparse
+import sys
+import time
+import wave
+from collections import OrderedDict
+
+import numpy as np
+
+import notes_io
+
+SAMPLE_RATE = 44100
+VOLUME = 0.5
+FADE_FRACTION = 0.1  # Fade-in und Fade-out jeweils 10% der Notenlänge
+
+# Ton-Cache: Dauern werden auf 10 ms gerundet, Speicherbudget in Bytes
+DURATION_STEP = 0.01
+TONE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def midi_to_freq(midi_note):
+    """MIDI zu Frequenz Umrechnung"""
+    return 440 * 2 ** ((np.asarray(midi_note) - 69) / 12)
+
+
+def fade_envelope(samples):
+    """Hüllkurve mit linearem Fade-in und Fade-out"""
+    envelope = np.ones(samples)
+    fade_len = int(samples * FADE_FRACTION)
+    if fade_len > 0:
+        envelope[:fade_len] = np.linspace(0, 1, fade_len)
+        envelope[-fade_len:] *= np.linspace(1, 0, fade_len)
+    return envelope
+
+
+def sine_tone(frequency, duration, sample_rate=SAMPLE_RATE, volume=VOLUME):
+    """Sinuston mit Fade-in/out als float-Array (wie generate_sine_wave der Player)"""
+    samples = int(duration * sample_rate)
+    t = np.linspace(0, duration, samples, False)
+    return np.sin(2 * np.pi * frequency * t) * fade_envelope(samples) * volume
+
+
+def render_notes(notes, sample_rate=SAMPLE_RATE, volume=VOLUME, normalize=True):
+    """Rendert alle Noten in einen gemeinsamen Mono-Puffer (float32)
+
+    Jede Kombination aus Tonhöhe und Dauer wird nur einmal synthetisiert (Melodien
+    wiederholen wenige Töne sehr oft) und anschließend per Overlap-Add an allen
+    Startpositionen in den Puffer addiert.
+    """
+    times = np.asarray(notes.times, dtype=np.float64)
+    durations = np.asarray(notes.durations, dtype=np.float64)
+    pitches = np.asarray(notes.pitches)
+
+    starts = np.round(times * sample_rate).astype(np.int64)
+    lengths = (durations * sample_rate).astype(np.int64)
+    total = int(np.max(starts + lengths)) if len(notes) else 0
+    buffer = np.zeros(total, dtype=np.float32)
+
+    # Noten nach (Tonhöhe, Dauer) gruppieren
+    keys = np.stack((pitches.astype(np.float64), durations), axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind='stable')
+    bounds = np.searchsorted(inverse.ravel()[order], np.arange(len(unique_keys) + 1))
+
+    for key_index, (pitch, duration) in enumerate(unique_keys):
+        tone = sine_tone(midi_to_freq(pitch), duration, sample_rate, volume).astype(np.float32)
+        if len(tone) == 0:
+            continue
+        for start in starts[order[bounds[key_index]:bounds[key_index + 1]]]:
+            buffer[start:start + len(tone)] += tone
+
+    # Übersteuerung durch überlappende Noten vermeiden
+    peak = float(np.max(np.abs(buffer))) if total else 0.0
+    if normalize and peak > 1.0:
+        buffer /= peak
+    return buffer
+
+
+class ToneCache:
+    """LRU-Cache für synthetisierte Notenpuffer mit Speicherbudget.
+
+    Schlüssel sind Tonhöhe, auf DURATION_STEP gerundete Dauer, Lautstärke und Sample-Rate.
+    Wiederholte Noten kosten so keine erneute Synthese. Die Zähler hits, misses und
+    evictions helfen beim Dimensionieren von max_bytes.
+    """
+
+    def __init__(self, max_bytes=TONE_CACHE_BYTES, sizeof=lambda tone: tone.nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, pitch, duration, volume, sample_rate, create):
+        """Liefert den Ton aus dem Cache; bei einem Fehlzugriff erzeugt create(frequenz, dauer) ihn"""
+        steps = int(round(duration / DURATION_STEP))
+        key = (pitch, steps, volume, sample_rate)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        tone = create(float(midi_to_freq(pitch)), steps * DURATION_STEP)
+        nbytes = self.sizeof(tone)
+        self._entries[key] = (tone, nbytes)
+        self.size += nbytes
+
+        # Am längsten nicht benutzte Töne verdrängen (den neuen Ton immer behalten)
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.size -= evicted_bytes
+            self.evictions += 1
+        return tone
+
+    def stats(self):
+        """Kurzbeschreibung der Trefferquote und Belegung"""
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"Ton-Cache: {self.hits} Treffer, {self.misses} Fehlzugriffe ({rate:.0%} Trefferquote), "
+                f"{len(self._entries)} Töne, {self.size / 1024 / 1024:.1f} MB, {self.evictions} verdrängt")
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+def to_int16(buffer):
+    """Wandelt einen float-Puffer (-1..1) in 16-bit PCM"""
+    return (np.clip(buffer, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def write_wav(path, buffer, sample_rate=SAMPLE_RATE):
+    """Speichert einen Mono-Puffer als 16-bit WAV-Datei"""
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(to_int16(buffer).tobytes())
+
+
+def export_wav(notes_file, wav_file, sample_rate=SAMPLE_RATE, volume=VOLUME):
+    """Rendert eine Notendatei und speichert sie als WAV; liefert die Audiodauer in Sekunden"""
+    buffer = render_notes(notes_io.load_notes(notes_file), sample_rate, volume)
+    write_wav(wav_file, buffer, sample_rate)
+    return len(buffer) / sample_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rendert eine Notendatei schneller als Echtzeit in eine WAV-Datei")
+    parser.add_argument("notes_file", help="Notendatei (JSON oder .bin)")
+    parser.add_argument("wav_file", help="Ziel-WAV-Datei")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE)
+    parser.add_argument("--volume", type=float, default=VOLUME)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    duration = export_wav(args.notes_file, args.wav_file, args.sample_rate, args.volume)
+    elapsed = time.perf_counter() - start
+    speed = duration / elapsed if elapsed > 0 else float('inf')
+    print(f"{args.wav_file}: {duration:.1f}s Audio in {elapsed:.2f}s gerendert ({speed:.0f}x Echtzeit)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
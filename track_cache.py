@@ -0,0 +1,136 @@
+"""Persistenter Cache für Tonhöhenspuren, adressiert über den Inhalt der Audio-Datei."""
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+# Version des Cache-Formats; bei Änderungen an der Tonhöhenverfolgung erhöhen
+CACHE_VERSION = 2
+
+# Standardverzeichnis und maximale Größe des Caches
+DEFAULT_CACHE_DIR = os.environ.get(
+    "KARAOKE_SNIFFER_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "karaoke-sniffer", "tracks"))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+HASH_BLOCK = 1024 * 1024
+
+
+def file_digest(path):
+    """SHA-256 über den Inhalt einer Datei, blockweise gelesen
+
+    Pro Prozess wird jeder Dateistand (Pfad, Größe, Änderungszeit) nur einmal gelesen, damit
+    Tonhöhen-Cache und Song-Bibliothek (song_library) dieselbe Datei nicht zweimal hashen.
+    """
+    stat = os.stat(path)
+    return _cached_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=256)
+def _cached_digest(path, size, mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TrackCache:
+    """Speichert die dominante Tonhöhe und Lautstärke pro Frame als kompakte .npz-Dateien.
+
+    Der Schlüssel besteht aus dem Hash des Audio-Inhalts und den Parametern, die die STFT
+    beeinflussen. Segmentierungsparameter gehören nicht dazu, damit eine erneute Analyse
+    mit anderen Schwellwerten direkt aus dem Cache bedient wird. Überschreitet der Cache
+    max_bytes, werden die am längsten nicht benutzten Einträge gelöscht (LRU).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, audio_path, **params):
+        """Cache-Schlüssel aus Audio-Inhalt und STFT-Parametern"""
+        param_text = ",".join(f"{name}={params[name]}" for name in sorted(params))
+        digest = hashlib.sha256(f"v{CACHE_VERSION}|{file_digest(audio_path)}|{param_text}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key):
+        """Liefert (freqs, mags, sr) aus dem Cache oder None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                track = data['freqs'], data['mags'], int(data['sr'])
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+
+        # Zugriffszeit für die LRU-Verdrängung aktualisieren
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return track
+
+    def put(self, key, freqs, mags, sr):
+        """Legt eine Tonhöhenspur im Cache ab und verdrängt bei Bedarf alte Einträge"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Erst in eine temporäre Datei schreiben, damit parallele Prozesse nie halbe Dateien lesen
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, freqs=np.asarray(freqs, dtype=np.float32),
+                         mags=np.asarray(mags, dtype=np.float32), sr=np.int64(sr))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Löscht die ältesten Einträge, bis der Cache unter max_bytes liegt"""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Entfernt alle Einträge des Caches"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass